@@ -0,0 +1,170 @@
+"""
+Быстрые JSON-ответы API Toyota Dashboard
+
+- FastJSONResponse: класс ответа по умолчанию, сериализация через orjson
+  (если установлен) с тем же форматом дат, что и datetime.isoformat();
+- json_response: готовый ответ со слабым ETag и 304 на If-None-Match
+  для данных, которые клиенты запрашивают повторно без изменений;
+- CompressionMiddleware: сжатие brotli/gzip ответов больше порога.
+  Потоковые ответы (SSE, выгрузки) и уже сжатые (статика из assets.py)
+  проходят без изменений.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional
+
+import anyio
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Данные API личные: кэшировать можно только в браузере и с проверкой ETag
+API_CACHE_CONTROL = "private, no-cache"
+# Меньшие ответы сжимать невыгодно: заголовки и так крупнее выигрыша
+MIN_COMPRESS_SIZE = 1024
+# Большие ответы сжимаются в потоке, чтобы не задерживать event loop
+THREAD_COMPRESS_SIZE = 128 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain", "text/csv",
+                      "application/javascript", "text/javascript", "image/svg+xml")
+# Динамические ответы: быстрые уровни сжатия, а не максимальные
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def _default(value: Any) -> Any:
+    """Типы, которые не умеет сериализовать orjson/json."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+def dumps(data: Any) -> bytes:
+    """JSON в байтах; даты - как datetime.isoformat()."""
+    if orjson is not None:
+        # orjson пишет datetime в RFC 3339, совпадающем с isoformat()
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, default=_default, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse с сериализацией через orjson."""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def json_response(request: Request, data: Any, status_code: int = 200) -> Response:
+    """JSON-ответ со слабым ETag; 304 без тела, если у клиента та же версия.
+    
+    ETag слабый: тело может прийти сжатым CompressionMiddleware, а
+    содержимое в любом кодировании одно и то же.
+    """
+    body = data if isinstance(data, bytes) else dumps(data)
+    etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": API_CACHE_CONTROL}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # Слабое сравнение: префикс W/ не учитывается
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in candidates or etag.removeprefix("W/") in candidates:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+def _select_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """Сжатие brotli/gzip обычных (не потоковых) ответов больше min_size байт."""
+    
+    def __init__(self, app: ASGIApp, min_size: int = MIN_COMPRESS_SIZE):
+        self.app = app
+        self.min_size = min_size
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start: Optional[Message] = None
+        passthrough = False
+        
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                passthrough = ("content-encoding" in headers or message["status"] in (204, 206, 304)
+                               or not media_type.startswith(COMPRESSIBLE_TYPES))
+                if passthrough:
+                    await send(message)
+                else:
+                    # Заголовки отправляются вместе с первой частью тела
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            if start is None:
+                # Продолжение потокового ответа: уже отправлено как есть
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.min_size:
+                # Потоковый ответ (SSE, выгрузка) или маленькое тело - без сжатия
+                await send(start)
+                start = None
+                await send(message)
+                return
+            
+            if len(body) >= THREAD_COMPRESS_SIZE:
+                compressed = await anyio.to_thread.run_sync(_compress, body, encoding)
+            else:
+                compressed = _compress(body, encoding)
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if len(compressed) < len(body):
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(compressed))
+                message = {**message, "body": compressed}
+            await send(start)
+            start = None
+            await send(message)
+        
+        await self.app(scope, receive, send_compressed)
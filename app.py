@@ -5,21 +5,17 @@ Toyota Dashboard Server
 """
 
 import asyncio
-import json
 import logging
 import os
 import shutil
 import sys
-import threading
-import time
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import yaml
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 from contextlib import asynccontextmanager
@@ -53,13 +49,33 @@ if not os.access('.', os.W_OK):
     
     atexit.register(cleanup_temp_dir)
 
-from pytoyoda import MyT
+# Клиент pytoyoda (httpx, hishel, модели endpoint'ов) импортируется в
+# init_toyota_client: без учетных данных он не нужен вовсе
 from pytoyoda.models.endpoints.command import CommandType
 from database import DatabaseManager
-from models import VehicleStatus, TripData, StatsPeriod
+from backup import BackupManager
+from maintenance import MaintenanceEngine
+from command_confirmation import CONFIRM_CONFIRMED, CommandConfirmer
+from command_queue import CommandJob, CommandQueue
+from scheduler import CronTrigger, DelayTrigger, IntervalTrigger, scheduler
+from vehicle_state import status_snapshot, vehicle_state
+from rate_limit import SharedTokenBucket
+from leader import leader
+from shared_state import shared_state
+from assets import AssetPipeline
+from api_responses import CompressionMiddleware, FastJSONResponse, json_response
+from events import Event, KEEPALIVE_SECONDS, SSE_RETRY_MS, event_hub, event_json, format_sse
+from retention import ROLLUP_METRICS
+from timeseries import load_series
+from export import EXPORT_TABLES, MEDIA_TYPES, TableExporter, available_formats
+from models import (VehicleStatus, TripData, StatsPeriod, RetentionConfig, StorageConfig, BackupConfig,
+                    MaintenanceConfig, CommandQueueConfig, SchedulerConfig, MonitoringConfig, ServerConfig)
 from paths import paths
 from location_service import location_service
 
+if TYPE_CHECKING:
+    from pytoyoda import MyT
+
 # Настройка кэш-директории для предотвращения ошибок read-only filesystem
 try:
     # Устанавливаем переменные окружения для кэша ПЕРЕД импортом pytoyoda
@@ -73,8 +89,6 @@ try:
     
     # Создаем кэш-директорию если она не существует
     os.makedirs(paths.cache_dir, exist_ok=True)
-    
-    print(f"Кэш-директория настроена: {paths.cache_dir}")
 except (OSError, PermissionError) as e:
     print(f"Предупреждение: Не удалось настроить кэш-директорию: {e}")
     # Fallback - используем временную директорию
@@ -96,21 +110,18 @@ DATA_DIR = paths.data_dir
 def load_config() -> Dict:
     """Загрузить конфигурацию из файла."""
     try:
-        # Выводим диагностическую информацию о путях
-        print("=== Диагностика путей конфигурации ===")
-        print(f"Информация о путях: {paths.get_info()}")
-        
         config_path = paths.config_file
-        print(f"Основной путь к конфигурации: {config_path}")
-        
-        # Проверяем доступность директории для записи
-        config_dir = os.path.dirname(config_path)
-        print(f"Директория конфигурации: {config_dir}")
-        print(f"Директория существует: {os.path.exists(config_dir)}")
-        if os.path.exists(config_dir):
-            print(f"Права на запись в директорию: {os.access(config_dir, os.W_OK)}")
         
         if not os.path.exists(config_path):
+            # Диагностика путей нужна только если конфигурация не нашлась:
+            # при обычном запуске она лишь замедляет старт и засоряет журнал
+            print("=== Диагностика путей конфигурации ===")
+            print(f"Информация о путях: {paths.get_info()}")
+            config_dir = os.path.dirname(config_path)
+            print(f"Директория конфигурации: {config_dir}")
+            print(f"Директория существует: {os.path.exists(config_dir)}")
+            if os.path.exists(config_dir):
+                print(f"Права на запись в директорию: {os.access(config_dir, os.W_OK)}")
             print(f"Файл конфигурации не найден: {config_path}")
             # Попробуем найти конфигурацию в других местах
             alternative_paths = [
@@ -139,7 +150,6 @@ def load_config() -> Dict:
                 print("Создаем базовую конфигурацию...")
                 return create_default_config()
         
-        print(f"Попытка чтения конфигурации из: {config_path}")
         with open(config_path, 'r', encoding='utf-8') as f:
             config_data = yaml.safe_load(f)
             print(f"✅ Конфигурация успешно загружена из: {config_path}")
@@ -241,15 +251,31 @@ async def lifespan(app: FastAPI):
         # Убеждаемся, что все директории созданы
         paths.ensure_directories()
         
+        # Загрузить и сжать страницы и статические файлы
+        assets.load()
+        
         # Инициализировать базу данных
         await db.init_database()
         
+        # Последние статусы в память: чтение без обращения к базе
+        vehicle_state.resize(monitoring_config.snapshot_buffer_size)
+        await vehicle_state.warm(db)
+        
+        # Снимок статуса, возможности автомобиля и лимит обращений к Toyota API
+        # общие для всех воркеров uvicorn
+        api_limiter.db = db
+        await shared_state.start(db)
+        # Очередь команд и push-события тоже общие: через таблицы command_jobs и events
+        await command_queue.start(db)
+        await event_hub.start(db)
+        
         # Инициализировать Toyota клиент
         await init_toyota_client()
         
-        # Запустить фоновый сбор данных
-        if config['monitoring']['auto_refresh'] and toyota_client:
-            asyncio.create_task(collect_vehicle_data())
+        # Фоновые задачи по расписанию выполняет один процесс из воркеров
+        leader.path = f"{db.db_path}.leader"
+        leader.on_elected = start_background_jobs
+        await leader.start()
     except Exception as e:
         logger.error(f"Ошибка при запуске Toyota Dashboard Server: {e}")
         raise
@@ -258,17 +284,96 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     try:
+        await scheduler.stop()
+        await command_queue.stop()
+        await leader.stop()
+        await shared_state.stop()
+        await event_hub.stop()
+        api_limiter.db = None
         await db.close()
     except Exception as e:
         logger.error(f"Ошибка при остановке Toyota Dashboard Server: {e}")
 
 # Используем путь к базе данных из менеджера путей
 db_path = paths.database_path
-db = DatabaseManager(db_path)
-toyota_client: Optional[MyT] = None
+db = DatabaseManager(
+    db_path,
+    retention=RetentionConfig(**(config.get('retention') or {})),
+    storage=StorageConfig(**(config.get('storage') or {}))
+)
+backup_manager = BackupManager(db_path, BackupConfig(**(config.get('backup') or {})))
+maintenance = MaintenanceEngine(db, MaintenanceConfig(**(config.get('maintenance') or {})))
+command_queue = CommandQueue(CommandQueueConfig(**(config.get('commands') or {})))
+scheduler_config = SchedulerConfig(**(config.get('scheduler') or {}))
+server_config = ServerConfig(**(config.get('server') or {}))
+toyota_client: Optional["MyT"] = None
+monitoring_config = MonitoringConfig(**(config.get('monitoring') or {}))
+# Обновления статуса по запросу клиентов (fresh=1 и устаревший снимок)
+api_limiter = SharedTokenBucket.shared_per_hour("toyota_api", monitoring_config.max_api_calls_per_hour)
+status_max_age = monitoring_config.status_max_age
+# Возможности автомобиля не меняются: запоминаются при первом получении автомобиля
+vehicle_capabilities: Dict[str, bool] = {}
+shared_state.poll_interval = server_config.state_sync_interval
+event_hub.poll_interval = server_config.state_sync_interval
+
+def store_status(data: Dict, updated_at: float):
+    """Статус, полученный этим воркером: остальным через shared_state, вкладкам - push-событие."""
+    shared_state.publish("status", data, updated_at)
+    # Событие публикует только получивший статус воркер, остальные доставят его из таблицы events
+    event_hub.publish("status", data)
+
+# Данные, полученные одним воркером, остальные применяют из shared_state
+status_snapshot.on_store = store_status
+shared_state.watch("status", status_snapshot.apply)
+shared_state.watch("vehicle_state", lambda data, _: vehicle_state.push(VehicleStatus(**data)))
+shared_state.watch("capabilities", lambda data, _: vehicle_capabilities.update(data))
+db.on_notification = lambda notification: event_hub.publish("notification", notification)
+
+def command_response_data(job: CommandJob) -> Dict:
+    """response_data записи команды в таблице commands."""
+    return {"job_id": job.id, "params": job.params, "result": job.result, "confirmation": job.confirmation}
+
+async def record_command_job(job: CommandJob):
+    """Результат команды из очереди: запись в таблицу commands и push-событие."""
+    job.record_id = await db.save_command(
+        job.command, job.status,
+        response_data=command_response_data(job),
+        error_message=job.error
+    )
+    event_hub.publish("command", {
+        "command": job.command, "success": job.success, "message": job.message,
+        "job_id": job.id, "status": job.status, "confirmation": job.confirmation,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    })
+
+async def record_command_confirmation(job: CommandJob):
+    """Итог подтверждения: ответ команды в базе, снимок статуса и push-событие."""
+    confirmation = job.confirmation
+    if job.record_id:
+        await db.update_command_response(job.record_id, command_response_data(job))
+    
+    confirmed = confirmation["state"] == CONFIRM_CONFIRMED
+    if confirmed and status_snapshot.data is not None:
+        # Подтвержденное состояние сразу видно во вкладках - без полного update()
+        observed = {key: value for key, value in (confirmation["observed"] or {}).items()
+                    if key in status_snapshot.data and value is not None}
+        if observed:
+            status_snapshot.set({**status_snapshot.data, **observed}, updated_at=status_snapshot.updated_at)
+    
+    event_hub.publish("command_confirmation", {
+        "command": job.command, "job_id": job.id, "confirmed": confirmed,
+        "confirmation": confirmation,
+        "message": f"Автомобиль подтвердил команду {job.command}" if confirmed
+                   else f"Автомобиль не подтвердил команду {job.command} за {confirmation['elapsed']} с",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    })
+
+command_queue.on_finished = record_command_job
+command_queue.on_confirmed = record_command_confirmation
 vehicle_vin = config.get('toyota', {}).get('vin', '').strip()
 
-app = FastAPI(title="Toyota Dashboard", version="1.0.0", lifespan=lifespan)
+app = FastAPI(title="Toyota Dashboard", version="1.0.0", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
 
 # Настройка CORS для доступа с iPhone
 app.add_middleware(
@@ -279,8 +384,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Подключение статических файлов
-app.mount("/static", StaticFiles(directory=f"{APP_DIR}/static"), name="static")
+# Сжатие ответов API больше порога (статика уже сжата заранее, SSE - поток)
+app.add_middleware(CompressionMiddleware, min_size=server_config.compress_min_size)
+
+# Страницы и статические файлы отдаются из памяти (сжатые, с ETag)
+# Страницы, доступные без сети: их кэширует service worker
+SHELL_PAGES = {
+    '/': 'index.html',
+    '/stats': 'stats.html',
+    '/control': 'control.html',
+    '/climate': 'climate.html',
+    '/notifications': 'notifications.html',
+    '/settings': 'settings.html',
+}
+assets = AssetPipeline(os.path.join(APP_DIR, 'static'), debug=server_config.debug,
+                       shell_pages=SHELL_PAGES)
+
+@app.get("/static/{name:path}")
+async def static_file(name: str, request: Request):
+    """Статический файл; версия с хэшем в имени кэшируется браузером на год."""
+    return assets.response(request, name)
+
+@app.get("/sw.js")
+async def service_worker(request: Request):
+    """Service worker с корня сайта: его область - все страницы приложения."""
+    # Браузер должен сразу увидеть новую версию после обновления статики
+    return assets.response(request, 'sw.js', cache_control='no-cache')
 
 # Модели данных
 class CommandRequest(BaseModel):
@@ -338,7 +467,8 @@ async def init_toyota_client():
             logger.info("Toyota клиент не инициализирован - учетные данные не настроены")
             toyota_client = None
             return
-            
+        
+        from pytoyoda import MyT
         toyota_client = MyT(
             username=config['toyota']['username'],
             password=config['toyota']['password'],
@@ -366,104 +496,195 @@ async def get_vehicle():
     
     raise HTTPException(status_code=404, detail=f"Автомобиль с VIN {vehicle_vin} не найден")
 
-# Фоновые задачи
+# Результат команд проверяется опросом одного endpoint найденного автомобиля
+command_queue.confirmer = CommandConfirmer(command_queue.config, get_vehicle)
+
+async def submit_command(name: str, action, params: Optional[Dict] = None, wait: float = 0.0):
+    """Поставить команду в очередь автомобиля и ответить 202 с id задачи.
+    
+    wait > 0 - подождать результат (не дольше commands.wait_limit); если
+    команда успела выполниться, ответ как у синхронного вызова: 200 или
+    код ошибки с detail.
+    """
+    if not toyota_client or not vehicle_vin:
+        raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
+    
+    job, duplicate = await command_queue.submit(vehicle_vin, name, action, params)
+    content = job.to_dict()
+    content["duplicate"] = duplicate
+    if await command_queue.wait(job, min(wait, command_queue.config.wait_limit)):
+        content = job.to_dict()
+        content["duplicate"] = duplicate
+        if job.success:
+            return {**job.result, **content}
+        content["detail"] = job.error
+        return JSONResponse(status_code=job.error_code or 500, content=content)
+    
+    content["message"] = "Команда уже выполняется" if duplicate else "Команда принята и будет отправлена автомобилю"
+    return JSONResponse(status_code=202, content=content, headers={"Location": f"/api/commands/{job.id}"})
+
+# Фоновые задачи (выполняются планировщиком, см. register_background_jobs)
 async def collect_vehicle_data():
-    """Фоновая задача для сбора данных автомобиля."""
-    while True:
-        try:
-            if toyota_client and vehicle_vin:
-                # Получить автомобили
-                await toyota_client.login()
-                vehicles = await toyota_client.get_vehicles()
+    """Сбор данных автомобиля: статус в базу и снимок для /api/vehicle/status."""
+    try:
+        if toyota_client and vehicle_vin:
+            # Получить автомобили
+            await toyota_client.login()
+            vehicles = await toyota_client.get_vehicles()
+            
+            # Найти нужный автомобиль по VIN
+            target_vehicle = None
+            for vehicle in vehicles:
+                if vehicle.vin == vehicle_vin:
+                    target_vehicle = vehicle
+                    break
+            
+            if target_vehicle:
+                # Обновить данные автомобиля
+                await target_vehicle.update()
                 
-                # Найти нужный автомобиль по VIN
-                target_vehicle = None
-                for vehicle in vehicles:
-                    if vehicle.vin == vehicle_vin:
-                        target_vehicle = vehicle
-                        break
+                # Сохранить статус автомобиля в базу данных
+                vehicle_data = VehicleStatus(
+                    timestamp=datetime.now(),
+                    battery_level=target_vehicle.electric_status.battery_level if target_vehicle.electric_status else 0,
+                    fuel_level=target_vehicle.dashboard.fuel_level if target_vehicle.dashboard else 0,
+                    range_electric=target_vehicle.electric_status.ev_range if target_vehicle.electric_status else 0,
+                    range_fuel=target_vehicle.dashboard.fuel_range if target_vehicle.dashboard else 0,
+                    latitude=target_vehicle.location.latitude if target_vehicle.location else 0.0,
+                    longitude=target_vehicle.location.longitude if target_vehicle.location else 0.0,
+                    locked=target_vehicle.lock_status.doors.driver_seat.locked if target_vehicle.lock_status and target_vehicle.lock_status.doors and target_vehicle.lock_status.doors.driver_seat else False,
+                    engine_running=False,  # Нужно найти правильное поле
+                    climate_on=False,  # Нужно найти правильное поле
+                    temperature_inside=0.0,  # Нужно найти правильное поле
+                    temperature_outside=0.0  # Нужно найти правильное поле
+                )
                 
-                if target_vehicle:
-                    # Обновить данные автомобиля
-                    await target_vehicle.update()
-                    
-                    # Сохранить статус автомобиля в базу данных
-                    vehicle_data = VehicleStatus(
-                        timestamp=datetime.now(),
-                        battery_level=target_vehicle.electric_status.battery_level if target_vehicle.electric_status else 0,
-                        fuel_level=target_vehicle.dashboard.fuel_level if target_vehicle.dashboard else 0,
-                        range_electric=target_vehicle.electric_status.ev_range if target_vehicle.electric_status else 0,
-                        range_fuel=target_vehicle.dashboard.fuel_range if target_vehicle.dashboard else 0,
-                        latitude=target_vehicle.location.latitude if target_vehicle.location else 0.0,
-                        longitude=target_vehicle.location.longitude if target_vehicle.location else 0.0,
-                        locked=target_vehicle.lock_status.doors.driver_seat.locked if target_vehicle.lock_status and target_vehicle.lock_status.doors and target_vehicle.lock_status.doors.driver_seat else False,
-                        engine_running=False,  # Нужно найти правильное поле
-                        climate_on=False,  # Нужно найти правильное поле
-                        temperature_inside=0.0,  # Нужно найти правильное поле
-                        temperature_outside=0.0  # Нужно найти правильное поле
-                    )
-                    
-                    await db.save_vehicle_status(vehicle_data)
-                    
-                    # Собрать данные о поездках за последние 7 дней
-                    try:
-                        from datetime import date, timedelta
-                        end_date = date.today()
-                        start_date = end_date - timedelta(days=7)
-                        
-                        # Получить поездки из Toyota API
-                        trips = await target_vehicle.get_trips(start_date, end_date)
-                        
-                        if trips:
-                            logger.info(f"Получено {len(trips)} поездок из Toyota API")
-                            
-                            # Сохранить поездки в базу данных
-                            for trip in trips:
-                                if trip.start_time and trip.end_time and trip.distance:
-                                    # Проверить, есть ли уже эта поездка в базе
-                                    existing_trip = await db.get_trip_by_time(trip.start_time)
-                                    if not existing_trip:
-                                        trip_data = {
-                                            'start_time': trip.start_time,
-                                            'end_time': trip.end_time,
-                                            'distance_total': trip.distance or 0,
-                                            'distance_electric': trip.ev_distance or 0,
-                                            'fuel_consumed': trip.fuel_consumed or 0,
-                                            'electricity_consumed': 0,  # Пока не доступно в API
-                                            'start_latitude': trip.locations.start.lat if trip.locations and trip.locations.start else 0.0,
-                                            'start_longitude': trip.locations.start.lon if trip.locations and trip.locations.start else 0.0,
-                                            'end_latitude': trip.locations.end.lat if trip.locations and trip.locations.end else 0.0,
-                                            'end_longitude': trip.locations.end.lon if trip.locations and trip.locations.end else 0.0
-                                        }
-                                        await db.save_trip(trip_data)
-                                        logger.debug(f"Сохранена поездка: {trip.start_time} - {trip.distance} км")
-                        else:
-                            logger.debug("Новых поездок не найдено")
-                            
-                    except Exception as e:
-                        logger.error(f"Ошибка сбора данных о поездках: {e}")
-                    
-                    logger.debug("Данные автомобиля и поездок обновлены")
-                else:
-                    logger.warning(f"Автомобиль с VIN {vehicle_vin} не найден")
-            else:
-                logger.debug("Toyota клиент или VIN не настроены, пропускаем сбор данных")
+                await db.save_vehicle_status(vehicle_data)
+                vehicle_state.push(vehicle_data)
+                await shared_state.put("vehicle_state", vehicle_data.model_dump(mode="json"))
                 
-        except OSError as e:
-            if e.errno == 30:  # Read-only file system
-                logger.warning(f"Файловая система только для чтения, пропускаем сбор данных: {e}")
+                # Снимок для /api/vehicle/status: клиенты не ходят в Toyota API сами
+                try:
+                    build_vehicle_capabilities(target_vehicle)
+                    status_snapshot.set(await build_vehicle_status(target_vehicle))
+                except Exception as e:
+                    logger.error(f"Ошибка обновления снимка статуса: {e}")
+                
+                logger.debug("Данные автомобиля обновлены")
             else:
-                logger.error(f"Ошибка файловой системы при сборе данных: {e}")
-        except Exception as e:
-            logger.error(f"Ошибка сбора данных: {e}")
-        
-        # Ждать до следующего сбора
-        await asyncio.sleep(config['monitoring']['data_collection_interval'])
+                logger.warning(f"Автомобиль с VIN {vehicle_vin} не найден")
+        else:
+            logger.debug("Toyota клиент или VIN не настроены, пропускаем сбор данных")
+    
+    except OSError as e:
+        if e.errno == 30:  # Read-only file system
+            logger.warning(f"Файловая система только для чтения, пропускаем сбор данных: {e}")
+        else:
+            raise
+
+async def save_vehicle_trips(target_vehicle, days: int) -> Tuple[int, int]:
+    """Загрузить поездки за последние days дней и сохранить новые; вернуть (получено, сохранено)."""
+    end_date = date.today()
+    start_date = end_date - timedelta(days=days)
+    
+    # Получить поездки из Toyota API
+    trips = await target_vehicle.get_trips(start_date, end_date)
+    
+    trips_saved = 0
+    if trips:
+        logger.info(f"Получено {len(trips)} поездок из Toyota API")
+        
+        # Сохранить поездки в базу данных
+        for trip in trips:
+            if trip.start_time and trip.end_time and trip.distance:
+                # Проверить, есть ли уже эта поездка в базе
+                existing_trip = await db.get_trip_by_time(trip.start_time)
+                if not existing_trip:
+                    trip_data = {
+                        'start_time': trip.start_time,
+                        'end_time': trip.end_time,
+                        'distance_total': trip.distance or 0,
+                        'distance_electric': trip.ev_distance or 0,
+                        'fuel_consumed': trip.fuel_consumed or 0,
+                        'electricity_consumed': 0,  # Пока не доступно в API
+                        'start_latitude': trip.locations.start.lat if trip.locations and trip.locations.start else 0.0,
+                        'start_longitude': trip.locations.start.lon if trip.locations and trip.locations.start else 0.0,
+                        'end_latitude': trip.locations.end.lat if trip.locations and trip.locations.end else 0.0,
+                        'end_longitude': trip.locations.end.lon if trip.locations and trip.locations.end else 0.0
+                    }
+                    await db.save_trip(trip_data)
+                    trips_saved += 1
+                    logger.debug(f"Сохранена поездка: {trip.start_time} - {trip.distance} км")
+    else:
+        logger.debug("Новых поездок не найдено")
+    
+    return len(trips) if trips else 0, trips_saved
+
+async def sync_vehicle_trips():
+    """Синхронизация поездок за последние scheduler.trip_sync_days дней."""
+    if not toyota_client or not vehicle_vin:
+        return
+    await save_vehicle_trips(await get_vehicle(), scheduler_config.trip_sync_days)
+
+async def update_fuel_prices():
+    """Обновление кэша цен на топливо."""
+    from fuel_prices import fuel_price_service
+    
+    if not await fuel_price_service.update_prices_cache():
+        # Ошибка - планировщик повторит через час
+        raise RuntimeError("Не удалось обновить цены на топливо")
+    logger.info("✅ Автоматическое обновление цен на топливо выполнено успешно")
+
+def fuel_prices_updated_at() -> Optional[datetime]:
+    """Время последнего обновления кэша цен на топливо (None - кэша нет)."""
+    from fuel_prices import fuel_price_service
+    
+    if not os.path.exists(fuel_price_service.cache_file):
+        return None
+    return datetime.fromtimestamp(os.path.getmtime(fuel_price_service.cache_file))
+
+async def start_background_jobs():
+    """Процесс выбран для фоновых задач (leader.py): запустить планировщик."""
+    register_background_jobs()
+    scheduler.start()
+
+def register_background_jobs():
+    """Расписание фоновых задач."""
+    network_timeout = scheduler_config.job_timeout or None
+    
+    if config['monitoring']['auto_refresh'] and toyota_client:
+        scheduler.add("vehicle_data", collect_vehicle_data,
+                      IntervalTrigger(config['monitoring']['data_collection_interval']),
+                      run_at_start=True, timeout=network_timeout)
+        scheduler.add("trips", sync_vehicle_trips,
+                      IntervalTrigger(scheduler_config.trip_sync_interval, jitter=60),
+                      run_at_start=True, timeout=network_timeout)
+    
+    # Пропущенное (сервер был выключен в 6:00) обновление выполняется при запуске
+    scheduler.add("fuel_prices", update_fuel_prices,
+                  CronTrigger(scheduler_config.fuel_prices_cron, jitter=scheduler_config.fuel_prices_jitter),
+                  run_at_start=fuel_prices_updated_at() is None, last_run=fuel_prices_updated_at,
+                  timeout=network_timeout, retry_delay=3600)
+    
+    # Понижение детализации и очистка истории
+    scheduler.add("retention", db.cleanup_old_data,
+                  IntervalTrigger(db.retention.interval_minutes * 60), run_at_start=True)
+    
+    if backup_manager.config.enabled:
+        # База могла переехать во временный каталог при инициализации
+        backup_manager.db_path = db.db_path
+        # Срок следующей копии - по возрасту последней; после ошибки - через час
+        scheduler.add("backup", backup_manager.create_backup,
+                      DelayTrigger(backup_manager.seconds_until_due), retry_delay=3600)
+    
+    if maintenance.config.enabled:
+        scheduler.add("maintenance", maintenance.run,
+                      DelayTrigger(maintenance.seconds_until_window), retry_delay=3600)
 
 # API маршруты
 
 @app.get("/", response_class=HTMLResponse)
-async def dashboard():
+async def dashboard(request: Request):
     """Главная страница дашборда."""
     # Проверить, настроен ли Toyota клиент
     toyota_config = config.get('toyota', {})
@@ -502,358 +723,377 @@ async def dashboard():
         </html>
         """)
     
-    with open(paths.get_static_file('index.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'index.html')
 
 @app.get("/setup", response_class=HTMLResponse)
-async def setup_page():
+async def setup_page(request: Request):
     """Страница настройки."""
-    with open(paths.get_static_file('setup.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'setup.html')
 
 @app.get("/notifications", response_class=HTMLResponse)
-async def notifications_page():
+async def notifications_page(request: Request):
     """Страница уведомлений."""
-    with open(paths.get_static_file('notifications.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'notifications.html')
 
 @app.get("/stats", response_class=HTMLResponse)
-async def stats_page():
+async def stats_page(request: Request):
     """Страница статистики."""
-    with open(paths.get_static_file('stats.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'stats.html')
 
 @app.get("/climate", response_class=HTMLResponse)
-async def climate_page():
+async def climate_page(request: Request):
     """Страница климат-контроля."""
-    with open(paths.get_static_file('climate.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'climate.html')
 
 @app.get("/control", response_class=HTMLResponse)
-async def control_page():
+async def control_page(request: Request):
     """Страница управления автомобилем."""
-    with open(paths.get_static_file('control.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'control.html')
 
 @app.get("/settings", response_class=HTMLResponse)
-async def settings_page():
+async def settings_page(request: Request):
     """Страница настроек."""
-    with open(paths.get_static_file('settings.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'settings.html')
 
 @app.get("/location-test", response_class=HTMLResponse)
-async def location_test_page():
+async def location_test_page(request: Request):
     """Страница тестирования местоположений."""
-    with open(paths.get_static_file('location_test.html'), 'r', encoding='utf-8') as f:
-        return HTMLResponse(content=f.read())
+    return assets.response(request, 'location_test.html')
 
 @app.get("/api/system/paths")
 async def get_system_paths():
     """Получить информацию о путях системы."""
     return paths.get_info()
 
+async def build_vehicle_status(target_vehicle) -> Dict:
+    """Ответ /api/vehicle/status по обновленному объекту автомобиля."""
+    # Получаем данные о местоположении и ценах на топливо
+    location_info = None
+    if target_vehicle.location:
+        location_info = await location_service.get_location_info(
+            target_vehicle.location.latitude, 
+            target_vehicle.location.longitude
+        )
+    
+    return {
+        "battery_level": target_vehicle.electric_status.battery_level if target_vehicle.electric_status else 0,
+        "fuel_level": target_vehicle.dashboard.fuel_level if target_vehicle.dashboard else 0,
+        "range_electric": target_vehicle.electric_status.ev_range if target_vehicle.electric_status else 0,
+        "range_fuel": target_vehicle.dashboard.fuel_range if target_vehicle.dashboard else 0,
+        "total_range": (target_vehicle.electric_status.ev_range if target_vehicle.electric_status else 0) + (target_vehicle.dashboard.fuel_range if target_vehicle.dashboard else 0),
+        "charging_status": target_vehicle.electric_status.charging_status if target_vehicle.electric_status else "none",
+        "remaining_charge_time": getattr(target_vehicle.electric_status, 'remaining_charge_time', None) if target_vehicle.electric_status else None,
+        "location": location_info or {
+            "latitude": target_vehicle.location.latitude if target_vehicle.location else 45.542026,
+            "longitude": target_vehicle.location.longitude if target_vehicle.location else 13.713837,
+            "city": "Копер",
+            "country": "Slovenia",
+            "address": "Копер, Словения",
+            "fuel_price": 1.43,
+            "fuel_currency": "€/л",
+            "fuel_price_formatted": "1.43 €/л"
+        },
+        "locked": getattr(target_vehicle.lock_status, 'locked', True) if target_vehicle.lock_status else True,
+        "engine_running": False,
+        "climate_on": False,
+        "temperature_inside": 0.0,
+        "temperature_outside": 0.0,
+        
+        # Дополнительные данные
+        "model_name": "Toyota C-HR - NG '24",
+        "image_url": "https://dj3z27z47basa.cloudfront.net/3fd45119-ae71-4298-abd2-281907b01f73",
+        "date_of_first_use": "2024-05-23",
+        "vin": target_vehicle.vin,
+        "alias": target_vehicle.alias,
+        "odometer": target_vehicle.dashboard.odometer if target_vehicle.dashboard else 0,
+        "last_updated": datetime.now().isoformat(timespec="seconds")
+    }
+
+async def load_vehicle_status() -> Dict:
+    """Запросить статус у Toyota API: вход, список автомобилей, update, геокодирование."""
+    target_vehicle = await get_vehicle()
+    await target_vehicle.update()
+    build_vehicle_capabilities(target_vehicle)
+    return await build_vehicle_status(target_vehicle)
+
+def fallback_vehicle_status() -> Dict:
+    """Данные-заглушка, если статус еще ни разу не удалось получить."""
+    return {
+        "battery_level": 95,
+        "fuel_level": 86,
+        "range_electric": 74.1,
+        "range_fuel": 459.0,
+        "total_range": 533.1,
+        "charging_status": "none",
+        "remaining_charge_time": None,
+        "location": {
+            "latitude": 45.542026,
+            "longitude": 13.713837,
+            "city": "Копер",
+            "country": "Slovenia",
+            "address": "Копер, Словения",
+            "fuel_price": 1.43,
+            "fuel_currency": "€/л",
+            "fuel_price_formatted": "1.43 €/л"
+        },
+        "locked": True,
+        "engine_running": False,
+        "climate_on": False,
+        "temperature_inside": 0.0,
+        "temperature_outside": 0.0,
+        "model_name": "Toyota C-HR - NG '24",
+        "image_url": "https://dj3z27z47basa.cloudfront.net/3fd45119-ae71-4298-abd2-281907b01f73",
+        "date_of_first_use": "2024-05-23",
+        "vin": "JTXXXXXXXXXXXXXXX",
+        "alias": "My Toyota",
+        "odometer": 38491,
+        "last_updated": datetime.now().isoformat()
+    }
+
+async def current_vehicle_status(fresh: bool = False) -> Dict:
+    """Статус из последнего снимка с обновлением по правилам /api/vehicle/status."""
+    refresh = None
+    if status_snapshot.data is None:
+        # Отдать нечего: ждем первого обновления (общего для всех запросов,
+        # shield - отключившийся клиент не отменяет его для остальных).
+        # Пока Toyota API недоступен, попытки тоже ограничены лимитом
+        if status_snapshot.refreshing or await api_limiter.acquire():
+            refresh = "initial"
+            await asyncio.shield(status_snapshot.refresh(load_vehicle_status))
+        else:
+            refresh = "rate_limited"
+    elif fresh:
+        if status_snapshot.refreshing or await api_limiter.acquire():
+            refresh = "forced"
+            await asyncio.shield(status_snapshot.refresh(load_vehicle_status))
+        else:
+            refresh = "rate_limited"
+    elif status_snapshot.age() > status_max_age:
+        if status_snapshot.refreshing or await api_limiter.acquire():
+            refresh = "background"
+            status_snapshot.refresh(load_vehicle_status)
+    
+    if status_snapshot.data is None:
+        response = fallback_vehicle_status()
+    else:
+        response = dict(status_snapshot.data)
+        response["age"] = round(status_snapshot.age())
+    response["refresh"] = refresh
+    if refresh == "rate_limited":
+        response["retry_after"] = round(await api_limiter.wait_time())
+    if status_snapshot.last_error:
+        response["refresh_error"] = status_snapshot.last_error
+    return response
+
 @app.get("/api/vehicle/status")
-async def get_vehicle_status():
-    """Получить текущий статус автомобиля."""
+async def get_vehicle_status(fresh: bool = False):
+    """Получить текущий статус автомобиля.
+    
+    Ответ берется из последнего снимка сборщика данных, age - его возраст
+    в секундах. Снимок старше monitoring.status_max_age обновляется в фоне,
+    fresh=1 обновляет его сразу в пределах monitoring.max_api_calls_per_hour.
+    Пока снимка нет, попытки получить его ограничены тем же лимитом: сверх
+    него отдаются данные-заглушка с refresh=rate_limited и retry_after.
+    """
+    return await current_vehicle_status(fresh)
+
+@app.get("/api/bootstrap")
+async def get_bootstrap(period: str = "today", fresh: bool = False):
+    """Данные главной страницы одним запросом.
+    
+    Статус и местоположение берутся из одного снимка автомобиля (не больше
+    одного обращения к Toyota API), статистика за period считается в базе
+    параллельно, возможности автомобиля - из памяти. Ошибка одной части
+    не мешает остальным: часть равна null, причина - в errors.
+    """
+    status, stats = await asyncio.gather(
+        current_vehicle_status(fresh),
+        build_phev_stats(period),
+        return_exceptions=True
+    )
+    # После загрузки статуса возможности уже в памяти, повторный вход не нужен
     try:
-        target_vehicle = await get_vehicle()
-        
-        # Обновить данные автомобиля
-        await target_vehicle.update()
-        
-        # Получаем данные о местоположении и ценах на топливо
-        location_info = None
-        if target_vehicle.location:
-            location_info = await location_service.get_location_info(
-                target_vehicle.location.latitude, 
-                target_vehicle.location.longitude
-            )
-        
-        return {
-            "battery_level": target_vehicle.electric_status.battery_level if target_vehicle.electric_status else 0,
-            "fuel_level": target_vehicle.dashboard.fuel_level if target_vehicle.dashboard else 0,
-            "range_electric": target_vehicle.electric_status.ev_range if target_vehicle.electric_status else 0,
-            "range_fuel": target_vehicle.dashboard.fuel_range if target_vehicle.dashboard else 0,
-            "total_range": (target_vehicle.electric_status.ev_range if target_vehicle.electric_status else 0) + (target_vehicle.dashboard.fuel_range if target_vehicle.dashboard else 0),
-            "charging_status": target_vehicle.electric_status.charging_status if target_vehicle.electric_status else "none",
-            "remaining_charge_time": getattr(target_vehicle.electric_status, 'remaining_charge_time', None) if target_vehicle.electric_status else None,
-            "location": location_info or {
-                "latitude": target_vehicle.location.latitude if target_vehicle.location else 45.542026,
-                "longitude": target_vehicle.location.longitude if target_vehicle.location else 13.713837,
-                "city": "Копер",
-                "country": "Slovenia",
-                "address": "Копер, Словения",
-                "fuel_price": 1.43,
-                "fuel_currency": "€/л",
-                "fuel_price_formatted": "1.43 €/л"
-            },
-            "locked": getattr(target_vehicle.lock_status, 'locked', True) if target_vehicle.lock_status else True,
-            "engine_running": False,
-            "climate_on": False,
-            "temperature_inside": 0.0,
-            "temperature_outside": 0.0,
-            
-            # Дополнительные данные
-            "model_name": "Toyota C-HR - NG '24",
-            "image_url": "https://dj3z27z47basa.cloudfront.net/3fd45119-ae71-4298-abd2-281907b01f73",
-            "date_of_first_use": "2024-05-23",
-            "vin": target_vehicle.vin,
-            "alias": target_vehicle.alias,
-            "odometer": target_vehicle.dashboard.odometer if target_vehicle.dashboard else 0,
-            "last_updated": datetime.now().isoformat()
-        }
+        capabilities = await load_vehicle_capabilities()
     except Exception as e:
-        logger.error(f"Ошибка получения статуса: {e}")
-        # Возвращаем fallback данные при ошибке
-        return {
-            "battery_level": 95,
-            "fuel_level": 86,
-            "range_electric": 74.1,
-            "range_fuel": 459.0,
-            "total_range": 533.1,
-            "charging_status": "none",
-            "remaining_charge_time": None,
-            "location": {
-                "latitude": 45.542026,
-                "longitude": 13.713837,
-                "city": "Копер",
-                "country": "Slovenia",
-                "address": "Копер, Словения",
-                "fuel_price": 1.43,
-                "fuel_currency": "€/л",
-                "fuel_price_formatted": "1.43 €/л"
-            },
-            "locked": True,
-            "engine_running": False,
-            "climate_on": False,
-            "temperature_inside": 0.0,
-            "temperature_outside": 0.0,
-            "model_name": "Toyota C-HR - NG '24",
-            "image_url": "https://dj3z27z47basa.cloudfront.net/3fd45119-ae71-4298-abd2-281907b01f73",
-            "date_of_first_use": "2024-05-23",
-            "vin": "JTXXXXXXXXXXXXXXX",
-            "alias": "My Toyota",
-            "odometer": 38491,
-            "last_updated": datetime.now().isoformat()
-        }
+        capabilities = e
+    
+    response = {"errors": {}}
+    for name, part in (("status", status), ("capabilities", capabilities), ("stats", stats)):
+        if isinstance(part, Exception):
+            logger.error(f"Ошибка получения данных {name} для главной страницы: {part}")
+            response[name] = None
+            response["errors"][name] = str(getattr(part, "detail", None) or part)
+        else:
+            response[name] = part
+    response["location"] = response["status"]["location"] if response["status"] else None
+    return response
 
 @app.post("/api/vehicle/lock")
-async def lock_vehicle():
+async def lock_vehicle(wait: float = 0):
     """Заблокировать автомобиль."""
-    try:
+    async def action():
         target_vehicle = await get_vehicle()
-        result = await target_vehicle.post_command(CommandType.DOOR_LOCK)
-        # Команда блокировки отправлена
-        
+        await target_vehicle.post_command(CommandType.DOOR_LOCK)
         return {"status": "success", "message": "Автомобиль заблокирован"}
-    except Exception as e:
-        logger.error(f"Ошибка блокировки: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command("door-lock", action, wait=wait)
 
 @app.post("/api/vehicle/unlock")
-async def unlock_vehicle():
+async def unlock_vehicle(wait: float = 0):
     """Разблокировать автомобиль."""
-    try:
+    async def action():
         target_vehicle = await get_vehicle()
-        result = await target_vehicle.post_command(CommandType.DOOR_UNLOCK)
-        # Команда разблокировки отправлена
-        
+        await target_vehicle.post_command(CommandType.DOOR_UNLOCK)
         return {"status": "success", "message": "Автомобиль разблокирован"}
-    except Exception as e:
-        logger.error(f"Ошибка разблокировки: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command("door-unlock", action, wait=wait)
 
 @app.post("/api/vehicle/start")
-async def start_engine(request: CommandRequest):
+async def start_engine(request: CommandRequest, wait: float = 0):
     """Запустить двигатель (прогрев)."""
-    try:
-        if not toyota_client:
-            raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
-        
+    duration = request.duration if request.duration else 10
+    
+    async def action():
         target_vehicle = await get_vehicle()
-        
-        result = await target_vehicle.post_command(CommandType.ENGINE_START)
-        duration = request.duration if request.duration else 10
-        # Команда запуска двигателя отправлена
-        
+        try:
+            await target_vehicle.post_command(CommandType.ENGINE_START)
+        except Exception as e:
+            # Проверяем, если это ошибка API Toyota
+            if "Remote command interrupted" in str(e) or "40009" in str(e):
+                raise HTTPException(status_code=400, detail="Команда запуска недоступна. Возможно, автомобиль уже заведен или команда не поддерживается.")
+            raise
         return {"status": "success", "message": f"Двигатель запущен на {duration} минут"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка запуска двигателя: {e}")
-        # Проверяем, если это ошибка API Toyota
-        if "Remote command interrupted" in str(e) or "40009" in str(e):
-            raise HTTPException(status_code=400, detail="Команда запуска недоступна. Возможно, автомобиль уже заведен или команда не поддерживается.")
-        raise HTTPException(status_code=500, detail=f"Внутренняя ошибка: {str(e)}")
+    return await submit_command("engine-start", action, {"duration": duration}, wait=wait)
 
 @app.post("/api/vehicle/stop")
-async def stop_engine():
+async def stop_engine(wait: float = 0):
     """Остановить двигатель."""
-    try:
-        if not toyota_client:
-            raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
-        
+    async def action():
         target_vehicle = await get_vehicle()
-        result = await target_vehicle.post_command(CommandType.ENGINE_STOP)
-        # Команда остановки двигателя отправлена
-        
+        await target_vehicle.post_command(CommandType.ENGINE_STOP)
         return {"status": "success", "message": "Двигатель остановлен"}
-    except Exception as e:
-        logger.error(f"Ошибка остановки двигателя: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command("engine-stop", action, wait=wait)
 
 @app.post("/api/vehicle/find")
-async def find_vehicle():
+async def find_vehicle(wait: float = 0):
     """Найти автомобиль (звуковой сигнал + мигание фар)."""
-    try:
-        if not toyota_client:
-            raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
-        
-        # Получить автомобили
-        vehicles = await toyota_client.get_vehicles()
-        if not vehicles:
-            raise HTTPException(status_code=404, detail="Автомобиль не найден")
-        
-        # Взять первый автомобиль
-        vehicle = vehicles[0]
-        
-        # Отправить команду поиска
-        result = await vehicle.post_command(CommandType.FIND_VEHICLE, beeps=3)
-        # Команда поиска автомобиля отправлена
-        
+    async def action():
+        target_vehicle = await get_vehicle()
+        await target_vehicle.post_command(CommandType.FIND_VEHICLE, beeps=3)
         return {"status": "success", "message": "Автомобиль подает сигналы"}
-    except Exception as e:
-        logger.error(f"Ошибка поиска автомобиля: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command("find-vehicle", action, wait=wait)
 
 @app.post("/api/vehicle/climate")
-async def control_climate(request: CommandRequest):
+async def control_climate(request: CommandRequest, wait: float = 0):
     """Управление климат-контролем."""
-    try:
-        if not toyota_client:
-            raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
-        
+    async def action():
         target_vehicle = await get_vehicle()
         
         # Пробуем разные команды климат-контроля
         try:
             # Сначала пробуем AC_SETTINGS_ON
-            result = await target_vehicle.post_command(CommandType.AC_SETTINGS_ON)
-            # Климат-контроль включен
-            return {
-                "status": "success", 
-                "message": "Климат-контроль включен"
-            }
+            await target_vehicle.post_command(CommandType.AC_SETTINGS_ON)
+            return {"status": "success", "message": "Климат-контроль включен"}
         except Exception as ac_error:
             logger.warning(f"AC_SETTINGS_ON не сработал: {ac_error}")
-            
-            # Пробуем VENTILATION_ON
-            try:
-                result = await target_vehicle.post_command(CommandType.VENTILATION_ON)
-                # Вентиляция включена
-                return {
-                    "status": "success", 
-                    "message": "Вентиляция включена"
-                }
-            except Exception as vent_error:
-                logger.warning(f"VENTILATION_ON не сработал: {vent_error}")
-                
-                # Если ничего не работает, возвращаем информативную ошибку
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Климат-контроль недоступен. Возможные причины: автомобиль заведен, команда не поддерживается или временная ошибка API. Попробуйте позже."
-                )
         
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка управления климатом: {e}")
-        raise HTTPException(status_code=500, detail=f"Внутренняя ошибка: {str(e)}")
+        # Пробуем VENTILATION_ON
+        try:
+            await target_vehicle.post_command(CommandType.VENTILATION_ON)
+            return {"status": "success", "message": "Вентиляция включена"}
+        except Exception as vent_error:
+            logger.warning(f"VENTILATION_ON не сработал: {vent_error}")
+        
+        # Если ничего не работает, возвращаем информативную ошибку
+        raise HTTPException(
+            status_code=400,
+            detail="Климат-контроль недоступен. Возможные причины: автомобиль заведен, команда не поддерживается или временная ошибка API. Попробуйте позже."
+        )
+    return await submit_command("climate", action, wait=wait)
+
+async def _post_window_command(command_type: CommandType, message: str) -> Dict:
+    """Команда окон с проверкой, что автомобиль ее поддерживает."""
+    target_vehicle = await get_vehicle()
+    
+    # Проверить возможности автомобиля
+    extended_caps = target_vehicle._vehicle_info.extended_capabilities
+    if not extended_caps or not extended_caps.power_windows_capable:
+        raise HTTPException(
+            status_code=400, 
+            detail="Данный автомобиль не поддерживает дистанционное управление окнами"
+        )
+    
+    await target_vehicle.post_command(command_type)
+    return {"status": "success", "message": message}
 
 @app.post("/api/vehicle/windows/open")
-async def open_windows():
+async def open_windows(wait: float = 0):
     """Открыть окна автомобиля."""
-    try:
-        if not toyota_client:
-            raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
-        
-        target_vehicle = await get_vehicle()
-        
-        # Проверить возможности автомобиля
-        extended_caps = target_vehicle._vehicle_info.extended_capabilities
-        if not extended_caps or not extended_caps.power_windows_capable:
-            raise HTTPException(
-                status_code=400, 
-                detail="Данный автомобиль не поддерживает дистанционное управление окнами"
-            )
-        
-        # Отправить команду открытия окон
-        result = await target_vehicle.post_command(CommandType.WINDOW_ON)
-        # Команда открытия окон отправлена
-        
-        return {"status": "success", "message": "Окна открываются"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка открытия окон: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command(
+        "power-window-on", lambda: _post_window_command(CommandType.WINDOW_ON, "Окна открываются"), wait=wait
+    )
 
 @app.post("/api/vehicle/windows/close")
-async def close_windows():
+async def close_windows(wait: float = 0):
     """Закрыть окна автомобиля."""
-    try:
-        if not toyota_client:
-            raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
-        
-        target_vehicle = await get_vehicle()
-        
-        # Проверить возможности автомобиля
-        extended_caps = target_vehicle._vehicle_info.extended_capabilities
-        if not extended_caps or not extended_caps.power_windows_capable:
-            raise HTTPException(
-                status_code=400, 
-                detail="Данный автомобиль не поддерживает дистанционное управление окнами"
-            )
-        
-        # Отправить команду закрытия окон
-        result = await target_vehicle.post_command(CommandType.WINDOW_OFF)
-        # Команда закрытия окон отправлена
-        
-        return {"status": "success", "message": "Окна закрываются"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка закрытия окон: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command(
+        "power-window-off", lambda: _post_window_command(CommandType.WINDOW_OFF, "Окна закрываются"), wait=wait
+    )
+
+def build_vehicle_capabilities(target_vehicle) -> Dict[str, bool]:
+    """Возможности автомобиля по данным списка автомобилей (без запросов к API)."""
+    extended_caps = target_vehicle._vehicle_info.extended_capabilities
+    remote_caps = target_vehicle._vehicle_info.remote_service_capabilities
+    previous = dict(vehicle_capabilities)
+    
+    vehicle_capabilities.update({
+        "power_windows": extended_caps.power_windows_capable if extended_caps else False,
+        "door_lock_unlock": extended_caps.door_lock_unlock_capable if extended_caps else False,
+        "climate_control": extended_caps.climate_capable if extended_caps else False,
+        "engine_start_stop": remote_caps.estart_enabled if remote_caps else False,
+        "hazard_lights": remote_caps.hazard_capable if remote_caps else False,
+        "vehicle_finder": remote_caps.vehicle_finder_capable if remote_caps else False,
+        "trunk_control": remote_caps.trunk_capable if remote_caps else False,
+        "horn": False,  # Horn capability not found in current API
+        "headlights": remote_caps.head_light_capable if remote_caps else False
+    })
+    if vehicle_capabilities != previous:
+        shared_state.publish("capabilities", vehicle_capabilities)
+    return dict(vehicle_capabilities)
+
+async def load_vehicle_capabilities() -> Dict[str, bool]:
+    """Возможности автомобиля: из памяти или по списку автомобилей Toyota API."""
+    if vehicle_capabilities:
+        return dict(vehicle_capabilities)
+    if not toyota_client:
+        raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
+    return build_vehicle_capabilities(await get_vehicle())
+
+@app.get("/api/commands/{job_id}")
+async def get_command_job(job_id: str):
+    """Состояние задачи очереди команд (для опроса после ответа 202)."""
+    job = await command_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или уже забыта")
+    return job.to_dict()
+
+@app.get("/api/commands")
+async def get_command_jobs(limit: int = 20):
+    """Последние задачи очереди команд."""
+    return {
+        "pending": await command_queue.pending(),
+        "jobs": [job.to_dict() for job in await command_queue.recent(limit)]
+    }
 
 @app.get("/api/vehicle/capabilities")
 async def get_vehicle_capabilities():
     """Получить возможности автомобиля."""
     try:
-        if not toyota_client:
-            raise HTTPException(status_code=503, detail="Toyota клиент не инициализирован")
-        
-        target_vehicle = await get_vehicle()
-        extended_caps = target_vehicle._vehicle_info.extended_capabilities
-        remote_caps = target_vehicle._vehicle_info.remote_service_capabilities
-        
-        return {
-            "power_windows": extended_caps.power_windows_capable if extended_caps else False,
-            "door_lock_unlock": extended_caps.door_lock_unlock_capable if extended_caps else False,
-            "climate_control": extended_caps.climate_capable if extended_caps else False,
-            "engine_start_stop": remote_caps.estart_enabled if remote_caps else False,
-            "hazard_lights": remote_caps.hazard_capable if remote_caps else False,
-            "vehicle_finder": remote_caps.vehicle_finder_capable if remote_caps else False,
-            "trunk_control": remote_caps.trunk_capable if remote_caps else False,
-            "horn": False,  # Horn capability not found in current API
-            "headlights": remote_caps.head_light_capable if remote_caps else False
-        }
+        return await load_vehicle_capabilities()
     except Exception as e:
         logger.error(f"Ошибка получения возможностей автомобиля: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/vehicle/notifications")
-async def get_vehicle_notifications():
+async def get_vehicle_notifications(request: Request):
     """Получить уведомления автомобиля."""
     try:
         target_vehicle = await get_vehicle()
@@ -892,11 +1132,11 @@ async def get_vehicle_notifications():
                     "status": getattr(notif, 'status', None)
                 })
         
-        return {"notifications": notifications}
+        return json_response(request, {"notifications": notifications})
     except Exception as e:
         logger.error(f"Ошибка получения уведомлений: {e}")
         # Возвращаем fallback уведомления
-        return {
+        return json_response(request, {
             "notifications": [
                 {
                     "id": "1",
@@ -917,7 +1157,7 @@ async def get_vehicle_notifications():
                     "is_read": False
                 }
             ]
-        }
+        })
 
 @app.get("/api/vehicle/location")
 async def get_vehicle_location():
@@ -987,93 +1227,244 @@ async def get_climate_status():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/vehicle/climate/start")
-async def start_climate(request: CommandRequest):
+async def start_climate(request: CommandRequest, wait: float = 0):
     """Запустить климат-контроль."""
-    try:
+    duration = request.duration or 10
+    temperature = request.temperature or 21
+    
+    async def action():
         target_vehicle = await get_vehicle()
         
         # Отправить команду запуска климата
-        result = await target_vehicle.post_command(
+        await target_vehicle.post_command(
             command=CommandType.CLIMATE_START,
-            duration=request.duration or 10,
-            temperature=request.temperature or 21
+            duration=duration,
+            temperature=temperature
         )
-        
         return {"status": "success", "message": "Климат-контроль запущен"}
-    except Exception as e:
-        logger.error(f"Ошибка запуска климата: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command("climate-start", action, {"duration": duration, "temperature": temperature}, wait=wait)
 
 @app.post("/api/vehicle/climate/stop")
-async def stop_climate():
+async def stop_climate(wait: float = 0):
     """Остановить климат-контроль."""
-    try:
+    async def action():
         target_vehicle = await get_vehicle()
         
         # Отправить команду остановки климата
-        result = await target_vehicle.post_command(CommandType.CLIMATE_STOP)
-        
+        await target_vehicle.post_command(CommandType.CLIMATE_STOP)
         return {"status": "success", "message": "Климат-контроль остановлен"}
-    except Exception as e:
-        logger.error(f"Ошибка остановки климата: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await submit_command("climate-stop", action, wait=wait)
+
+async def build_phev_stats(period: str = None, date_from: str = None, date_to: str = None) -> Dict:
+    """Статистика автомобиля за период или диапазон дат из базы данных."""
+    # Если указаны конкретные даты, используем их
+    if date_from and date_to:
+        stats = await db.get_phev_statistics_by_dates(date_from, date_to)
+        period_label = f"с {date_from} по {date_to}"
+    else:
+        # Иначе используем предустановленный период
+        if not period:
+            period = "today"
+        stats = await db.get_phev_statistics(period)
+        period_label = period
+    
+    # Рассчитать дополнительные метрики
+    total_distance = stats.get("total_distance", 0)
+    fuel_consumption = stats.get("fuel_consumption", 0)
+    electricity_consumption = stats.get("electricity_consumption", 0)
+    
+    # Количество поездок (заглушка, нужно будет получать из реальных данных)
+    trip_count = stats.get("trip_count", 0)
+    if trip_count == 0 and total_distance > 0:
+        # Примерная оценка: одна поездка на каждые 20 км
+        trip_count = max(1, int(total_distance / 20))
+    
+    return {
+        "period": period_label,
+        "total_distance": total_distance,
+        "electric_distance": stats.get("electric_distance", 0),
+        "fuel_distance": stats.get("fuel_distance", 0),
+        "electric_percentage": stats.get("electric_percentage", 0),
+        "fuel_consumption": fuel_consumption,
+        "electricity_consumption": electricity_consumption,
+        "co2_saved": stats.get("co2_saved", 0),
+        "cost_savings": stats.get("cost_savings", 0),
+        "trip_count": trip_count
+    }
 
 @app.get("/api/stats/phev")
 async def get_phev_stats(
+    request: Request,
     period: str = None,
     date_from: str = None,
     date_to: str = None
 ):
     """Получить статистику автомобиля за период или диапазон дат."""
     try:
-        # Если указаны конкретные даты, используем их
-        if date_from and date_to:
-            stats = await db.get_phev_statistics_by_dates(date_from, date_to)
-            period_label = f"с {date_from} по {date_to}"
-        else:
-            # Иначе используем предустановленный период
-            if not period:
-                period = "today"
-            stats = await db.get_phev_statistics(period)
-            period_label = period
-        
-        # Рассчитать дополнительные метрики
-        total_distance = stats.get("total_distance", 0)
-        fuel_consumption = stats.get("fuel_consumption", 0)
-        electricity_consumption = stats.get("electricity_consumption", 0)
-        
-        # Количество поездок (заглушка, нужно будет получать из реальных данных)
-        trip_count = stats.get("trip_count", 0)
-        if trip_count == 0 and total_distance > 0:
-            # Примерная оценка: одна поездка на каждые 20 км
-            trip_count = max(1, int(total_distance / 20))
-        
-        return {
-            "period": period_label,
-            "total_distance": total_distance,
-            "electric_distance": stats.get("electric_distance", 0),
-            "fuel_distance": stats.get("fuel_distance", 0),
-            "electric_percentage": stats.get("electric_percentage", 0),
-            "fuel_consumption": fuel_consumption,
-            "electricity_consumption": electricity_consumption,
-            "co2_saved": stats.get("co2_saved", 0),
-            "cost_savings": stats.get("cost_savings", 0),
-            "trip_count": trip_count
-        }
+        return json_response(request, await build_phev_stats(period, date_from, date_to))
     except Exception as e:
         logger.error(f"Ошибка получения статистики автомобиля: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/trips")
-async def get_trips(limit: int = 10):
+async def get_trips(request: Request, limit: int = 10):
     """Получить последние поездки."""
     try:
-        trips = await db.get_recent_trips(limit)
-        return {"trips": trips}
+        # JSON собирается в SQLite, без промежуточных словарей
+        trips_json = await db.get_recent_trips_json(limit)
+        return json_response(request, f'{{"trips":{trips_json}}}'.encode("utf-8"))
     except Exception as e:
         logger.error(f"Ошибка получения поездок: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/trips/near")
+async def get_trips_near(lat: float, lon: float, radius_km: float = 0.5, endpoint: str = "start", limit: int = 100):
+    """Поездки, начавшиеся (endpoint=start) или закончившиеся (end) рядом с точкой."""
+    try:
+        trips = await db.find_trips_near(lat, lon, radius_km=radius_km, endpoint=endpoint, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"trips": trips}
+
+@app.get("/api/trips/bbox")
+async def get_trips_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                            endpoint: str = "start", limit: int = 100):
+    """Поездки с началом или концом в прямоугольной области."""
+    try:
+        trips = await db.find_trips_in_bbox(min_lat, min_lon, max_lat, max_lon, endpoint=endpoint, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"trips": trips}
+
+@app.get("/api/locations/parking")
+async def get_parking_locations(precision: int = 3, limit: int = 10):
+    """Частые места стоянки автомобиля."""
+    return {"locations": await db.get_parking_locations(precision=precision, limit=limit)}
+
+@app.get("/api/locations/history")
+async def get_positions_near(lat: float, lon: float, radius_km: float = 0.5, limit: int = 100):
+    """Когда автомобиль находился рядом с точкой."""
+    return {"positions": await db.find_positions_near(lat, lon, radius_km=radius_km, limit=limit)}
+
+@app.get("/api/trips/{trip_id}/route")
+async def get_trip_route(trip_id: int):
+    """Получить маршрут поездки."""
+    route = await db.get_trip_route(trip_id)
+    if route is None:
+        raise HTTPException(status_code=404, detail="Маршрут поездки не найден")
+    return {"trip_id": trip_id, "route_data": route}
+
+async def _history_page(loader, limit: int, cursor: Optional[str],
+                        start: Optional[datetime], end: Optional[datetime]):
+    """Общая обработка постраничных запросов истории."""
+    try:
+        return await loader(limit=limit, cursor=cursor, start=start, end=end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+    except Exception as e:
+        logger.error(f"Ошибка получения истории: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/history/trips")
+async def get_trips_history(limit: int = 50, cursor: Optional[str] = None,
+                            start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """История поездок: страницы от новых к старым, next_cursor - следующая страница."""
+    return await _history_page(db.get_trips_page, limit, cursor, start, end)
+
+@app.get("/api/history/status")
+async def get_status_history(limit: int = 50, cursor: Optional[str] = None,
+                             start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """История статусов автомобиля."""
+    return await _history_page(db.get_status_page, limit, cursor, start, end)
+
+@app.get("/api/history/commands")
+async def get_commands_history(limit: int = 50, cursor: Optional[str] = None,
+                               start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """История выполненных команд."""
+    return await _history_page(db.get_commands_page, limit, cursor, start, end)
+
+@app.get("/api/history/series")
+async def get_history_series(metrics: str = "battery_level", start: Optional[datetime] = None,
+                             end: Optional[datetime] = None, points: int = 500):
+    """Прореженные ряды метрик для графиков (metrics - через запятую)."""
+    end_ts = int((end or datetime.now()).timestamp())
+    start_ts = int(start.timestamp()) if start else end_ts - 7 * 86400
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=400, detail="Начало диапазона должно быть раньше конца")
+    
+    series = []
+    for metric in [m.strip() for m in metrics.split(",") if m.strip()]:
+        if metric not in ROLLUP_METRICS:
+            raise HTTPException(status_code=400, detail=f"Неизвестная метрика: {metric}")
+        try:
+            series.append(await load_series(db, metric, start_ts, end_ts, points))
+        except Exception as e:
+            logger.error(f"Ошибка получения ряда {metric}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"series": series}
+
+@app.get("/api/export/{table}")
+async def export_table(table: str, format: str = "ndjson", start: Optional[datetime] = None,
+                       end: Optional[datetime] = None):
+    """Потоковая выгрузка таблицы (trips, vehicle_status, commands, notifications)."""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Таблица {table} не поддерживает выгрузку")
+    if format not in available_formats():
+        raise HTTPException(status_code=400, detail=f"Доступные форматы: {', '.join(available_formats())}")
+    
+    exporter = TableExporter(db, table, start=start, end=end)
+    filename = f"{table}_{datetime.now():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        exporter.stream(format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/stream")
+async def stream_events(request: Request, last_event_id: Optional[int] = None):
+    """Поток событий status, command, notification (Server-Sent Events).
+    
+    Пропущенные события повторяются по заголовку Last-Event-ID (или
+    параметру last_event_id); если история их уже не содержит, первым
+    приходит текущий статус.
+    """
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    
+    async def generate():
+        with event_hub.subscribe(last_event_id) as subscription:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            if not subscription.covered and status_snapshot.data is not None:
+                yield format_sse(Event(None, "status", status_snapshot.data))
+            async for event in subscription.events(KEEPALIVE_SECONDS):
+                if await request.is_disconnected():
+                    break
+                yield format_sse(event) if event else ": ping\n\n"
+    
+    return StreamingResponse(generate(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # nginx не должен буферизовать поток
+        "X-Accel-Buffering": "no",
+    })
+
+@app.websocket("/api/ws")
+async def websocket_events(websocket: WebSocket, last_event_id: Optional[int] = None):
+    """Те же события, что /api/stream, сообщениями JSON {id, type, data}."""
+    await websocket.accept()
+    with event_hub.subscribe(last_event_id) as subscription:
+        try:
+            if not subscription.covered and status_snapshot.data is not None:
+                await websocket.send_json({"id": None, "type": "status", "data": status_snapshot.data})
+            async for event in subscription.events(KEEPALIVE_SECONDS):
+                if event is None:
+                    await websocket.send_json({"id": None, "type": "ping", "data": None})
+                else:
+                    await websocket.send_text(event_json(event._asdict()))
+        except (WebSocketDisconnect, RuntimeError):
+            # Клиент закрыл соединение; отправка в закрытый сокет - RuntimeError
+            pass
+
 @app.get("/api/health")
 async def health_check():
     """Проверка состояния сервера."""
@@ -1081,9 +1472,51 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "toyota_client": toyota_client is not None,
-        "database": await db.check_connection()
+        "database": await db.check_connection(),
+        "pid": os.getpid(),
+        "background_jobs": leader.is_leader
+    }
+
+@app.get("/api/scheduler")
+async def get_scheduler_jobs():
+    """Фоновые задачи: расписание, следующий запуск и статистика выполнения.
+    
+    При нескольких воркерах задачи есть только у процесса leader_pid.
+    """
+    return {
+        "started": scheduler.started,
+        "pid": os.getpid(),
+        "leader": leader.is_leader,
+        "leader_pid": leader.leader_pid(),
+        "jobs": scheduler.status(),
     }
 
+@app.post("/api/scheduler/{name}/run")
+async def run_scheduler_job(name: str):
+    """Выполнить фоновую задачу вне расписания."""
+    if not leader.is_leader:
+        raise HTTPException(status_code=409, detail=f"Фоновые задачи выполняет процесс {leader.leader_pid()}")
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Задача {name} не найдена")
+    success = await scheduler.run_now(name)
+    if success is None:
+        raise HTTPException(status_code=409, detail=f"Задача {name} уже выполняется")
+    return {"success": success, "job": scheduler.jobs[name].to_dict()}
+
+@app.get("/api/storage/stats")
+async def get_storage_stats():
+    """Статистика хранения: сжатие данных, размер файла, последнее обслуживание."""
+    try:
+        return {
+            "success": True,
+            "payloads": await db.get_payload_stats(),
+            "database": await maintenance.database_stats(),
+            "maintenance": maintenance.last_report,
+        }
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики хранения: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/config")
 async def get_config():
     """Получить текущую конфигурацию (без паролей)."""
@@ -1124,6 +1557,7 @@ async def test_connection(request: TestConnectionRequest):
     """Тестировать подключение к Toyota API."""
     try:
         # Создать временный клиент для тестирования
+        from pytoyoda import MyT
         test_client = MyT(
             username=request.username,
             password=request.password,
@@ -1302,43 +1736,12 @@ async def collect_trips():
             )
         
         # Собрать данные о поездках за последние 30 дней
-        from datetime import date, timedelta
-        end_date = date.today()
-        start_date = end_date - timedelta(days=30)
-        
-        # Получить поездки из Toyota API
-        trips = await target_vehicle.get_trips(start_date, end_date)
-        
-        trips_saved = 0
-        if trips:
-            logger.info(f"Получено {len(trips)} поездок из Toyota API")
-            
-            # Сохранить поездки в базу данных
-            for trip in trips:
-                if trip.start_time and trip.end_time and trip.distance:
-                    # Проверить, есть ли уже эта поездка в базе
-                    existing_trip = await db.get_trip_by_time(trip.start_time)
-                    if not existing_trip:
-                        trip_data = {
-                            'start_time': trip.start_time,
-                            'end_time': trip.end_time,
-                            'distance_total': trip.distance or 0,
-                            'distance_electric': trip.ev_distance or 0,
-                            'fuel_consumed': trip.fuel_consumed or 0,
-                            'electricity_consumed': 0,  # Пока не доступно в API
-                            'start_latitude': trip.locations.start.lat if trip.locations and trip.locations.start else 0.0,
-                            'start_longitude': trip.locations.start.lon if trip.locations and trip.locations.start else 0.0,
-                            'end_latitude': trip.locations.end.lat if trip.locations and trip.locations.end else 0.0,
-                            'end_longitude': trip.locations.end.lon if trip.locations and trip.locations.end else 0.0
-                        }
-                        await db.save_trip(trip_data)
-                        trips_saved += 1
-                        logger.debug(f"Сохранена поездка: {trip.start_time} - {trip.distance} км")
+        total_trips, trips_saved = await save_vehicle_trips(target_vehicle, 30)
         
         return {
             "success": True,
-            "message": f"Собрано {len(trips) if trips else 0} поездок, сохранено {trips_saved} новых",
-            "total_trips": len(trips) if trips else 0,
+            "message": f"Собрано {total_trips} поездок, сохранено {trips_saved} новых",
+            "total_trips": total_trips,
             "new_trips": trips_saved
         }
         
@@ -1564,8 +1967,12 @@ async def test_update_climate_settings(request: dict):
         )
 
 @app.post("/api/test/climate/refresh")
-async def test_refresh_climate_status():
-    """Запросить обновление статуса климата с автомобиля."""
+async def test_refresh_climate_status(wait: float = Query(60, gt=0, le=120)):
+    """Запросить обновление статуса климата с автомобиля и дождаться свежих данных.
+    
+    fresh=false - автомобиль не ответил за wait секунд, data - последние
+    известные данные.
+    """
     try:
         if not toyota_client or not vehicle_vin:
             return JSONResponse(
@@ -1576,11 +1983,15 @@ async def test_refresh_climate_status():
                 }
             )
         
-        result = await toyota_client._api.refresh_climate_status(vin=vehicle_vin)
+        # Запрос обновления и ожидание, пока автомобиль пришлет новые данные
+        target_vehicle = await get_vehicle()
+        climate_status = await target_vehicle.refresh_climate_status_and_wait(timeout=wait)
+        response = target_vehicle._endpoint_data.get("climate_status")
         
         return {
             "success": True,
-            "data": result.model_dump() if hasattr(result, 'model_dump') else str(result)
+            "fresh": climate_status is not None,
+            "data": response.model_dump(mode="json") if response else None
         }
         
     except Exception as e:
@@ -1774,19 +2185,19 @@ async def test_service_history():
         )
 
 @app.get("/api/stats/total")
-async def get_total_stats():
+async def get_total_stats(request: Request):
     """Получить общую статистику за все время."""
     try:
         # Получить общую статистику из базы данных
         total_stats = await db.get_total_statistics()
         
-        return {
+        return json_response(request, {
             "success": True,
             "total_distance": total_stats.get("total_distance", 0),
             "electric_percentage": total_stats.get("electric_percentage", 0),
             "fuel_consumed": total_stats.get("fuel_consumed", 0),
             "cost_savings": total_stats.get("cost_savings", 0)
-        }
+        })
         
     except Exception as e:
         logger.error(f"Ошибка получения общей статистики: {e}")
@@ -1799,7 +2210,7 @@ async def get_total_stats():
         )
 
 @app.get("/api/statistics")
-async def get_statistics():
+async def get_statistics(request: Request):
     """Получить статистику поездок и использования автомобиля."""
     try:
         # Получить общую статистику из базы данных
@@ -1809,7 +2220,7 @@ async def get_statistics():
         stats_30d = await db.get_phev_statistics("30d")
         stats_7d = await db.get_phev_statistics("7d")
         
-        return {
+        return json_response(request, {
             "success": True,
             "total": {
                 "distance": total_stats.get("total_distance", 0),
@@ -1831,7 +2242,7 @@ async def get_statistics():
                 "cost_savings": stats_7d.get("cost_savings", 0),
                 "trips_count": stats_7d.get("trips_count", 0)
             }
-        }
+        })
         
     except Exception as e:
         logger.error(f"Ошибка получения статистики: {e}")
@@ -1849,8 +2260,8 @@ async def get_current_fuel_prices():
     try:
         from fuel_prices import fuel_price_service
         
-        # Получить последнее местоположение из базы данных
-        last_status = await db.get_latest_status()
+        # Последнее местоположение из буфера снимков (база - если буфер пуст)
+        last_status = vehicle_state.latest_dict() or await db.get_latest_status()
         
         if last_status and last_status.get('latitude', 0) != 0 and last_status.get('longitude', 0) != 0:
             # Определить страну по координатам
@@ -1986,29 +2397,25 @@ async def get_system_paths():
 
 # Маршрут для страницы тестирования
 @app.get("/test", response_class=HTMLResponse)
-async def test_page():
+async def test_page(request: Request):
     """Страница тестирования функций автомобиля."""
-    try:
-        with open(paths.get_static_file('test_all.html'), 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
+    if assets.get('test_all.html') is None:
         return HTMLResponse(
             content="<h1>Страница тестирования не найдена</h1>",
             status_code=404
         )
+    return assets.response(request, 'test_all.html')
 
 # Страница диагностики системы
 @app.get("/diagnostics", response_class=HTMLResponse)
-async def diagnostics_page():
+async def diagnostics_page(request: Request):
     """Страница диагностики системы."""
-    try:
-        with open(os.path.join(APP_DIR, 'static', 'diagnostics.html'), 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
+    if assets.get('diagnostics.html') is None:
         return HTMLResponse(
             content="<h1>Страница диагностики не найдена</h1>",
             status_code=404
         )
+    return assets.response(request, 'diagnostics.html')
 
 # Перенаправление с /statistics на /stats для совместимости
 @app.get("/statistics", response_class=HTMLResponse)
@@ -2017,7 +2424,7 @@ async def statistics_redirect():
     return RedirectResponse(url="/stats", status_code=301)
 
 @app.post("/api/command")
-async def execute_command(request: dict):
+async def execute_command(request: dict, wait: float = 0):
     """Универсальный endpoint для выполнения команд управления автомобилем."""
     try:
         command = request.get('command')
@@ -2040,23 +2447,6 @@ async def execute_command(request: dict):
                 }
             )
         
-        # Получить автомобиль
-        vehicles = await toyota_client.get_vehicles()
-        target_vehicle = None
-        for vehicle in vehicles:
-            if vehicle.vin == vehicle_vin:
-                target_vehicle = vehicle
-                break
-        
-        if not target_vehicle:
-            return JSONResponse(
-                status_code=404,
-                content={
-                    "success": False,
-                    "error": f"Автомобиль с VIN {vehicle_vin} не найден"
-                }
-            )
-        
         # Маппинг команд на CommandType
         command_mapping = {
             # Основные команды (скорее всего работают)
@@ -2112,44 +2502,49 @@ async def execute_command(request: dict):
         
         command_type = command_mapping[command]
         
-        # Определить количество сигналов для некоторых команд
-        beeps = 0
-        if command in ['find-vehicle']:
-            beeps = 3
-        elif command in ['sound-horn']:
-            beeps = 1
-        
-        # Выполнить команду
-        logger.info(f"Выполнение команды: {command} -> {command_type}")
+        async def action():
+            target_vehicle = await get_vehicle()
+            
+            # Определить количество сигналов для некоторых команд
+            beeps = 0
+            if command in ['find-vehicle']:
+                beeps = 3
+            elif command in ['sound-horn']:
+                beeps = 1
+        
+            # Выполнить команду
+            logger.info(f"Выполнение команды: {command} -> {command_type}")
+        
+            if beeps > 0:
+                result = await target_vehicle.post_command(command_type, beeps=beeps)
+            else:
+                result = await target_vehicle.post_command(command_type)
+        
+            logger.info(f"Команда {command} выполнена: {result}")
+        
+            # Специальные сообщения для некоторых команд
+            special_messages = {
+                'power-window-front-left-up': 'Команда отправлена для переднего левого окна (может использоваться общая команда окон)',
+                'power-window-front-left-down': 'Команда отправлена для переднего левого окна (может использоваться общая команда окон)',
+                'power-window-front-right-up': 'Команда отправлена для переднего правого окна (может использоваться общая команда окон)',
+                'power-window-front-right-down': 'Команда отправлена для переднего правого окна (может использоваться общая команда окон)',
+                'power-window-rear-left-up': 'Команда отправлена для заднего левого окна (может использоваться общая команда окон)',
+                'power-window-rear-left-down': 'Команда отправлена для заднего левого окна (может использоваться общая команда окон)',
+                'power-window-rear-right-up': 'Команда отправлена для заднего правого окна (может использоваться общая команда окон)',
+                'power-window-rear-right-down': 'Команда отправлена для заднего правого окна (может использоваться общая команда окон)',
+                'ac-off': 'Команда кондиционера отправлена (выключение может требовать отдельной команды)',
+            }
         
-        if beeps > 0:
-            result = await target_vehicle.post_command(command_type, beeps=beeps)
-        else:
-            result = await target_vehicle.post_command(command_type)
-        
-        logger.info(f"Команда {command} выполнена: {result}")
-        
-        # Специальные сообщения для некоторых команд
-        special_messages = {
-            'power-window-front-left-up': 'Команда отправлена для переднего левого окна (может использоваться общая команда окон)',
-            'power-window-front-left-down': 'Команда отправлена для переднего левого окна (может использоваться общая команда окон)',
-            'power-window-front-right-up': 'Команда отправлена для переднего правого окна (может использоваться общая команда окон)',
-            'power-window-front-right-down': 'Команда отправлена для переднего правого окна (может использоваться общая команда окон)',
-            'power-window-rear-left-up': 'Команда отправлена для заднего левого окна (может использоваться общая команда окон)',
-            'power-window-rear-left-down': 'Команда отправлена для заднего левого окна (может использоваться общая команда окон)',
-            'power-window-rear-right-up': 'Команда отправлена для заднего правого окна (может использоваться общая команда окон)',
-            'power-window-rear-right-down': 'Команда отправлена для заднего правого окна (может использоваться общая команда окон)',
-            'ac-off': 'Команда кондиционера отправлена (выключение может требовать отдельной команды)',
-        }
+            message = special_messages.get(command, f"Команда {command} выполнена успешно")
         
-        message = special_messages.get(command, f"Команда {command} выполнена успешно")
+            return {
+                "success": True,
+                "command": command,
+                "message": message,
+                "result": result.model_dump(mode="json") if hasattr(result, 'model_dump') else str(result)
+            }
         
-        return {
-            "success": True,
-            "command": command,
-            "message": message,
-            "result": result.model_dump() if hasattr(result, 'model_dump') else str(result)
-        }
+        return await submit_command(command, action, wait=wait)
         
     except Exception as e:
         logger.error(f"Ошибка выполнения команды {request.get('command', 'unknown')}: {e}")
@@ -2163,100 +2558,18 @@ async def execute_command(request: dict):
         )
 
 @app.get("/test-all")
-async def test_all_page():
+async def test_all_page(request: Request):
     """Страница тестирования всех функций."""
-    try:
-        with open(paths.get_static_file('test_all.html'), 'r', encoding='utf-8') as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
+    if assets.get('test_all.html') is None:
         return HTMLResponse(
             content="<h1>Страница тестирования не найдена</h1>",
             status_code=404
         )
+    return assets.response(request, 'test_all.html')
 
 # События приложения теперь обрабатываются через lifespan
 
-def daily_fuel_price_updater():
-    """Фоновая задача для ежедневного обновления цен на топливо"""
-    def update_prices():
-        try:
-            from fuel_prices import fuel_price_service
-            
-            # Создаем новый event loop для этого потока
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Обновляем цены
-            success = loop.run_until_complete(fuel_price_service.update_prices_cache())
-            
-            if success:
-                logger.info("✅ Автоматическое обновление цен на топливо выполнено успешно")
-            else:
-                logger.warning("⚠️ Не удалось автоматически обновить цены на топливо")
-                
-            loop.close()
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка автоматического обновления цен: {e}")
-    
-    def scheduler():
-        """Планировщик для ежедневного обновления"""
-        while True:
-            try:
-                # Получаем текущее время
-                now = datetime.now()
-                
-                # Планируем обновление на 6:00 утра следующего дня
-                next_update = now.replace(hour=6, minute=0, second=0, microsecond=0)
-                if next_update <= now:
-                    next_update += timedelta(days=1)
-                
-                # Вычисляем время до следующего обновления
-                sleep_seconds = (next_update - now).total_seconds()
-                
-                logger.info(f"📅 Следующее обновление цен на топливо: {next_update.strftime('%Y-%m-%d %H:%M:%S')} (через {sleep_seconds/3600:.1f} часов)")
-                
-                # Ждем до времени обновления
-                time.sleep(sleep_seconds)
-                
-                # Выполняем обновление
-                update_prices()
-                
-            except Exception as e:
-                logger.error(f"Ошибка планировщика обновления цен: {e}")
-                # Ждем час перед повторной попыткой
-                time.sleep(3600)
-    
-    # Запускаем планировщик в отдельном потоке
-    scheduler_thread = threading.Thread(target=scheduler, daemon=True)
-    scheduler_thread.start()
-    
-    # Выполняем первое обновление при запуске (если кэш пустой)
-    try:
-        from fuel_prices import fuel_price_service
-        if not os.path.exists(fuel_price_service.cache_file):
-            logger.info("🔄 Выполняем первоначальное обновление цен на топливо...")
-            
-            # Создаем event loop для первого обновления
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            success = loop.run_until_complete(fuel_price_service.update_prices_cache())
-            
-            if success:
-                logger.info("✅ Первоначальное обновление цен выполнено")
-            else:
-                logger.warning("⚠️ Не удалось выполнить первоначальное обновление цен")
-                
-            loop.close()
-            
-    except Exception as e:
-        logger.error(f"Ошибка первоначального обновления цен: {e}")
-
 if __name__ == "__main__":
-    # Запускаем планировщик обновления цен
-    daily_fuel_price_updater()
-    
     # Запуск сервера
     uvicorn_log_level = config.get('logging', {}).get('level', 'INFO').lower()
     uvicorn.run(
@@ -2264,5 +2577,7 @@ if __name__ == "__main__":
         host=config['server']['host'],
         port=config['server']['port'],
         reload=config['server']['debug'],
+        # Фоновые задачи выполняет один воркер (leader.py), данные общие через SQLite
+        workers=server_config.workers,
         log_level=uvicorn_log_level
     )
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Страницы и статические файлы веб-интерфейса из памяти
+
+При запуске AssetPipeline один раз читает каталог static/, заранее
+сжимает текстовые файлы gzip (и brotli, если установлен пакет brotli)
+и считает хэш содержимого. Ответы отдаются из памяти:
+- сильный ETag для каждого варианта кодирования и 304 на If-None-Match;
+- версия с хэшем в имени (toyota-logo.1a2b3c4d.svg) кэшируется
+  браузером на год, ссылки /static/... в HTML переписываются на нее;
+- страницы и файлы без хэша кэшируются с обязательной проверкой ETag.
+В режиме отладки измененные на диске файлы перечитываются при запросе.
+
+Service worker (static/sw.js) собирается здесь же: в шаблон
+подставляются адреса страниц и файлов интерфейса из манифеста и версия
+кэша от их хэшей, поэтому любое изменение статики обновляет кэш
+установленного приложения.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_URL = "/static/"
+# Шаблон service worker; отдается с корня сайта, чтобы управлять всеми страницами
+SERVICE_WORKER = "sw.js"
+# Файлы с хэшем в имени не меняются: кэш браузера на год
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Страницы и файлы без хэша: хранить, но каждый раз сверять ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Меньшие файлы сжимать невыгодно
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript",
+                      "application/manifest+json", "image/svg+xml")
+
+class Asset:
+    """Файл в памяти: исходное содержимое и заранее сжатые варианты."""
+    
+    def __init__(self, name: str, path: str, content: bytes):
+        self.name = name
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.digest = hashlib.sha256(content).hexdigest()[:16]
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{self.digest[:8]}{ext}"
+        self.media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.media_type.startswith("text/") or self.media_type == "application/json":
+            self.media_type += "; charset=utf-8"
+        # Кодирование -> (тело, ETag)
+        self.variants: Dict[str, tuple] = {"identity": (content, f'"{self.digest}"')}
+        if self.media_type.startswith(COMPRESSIBLE_TYPES) and len(content) >= MIN_COMPRESS_SIZE:
+            self._add_variant("gzip", gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._add_variant("br", brotli.compress(content, quality=11))
+    
+    def _add_variant(self, encoding: str, body: bytes):
+        if len(body) < len(self.variants["identity"][0]):
+            self.variants[encoding] = (body, f'"{self.digest}-{encoding}"')
+    
+    def select(self, accept_encoding: str) -> tuple:
+        """Лучший вариант для Accept-Encoding: (кодирование, тело, ETag)."""
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return (encoding,) + self.variants[encoding]
+        return ("identity",) + self.variants["identity"]
+    
+    def etags(self):
+        return {etag for _, etag in self.variants.values()}
+
+class AssetPipeline:
+    """Загрузка, сжатие и выдача страниц и статических файлов из памяти."""
+    
+    def __init__(self, directory: str, debug: bool = False,
+                 shell_pages: Optional[Dict[str, str]] = None):
+        self.directory = directory
+        self.debug = debug
+        # Страницы приложения для работы без сети: URL -> файл
+        self.shell_pages = shell_pages or {}
+        self.assets: Dict[str, Asset] = {}
+        self.hashed: Dict[str, str] = {}
+    
+    def load(self):
+        """Прочитать каталог целиком и построить манифест хэшированных имен."""
+        sources = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    sources[name] = (path, f.read())
+        
+        # Сначала файлы, на которые ссылаются страницы: их хэши нужны для HTML
+        assets = {name: Asset(name, path, content)
+                  for name, (path, content) in sources.items()
+                  if not name.endswith(".html") and name != SERVICE_WORKER}
+        manifest = {name: asset.hashed_name for name, asset in assets.items()}
+        for name, (path, content) in sources.items():
+            if name.endswith(".html"):
+                assets[name] = Asset(name, path, self._rewrite_links(content, manifest))
+        if SERVICE_WORKER in sources:
+            path, content = sources[SERVICE_WORKER]
+            assets[SERVICE_WORKER] = Asset(SERVICE_WORKER, path, self._build_service_worker(content, assets))
+        
+        self.assets = assets
+        self.hashed = {asset.hashed_name: name for name, asset in assets.items()}
+        total = sum(len(asset.variants["identity"][0]) for asset in assets.values())
+        logger.info(f"Статические файлы загружены в память: {len(assets)} файлов, {total} байт"
+                    f"{', brotli' if brotli else ''}")
+    
+    @staticmethod
+    def _rewrite_links(content: bytes, manifest: Dict[str, str]) -> bytes:
+        """Заменить ссылки /static/<файл> на имена с хэшем содержимого."""
+        def replace(match):
+            name = match.group(1).decode("utf-8")
+            return (STATIC_URL + manifest[name]).encode("utf-8") if name in manifest else match.group(0)
+        return re.sub(rb'/static/([\w./-]+)', replace, content)
+    
+    def _build_service_worker(self, template: bytes, assets: Dict[str, Asset]) -> bytes:
+        """Подставить в шаблон service worker список предзагрузки и версию кэша."""
+        static = sorted(name for name in assets if not name.endswith(".html") and name != SERVICE_WORKER)
+        pages = [(url, name) for url, name in self.shell_pages.items() if name in assets]
+        urls = [url for url, _ in pages] + [STATIC_URL + assets[name].hashed_name for name in static]
+        # Версия меняется вместе с любой страницей или файлом из списка
+        fingerprint = "".join(assets[name].digest for name in [name for _, name in pages] + static)
+        version = hashlib.sha256(fingerprint.encode("ascii")).hexdigest()[:12]
+        
+        content = template.decode("utf-8")
+        content = re.sub(r"const CACHE_VERSION = [^;]*;", f"const CACHE_VERSION = '{version}';", content, count=1)
+        content = re.sub(r"const PRECACHE_URLS = [^;]*;", lambda _: f"const PRECACHE_URLS = {json.dumps(urls)};",
+                         content, count=1)
+        return content.encode("utf-8")
+    
+    def _is_modified(self) -> bool:
+        for asset in self.assets.values():
+            try:
+                if os.path.getmtime(asset.path) != asset.mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+    
+    def get(self, name: str) -> Optional[Asset]:
+        """Файл по имени (в том числе хэшированному) или None."""
+        if not self.assets or (self.debug and self._is_modified()):
+            self.load()
+        return self.assets.get(name) or self.assets.get(self.hashed.get(name, ""))
+    
+    def url(self, name: str) -> str:
+        """URL версии файла с хэшем в имени."""
+        asset = self.get(name)
+        return STATIC_URL + (asset.hashed_name if asset else name)
+    
+    def response(self, request: Request, name: str, cache_control: Optional[str] = None) -> Response:
+        """Ответ с файлом: 304 по ETag, сжатый вариант по Accept-Encoding."""
+        asset = self.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        if cache_control is None:
+            cache_control = IMMUTABLE_CACHE_CONTROL if name == asset.hashed_name else REVALIDATE_CACHE_CONTROL
+        
+        encoding, body, etag = asset.select(request.headers.get("accept-encoding", ""))
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            candidates = {tag.strip() for tag in if_none_match.split(",")}
+            # Любой вариант кодирования означает то же содержимое
+            if "*" in candidates or candidates & asset.etags():
+                return Response(status_code=304, headers=headers)
+        
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,189 @@
+"""
+Резервное копирование базы данных Toyota Dashboard
+
+Копия снимается штатным онлайн-API резервного копирования SQLite
+небольшими порциями страниц в отдельном потоке и отдельном соединении:
+цикл событий и сборщик данных продолжают работать, а между порциями
+блокировка базы отпускается. Готовая копия проверяется (integrity_check,
+версия схемы, открытие таблиц), при необходимости сжимается gzip,
+старые копии удаляются по количеству.
+"""
+
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from models import BackupConfig
+from paths import paths
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = "toyota_"
+# Таблицы, которые должны читаться в проверенной копии
+VERIFY_TABLES = ("vehicle_status", "trips", "commands", "notifications")
+
+class BackupError(Exception):
+    """Ошибка создания, проверки или восстановления резервной копии."""
+
+class BackupManager:
+    """Создание, ротация, проверка и восстановление резервных копий."""
+    
+    def __init__(self, db_path: str, config: Optional[BackupConfig] = None):
+        self.db_path = db_path
+        self.config = config or BackupConfig()
+        self._lock = asyncio.Lock()
+    
+    @property
+    def directory(self) -> str:
+        return self.config.directory or os.path.dirname(paths.get_backup_path("x"))
+    
+    def list_backups(self) -> List[str]:
+        """Резервные копии от новых к старым."""
+        backups = []
+        for suffix in (".db", ".db.gz"):
+            backups += glob.glob(os.path.join(self.directory, f"{BACKUP_PREFIX}*{suffix}"))
+        return sorted(backups, key=os.path.getmtime, reverse=True)
+    
+    def seconds_until_due(self) -> float:
+        """Сколько ждать до следующей плановой копии (0 - пора)."""
+        backups = self.list_backups()
+        if not backups:
+            return 0
+        age = time.time() - os.path.getmtime(backups[0])
+        return max(0.0, self.config.interval_hours * 3600 - age)
+    
+    async def create_backup(self) -> Dict:
+        """Снять, проверить, сжать копию и удалить лишние старые."""
+        async with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{BACKUP_PREFIX}{datetime.now():%Y%m%d_%H%M%S}.db"
+            target = os.path.join(self.directory, name)
+            partial = target + ".partial"
+            
+            started = time.monotonic()
+            try:
+                pages = await asyncio.to_thread(self._copy_online, partial)
+                if self.config.verify:
+                    await asyncio.to_thread(self._verify_database, partial)
+                if self.config.compress:
+                    await asyncio.to_thread(self._gzip, partial, partial + ".gz")
+                    os.remove(partial)
+                    partial, target = partial + ".gz", target + ".gz"
+                os.replace(partial, target)
+            except Exception:
+                for leftover in (partial, partial + ".gz"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                raise
+            
+            removed = self._rotate()
+            result = {
+                "path": target,
+                "bytes": os.path.getsize(target),
+                "pages": pages,
+                "seconds": round(time.monotonic() - started, 2),
+                "verified": self.config.verify,
+                "removed": removed,
+            }
+            logger.info(f"Резервная копия создана: {result}")
+            return result
+    
+    def _copy_online(self, destination: str) -> int:
+        """Онлайн-копирование порциями по pages_per_step страниц."""
+        source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        target = sqlite3.connect(destination)
+        copied = {"pages": 0}
+        
+        def progress(status, remaining, total):
+            copied["pages"] = total - remaining
+        
+        try:
+            # sleep - пауза между порциями, в это время база доступна для записи
+            source.backup(target, pages=self.config.pages_per_step, progress=progress,
+                          sleep=self.config.step_pause)
+            # Копия - самостоятельный файл, без журнала WAL рядом
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+        return copied["pages"]
+    
+    @staticmethod
+    def _verify_database(path: str) -> Dict:
+        """Проверить файл базы: целостность, версия схемы, чтение таблиц."""
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                raise BackupError(f"Проверка целостности не пройдена: {result}")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in VERIFY_TABLES}
+        except sqlite3.DatabaseError as e:
+            raise BackupError(f"Копия не читается: {e}")
+        finally:
+            conn.close()
+        return {"schema_version": version, "rows": counts}
+    
+    @staticmethod
+    def _gzip(source: str, destination: str):
+        with open(source, "rb") as src, gzip.open(destination, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    
+    def _rotate(self) -> List[str]:
+        """Удалить копии сверх config.keep."""
+        removed = []
+        for path in self.list_backups()[self.config.keep:]:
+            try:
+                os.remove(path)
+                removed.append(os.path.basename(path))
+            except OSError as e:
+                logger.warning(f"Не удалось удалить старую резервную копию {path}: {e}")
+        return removed
+    
+    def verify_backup(self, backup_path: str) -> Dict:
+        """Проверить резервную копию (в т.ч. сжатую) без изменения базы."""
+        with tempfile.TemporaryDirectory(prefix="toyota-restore-") as tmp:
+            return self._verify_database(self._unpack(backup_path, tmp))
+    
+    def restore(self, backup_path: str, target_path: Optional[str] = None) -> Dict:
+        """Восстановить базу из копии. Сервер должен быть остановлен.
+        
+        Копия распаковывается и проверяется во временном каталоге, затем
+        атомарно заменяет файл базы. Прежняя база сохраняется рядом
+        с суффиксом .before-restore.
+        """
+        target_path = target_path or self.db_path
+        target_dir = os.path.dirname(os.path.abspath(target_path))
+        with tempfile.TemporaryDirectory(prefix="toyota-restore-", dir=target_dir) as tmp:
+            unpacked = self._unpack(backup_path, tmp)
+            info = self._verify_database(unpacked)
+            if os.path.exists(target_path):
+                shutil.copy2(target_path, target_path + ".before-restore")
+            # Журнал WAL прежней базы не должен примениться к восстановленной
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(target_path + suffix):
+                    os.remove(target_path + suffix)
+            os.replace(unpacked, target_path)
+        logger.info(f"База восстановлена из {backup_path}: {info}")
+        return info
+    
+    @staticmethod
+    def _unpack(backup_path: str, directory: str) -> str:
+        if not os.path.exists(backup_path):
+            raise BackupError(f"Резервная копия не найдена: {backup_path}")
+        destination = os.path.join(directory, "restore.db")
+        if backup_path.endswith(".gz"):
+            with gzip.open(backup_path, "rb") as src, open(destination, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            shutil.copy2(backup_path, destination)
+        return destination
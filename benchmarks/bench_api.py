@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест API Toyota Dashboard
+
+Запускает приложение в процессе (ASGI-транспорт httpx, без сети и без
+Toyota API) на базе из benchmarks/datagen.py и держит --concurrency
+одновременных клиентов на каждом endpoint в течение --duration секунд.
+Для каждого endpoint выводятся запросы в секунду, задержки p50/p95 и
+байты ответа на проводе (клиент принимает gzip и br, как браузер).
+С --revalidate клиенты повторяют запрос с If-None-Match, как
+service worker и браузерный кэш.
+
+Сравнение до/после изменения:
+    python benchmarks/bench_api.py --db /tmp/bench.db --json before.json
+    python benchmarks/bench_api.py --db /tmp/bench.db --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import generate_history  # noqa: E402
+from database import DatabaseManager  # noqa: E402
+
+ENDPOINTS = (
+    "/api/vehicle/status",
+    "/api/bootstrap",
+    "/api/stats/phev?period=month",
+    "/api/stats/total",
+    "/api/statistics",
+    "/api/trips?limit=50",
+    "/api/history/trips?limit=50",
+    "/api/history/series?metrics=battery_level,fuel_level&points=500",
+)
+
+async def load_endpoint(client, path: str, concurrency: int, duration: float, revalidate: bool) -> Dict:
+    """concurrency клиентов запрашивают path по кругу duration секунд."""
+    latencies: List[float] = []
+    wire_bytes: List[int] = []
+    statuses: Dict[int, int] = {}
+    deadline = time.perf_counter() + duration
+    
+    async def worker():
+        etag = None
+        while time.perf_counter() < deadline:
+            headers = {"Accept-Encoding": "gzip, br"}
+            if revalidate and etag:
+                headers["If-None-Match"] = etag
+            begin = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append((time.perf_counter() - begin) * 1000)
+            wire_bytes.append(response.num_bytes_downloaded)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            etag = response.headers.get("etag") or etag
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "wire_bytes": round(statistics.fmean(wire_bytes)),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+async def run_load(db_path: str, concurrency: int, duration: float, revalidate: bool) -> Dict[str, Dict]:
+    import httpx
+    import app as app_module
+    from toyota_client import toyota_client
+    from vehicle_state import status_snapshot, vehicle_state
+    
+    # Только локальные данные: Toyota API не вызывается
+    toyota_client.client = None
+    toyota_client.config_path = os.path.join(tempfile.gettempdir(), "toyota-bench-missing-config.yaml")
+    db = DatabaseManager(db_path)
+    await db.init_database()
+    app_module.db = db
+    await vehicle_state.warm(db)
+    status_snapshot.set(app_module.fallback_vehicle_status())
+    if hasattr(app_module, "vehicle_capabilities"):
+        app_module.vehicle_capabilities.update({"power_windows": True, "door_lock_unlock": True})
+    
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in ENDPOINTS:
+                # Прогрев: кэши SQLite и первая компиляция запросов
+                await client.get(path)
+                results[path] = await load_endpoint(client, path, concurrency, duration, revalidate)
+                result = results[path]
+                print(f"  {path:<66}{result['rps']:>9.1f} rps  p50 {result['p50_ms']:>7.2f} мс"
+                      f"  p95 {result['p95_ms']:>7.2f} мс  {result['wire_bytes']:>8} байт")
+    finally:
+        await db.close()
+    return results
+
+def compare(report: Dict, baseline: Dict):
+    """Сравнить пропускную способность и объем ответов с базовым прогоном."""
+    print("\nСравнение с базовым прогоном:")
+    for path, result in report["results"].items():
+        before = baseline.get("results", {}).get(path)
+        if not before:
+            continue
+        ratio = result["rps"] / before["rps"] if before["rps"] else 1.0
+        print(f"  {path:<66}{before['rps']:>9.1f} -> {result['rps']:>9.1f} rps ({ratio:.2f}x)"
+              f"  {before['wire_bytes']:>8} -> {result['wire_bytes']:>8} байт")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API")
+    parser.add_argument("--db", help="Готовая база (иначе генерируется во временный каталог)")
+    parser.add_argument("--days", type=int, default=1095, help="Длина генерируемой истории, дни")
+    parser.add_argument("--trips", type=int, default=10000, help="Число генерируемых поездок")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=10, help="Одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=5.0, help="Секунд нагрузки на endpoint")
+    parser.add_argument("--revalidate", action="store_true", help="Повторные запросы с If-None-Match")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix="toyota-bench-") as tmp:
+        db_path = args.db
+        if not db_path or not os.path.exists(db_path):
+            db_path = db_path or os.path.join(tmp, "bench.db")
+            print(f"Генерация истории: {args.days} дней, ~{args.trips} поездок -> {db_path}")
+            generate_history(db_path, days=args.days, trips=args.trips, seed=args.seed)
+        
+        print(f"Нагрузка: {args.concurrency} клиентов, {args.duration} с на endpoint"
+              f"{', с If-None-Match' if args.revalidate else ''}")
+        report = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "revalidate": args.revalidate,
+            "results": asyncio.run(run_load(db_path, args.concurrency, args.duration, args.revalidate)),
+        }
+    
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.json_path}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк DatabaseManager на многолетней истории
+
+Замеряет методы DatabaseManager, cleanup_old_data и API статистики
+на базе из benchmarks/datagen.py (по умолчанию 3 года опроса раз
+в 5 минут и ~10 тыс. поездок). Результаты сохраняются в JSON и могут
+сравниваться с предыдущим прогоном для поиска регрессий.
+
+Запуск:
+    python benchmarks/bench_database.py --json results.json
+    python benchmarks/bench_database.py --db /tmp/bench.db --compare results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import HOME, generate_history  # noqa: E402
+from database import DatabaseManager  # noqa: E402
+from models import RetentionConfig, VehicleStatus  # noqa: E402
+from timeseries import downsample_stream  # noqa: E402
+
+async def measure(fn: Callable[[], Awaitable], repeats: int) -> Dict[str, float]:
+    """Время вызова fn в миллисекундах: минимум, медиана, среднее."""
+    timings = []
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - begin) * 1000)
+    return {
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "repeats": repeats,
+    }
+
+async def bench_read_methods(db: DatabaseManager, repeats: int) -> Dict[str, Dict]:
+    """Методы чтения на исходной базе."""
+    now = datetime.now()
+    month_ago = now - timedelta(days=30)
+    year_ago = now - timedelta(days=365)
+    
+    # Курсор глубоко в истории: пролистывание не должно дорожать
+    page = await db.get_trips_page(limit=50, end=now - timedelta(days=900))
+    deep_cursor = page["next_cursor"]
+    
+    async def metric_series():
+        start, end = int(year_ago.timestamp()), int(now.timestamp())
+        await downsample_stream(db.iter_metric_points("battery_level", start, end), start, end, 500)
+    
+    cases = {
+        "get_latest_status": lambda: db.get_latest_status(),
+        "get_status_at": lambda: db.get_status_at(month_ago),
+        "get_recent_trips": lambda: db.get_recent_trips(50),
+        "get_recent_trips_json": lambda: db.get_recent_trips_json(50),
+        "get_trips_page_first": lambda: db.get_trips_page(limit=50),
+        "get_trips_page_deep": lambda: db.get_trips_page(limit=50, cursor=deep_cursor),
+        "get_status_page": lambda: db.get_status_page(limit=200, start=month_ago),
+        "get_commands_page": lambda: db.get_commands_page(limit=50),
+        "get_recent_commands": lambda: db.get_recent_commands(50),
+        "get_unread_notifications": lambda: db.get_unread_notifications(),
+        "get_phev_statistics_week": lambda: db.get_phev_statistics("week"),
+        "get_phev_statistics_year": lambda: db.get_phev_statistics("year"),
+        "get_phev_statistics_all": lambda: db.get_phev_statistics("all"),
+        "get_phev_statistics_by_dates": lambda: db.get_phev_statistics_by_dates(
+            year_ago.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d")),
+        "get_total_statistics": lambda: db.get_total_statistics(),
+        "get_daily_summary": lambda: db.get_daily_summary(month_ago),
+        "find_trips_near": lambda: db.find_trips_near(*HOME, radius_km=0.5),
+        "find_positions_near": lambda: db.find_positions_near(*HOME, radius_km=0.2),
+        "get_parking_locations": lambda: db.get_parking_locations(),
+        "metric_series_365d_lttb": metric_series,
+    }
+    results = {}
+    for name, fn in cases.items():
+        results[name] = await measure(fn, repeats)
+        print(f"  {name:<32}{results[name]['median_ms']:>10.2f} мс")
+    return results
+
+async def bench_write_methods(db: DatabaseManager, repeats: int) -> Dict[str, Dict]:
+    """Методы записи (выполняются на копии базы)."""
+    latest = await db.get_latest_status()
+    counter = {"moment": datetime.now()}
+    
+    async def save_status():
+        counter["moment"] += timedelta(minutes=5)
+        await db.save_vehicle_status(VehicleStatus(
+            timestamp=counter["moment"],
+            battery_level=(latest or {}).get("battery_level"),
+            fuel_level=(latest or {}).get("fuel_level"),
+            latitude=HOME[0], longitude=HOME[1], locked=True,
+            engine_running=False, climate_on=False,
+        ))
+    
+    cases = {
+        "save_vehicle_status": save_status,
+        "save_command": lambda: db.save_command("door_lock", "success", {"payload": {"returnCode": "000000"}}),
+        "add_notification": lambda: db.add_notification("system", "Бенчмарк", "Проверка записи"),
+    }
+    results = {}
+    for name, fn in cases.items():
+        results[name] = await measure(fn, repeats)
+        print(f"  {name:<32}{results[name]['median_ms']:>10.2f} мс")
+    
+    # Первый проход на многолетней истории сворачивает почти всю таблицу
+    results["cleanup_old_data_first"] = await measure(db.cleanup_old_data, 1)
+    results["cleanup_old_data_repeat"] = await measure(db.cleanup_old_data, max(1, repeats // 5))
+    for name in ("cleanup_old_data_first", "cleanup_old_data_repeat"):
+        print(f"  {name:<32}{results[name]['median_ms']:>10.2f} мс")
+    return results
+
+async def bench_endpoints(db: DatabaseManager, repeats: int) -> Dict[str, Dict]:
+    """API статистики через ASGI-транспорт, без сети."""
+    import httpx
+    import app as app_module
+    from toyota_client import toyota_client
+    
+    # Статистика должна считаться по локальной базе, а не через Toyota API
+    toyota_client.client = None
+    toyota_client.config_path = os.path.join(tempfile.gettempdir(), "toyota-bench-missing-config.yaml")
+    app_module.db = db
+    
+    transport = httpx.ASGITransport(app=app_module.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("/api/stats/phev?period=month", "/api/stats/total", "/api/statistics",
+                     "/api/trips?limit=50", "/api/history/trips?limit=50",
+                     "/api/history/series?metrics=battery_level,fuel_level&points=500"):
+            async def request(path=path):
+                response = await client.get(path)
+                response.raise_for_status()
+            results[path] = await measure(request, repeats)
+            print(f"  {path:<60}{results[path]['median_ms']:>10.2f} мс")
+    return results
+
+async def run_suite(db_path: str, repeats: int, endpoints: bool) -> Dict:
+    report = {}
+    db = DatabaseManager(db_path)
+    await db.init_database()
+    try:
+        print("Чтение:")
+        report["read"] = await bench_read_methods(db, repeats)
+        if endpoints:
+            print("API:")
+            report["endpoints"] = await bench_endpoints(db, repeats)
+    finally:
+        await db.close()
+    
+    # Запись и очистка меняют базу - работаем на копии
+    with tempfile.TemporaryDirectory(prefix="toyota-bench-") as tmp:
+        copy_path = os.path.join(tmp, "copy.db")
+        shutil.copy(db_path, copy_path)
+        # Без пауз между транзакциями очистки: замеряется работа базы, а не asyncio.sleep
+        db = DatabaseManager(copy_path, retention=RetentionConfig(batch_pause=0))
+        await db.init_database()
+        try:
+            print("Запись:")
+            report["write"] = await bench_write_methods(db, repeats)
+        finally:
+            await db.close()
+    return report
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> int:
+    """Сравнить медианы с базовым прогоном, вернуть число регрессий."""
+    regressions = 0
+    print(f"\nСравнение с базовым прогоном (порог {threshold:.0%}):")
+    for group, cases in report["results"].items():
+        for name, result in cases.items():
+            before = baseline.get("results", {}).get(group, {}).get(name)
+            if not before:
+                continue
+            ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else 1.0
+            mark = ""
+            if ratio > 1 + threshold:
+                mark = "  <- регрессия"
+                regressions += 1
+            elif ratio < 1 - threshold:
+                mark = "  <- ускорение"
+            print(f"  {group}/{name:<40}{before['median_ms']:>10.2f} -> {result['median_ms']:>10.2f} мс"
+                  f" ({ratio:.2f}x){mark}")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк DatabaseManager")
+    parser.add_argument("--db", help="Готовая база (иначе генерируется во временный каталог)")
+    parser.add_argument("--days", type=int, default=1095, help="Длина генерируемой истории, дни")
+    parser.add_argument("--trips", type=int, default=10000, help="Число генерируемых поездок")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeats", type=int, default=20, help="Повторов каждого замера")
+    parser.add_argument("--skip-endpoints", action="store_true", help="Не замерять API (без импорта app)")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое замедление (0.2 = 20%%)")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix="toyota-bench-") as tmp:
+        db_path = args.db
+        if not db_path or not os.path.exists(db_path):
+            db_path = db_path or os.path.join(tmp, "bench.db")
+            print(f"Генерация истории: {args.days} дней, ~{args.trips} поездок -> {db_path}")
+            generate_history(db_path, days=args.days, trips=args.trips, seed=args.seed)
+        
+        with sqlite3.connect(db_path) as conn:
+            rows = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("vehicle_status", "trips", "commands", "notifications")}
+        report = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "sqlite_version": sqlite3.sqlite_version,
+            "python": sys.version.split()[0],
+            "rows": rows,
+            "file_bytes": os.path.getsize(db_path),
+            "results": asyncio.run(run_suite(db_path, args.repeats, not args.skip_endpoints)),
+        }
+    
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.json_path}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
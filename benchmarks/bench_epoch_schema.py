@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк схемы хранения времени: ISO-текст против секунд эпохи (INTEGER)
+
+Создает две временные базы с одинаковыми данными vehicle_status
+(по умолчанию ~3 года опроса раз в 5 минут) и сравнивает:
+- время диапазонных запросов по idx_vehicle_status_timestamp;
+- время агрегации по дням (бывший GROUP BY DATE(timestamp));
+- размер индекса по времени.
+
+Запуск:
+    python benchmarks/bench_epoch_schema.py --rows 300000 --json results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+STATUS_TABLE = """
+    CREATE TABLE vehicle_status (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp {time_type} NOT NULL,
+        battery_level INTEGER,
+        fuel_level INTEGER,
+        range_electric INTEGER,
+        range_fuel INTEGER,
+        latitude REAL,
+        longitude REAL,
+        locked BOOLEAN,
+        engine_running BOOLEAN,
+        climate_on BOOLEAN,
+        temperature_inside REAL,
+        temperature_outside REAL,
+        raw_data TEXT
+    )
+"""
+
+def build_database(path: str, epoch: bool, rows: int, interval: int, seed: int):
+    """Создать базу с тестовыми данными в одном из форматов времени."""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(STATUS_TABLE.format(time_type="INTEGER" if epoch else "DATETIME"))
+    start = datetime(2022, 1, 1)
+    
+    def generate():
+        battery = 80
+        for i in range(rows):
+            moment = start + timedelta(seconds=i * interval)
+            battery = max(5, min(100, battery + rnd.choice((-1, 0, 0, 1))))
+            timestamp = int(moment.timestamp()) if epoch else moment.isoformat(" ")
+            yield (timestamp, battery, rnd.randint(10, 100), battery // 2, rnd.randint(100, 600),
+                   45.54 + rnd.random() / 100, 13.71 + rnd.random() / 100,
+                   1, 0, 0, 20.0, 15.0, None)
+    
+    conn.executemany("""
+        INSERT INTO vehicle_status (
+            timestamp, battery_level, fuel_level, range_electric, range_fuel,
+            latitude, longitude, locked, engine_running, climate_on,
+            temperature_inside, temperature_outside, raw_data
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, generate())
+    conn.execute("CREATE INDEX idx_vehicle_status_timestamp ON vehicle_status(timestamp)")
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    return conn, start
+
+def index_size(conn: sqlite3.Connection) -> int:
+    """Размер индекса по времени в байтах (через dbstat, если доступен)."""
+    try:
+        row = conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'idx_vehicle_status_timestamp'"
+        ).fetchone()
+        return int(row[0] or 0)
+    except sqlite3.OperationalError:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.execute("DROP INDEX idx_vehicle_status_timestamp")
+        conn.execute("VACUUM")
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.execute("CREATE INDEX idx_vehicle_status_timestamp ON vehicle_status(timestamp)")
+        return (before - after) * page_size
+
+def time_queries(conn: sqlite3.Connection, epoch: bool, start: datetime, rows: int,
+                 interval: int, repeats: int, seed: int) -> dict:
+    """Замерить типичные запросы, возвращает среднее время в миллисекундах."""
+    rnd = random.Random(seed)
+    span = rows * interval
+    
+    def bound(moment: datetime):
+        return int(moment.timestamp()) if epoch else moment.isoformat(" ")
+    
+    results = {}
+    for label, days in (("range_1d", 1), ("range_30d", 30), ("range_365d", 365)):
+        elapsed = 0.0
+        for _ in range(repeats):
+            offset = rnd.randint(0, max(0, span - days * 86400))
+            low = start + timedelta(seconds=offset)
+            high = low + timedelta(days=days)
+            begin = time.perf_counter()
+            conn.execute(
+                "SELECT timestamp, battery_level FROM vehicle_status "
+                "WHERE timestamp >= ? AND timestamp < ?",
+                (bound(low), bound(high)),
+            ).fetchall()
+            elapsed += time.perf_counter() - begin
+        results[label] = round(elapsed / repeats * 1000, 3)
+    
+    # Границы локальных суток, как у DATE() от записанного локального времени
+    day_expression = "DATE(timestamp, 'unixepoch', 'localtime')" if epoch else "DATE(timestamp)"
+    begin = time.perf_counter()
+    conn.execute(f"SELECT MAX(id) FROM vehicle_status GROUP BY {day_expression}").fetchall()
+    results["group_by_day"] = round((time.perf_counter() - begin) * 1000, 3)
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сравнение ISO-текста и epoch-времени в SQLite")
+    parser.add_argument("--rows", type=int, default=300_000, help="Количество строк vehicle_status")
+    parser.add_argument("--interval", type=int, default=300, help="Интервал опроса, секунды")
+    parser.add_argument("--repeats", type=int, default=50, help="Повторов каждого запроса")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+    
+    report = {"rows": args.rows, "sqlite_version": sqlite3.sqlite_version}
+    with tempfile.TemporaryDirectory(prefix="toyota-bench-") as tmp:
+        for name, epoch in (("iso_text", False), ("epoch_int", True)):
+            path = os.path.join(tmp, f"{name}.db")
+            conn, start = build_database(path, epoch, args.rows, args.interval, args.seed)
+            report[name] = {
+                "index_bytes": index_size(conn),
+                "file_bytes": os.path.getsize(path),
+                "queries_ms": time_queries(conn, epoch, start, args.rows, args.interval,
+                                           args.repeats, args.seed),
+            }
+            conn.close()
+    
+    text, epoch = report["iso_text"], report["epoch_int"]
+    print(f"Строк: {args.rows}, SQLite {sqlite3.sqlite_version}")
+    print(f"{'метрика':<18}{'ISO-текст':>14}{'epoch':>14}{'выигрыш':>10}")
+    rows = [("index_bytes", text["index_bytes"], epoch["index_bytes"]),
+            ("file_bytes", text["file_bytes"], epoch["file_bytes"])]
+    rows += [(key, text["queries_ms"][key], epoch["queries_ms"][key]) for key in text["queries_ms"]]
+    for key, before, after in rows:
+        ratio = f"{before / after:.2f}x" if after else "-"
+        print(f"{key:<18}{before:>14}{after:>14}{ratio:>10}")
+    
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.json_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Время холодного запуска Toyota Dashboard
+
+Два измерения в отдельных процессах интерпретатора:
+
+- импорт app под python -X importtime: общее время и самые дорогие
+  пакеты (собственное время модулей, сложенное по пакету верхнего
+  уровня) и модули (накопленное время);
+- время до первого ответа: от запуска uvicorn app:app до первого
+  успешного ответа --path (импорт, lifespan, открытие базы).
+
+Процессы запускаются с HOME во временном каталоге: конфигурация
+копируется из каталога приложения, база создается заново при первом
+(неучитываемом) прогоне, реальные данные не затрагиваются. Без учетных
+данных Toyota клиент pytoyoda не загружается; --credentials подставляет
+фиктивные (без автоматического сбора данных), чтобы его загрузка вошла
+в замер. Бюджет на Raspberry Pi - первый ответ меньше чем за 1 секунду:
+    python benchmarks/bench_startup.py --credentials --budget 1.0
+    python benchmarks/bench_startup.py --json before.json
+    python benchmarks/bench_startup.py --compare before.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import yaml
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def isolated_env(home: str, credentials: bool) -> Dict[str, str]:
+    """Окружение процесса приложения с отдельным HOME."""
+    env = dict(os.environ, HOME=home, TMPDIR=os.path.join(home, "tmp"))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    os.makedirs(env["TMPDIR"], exist_ok=True)
+    
+    if credentials:
+        # Конфигурация в HOME имеет приоритет над каталогом приложения (paths.py)
+        source = os.path.join(APP_DIR, "config.yaml")
+        if not os.path.exists(source):
+            source = os.path.join(APP_DIR, "config.example.yaml")
+        with open(source, encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+        config.setdefault("toyota", {}).update(username="bench@example.invalid", password="bench")
+        # Клиент создается, но к Toyota API никто не обращается
+        config.setdefault("monitoring", {})["auto_refresh"] = False
+        config_dir = os.path.join(home, ".config", "toyota-dashboard")
+        os.makedirs(config_dir, exist_ok=True)
+        with open(os.path.join(config_dir, "config.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f, allow_unicode=True)
+    return env
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Строки -X importtime -> [(модуль, собственное мкс, накопленное мкс)]."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # заголовок
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def profile_imports(module: str, env: Dict[str, str], top: int) -> Dict:
+    """Импортировать module под -X importtime и свести время по пакетам."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт {module} завершился ошибкой:\n{result.stderr[-2000:]}")
+    modules = parse_importtime(result.stderr)
+    total = next((cumulative for name, _, cumulative in reversed(modules) if name == module), 0)
+    
+    packages: Dict[str, int] = {}
+    for name, self_us, _ in modules:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    heaviest = sorted(modules, key=lambda item: item[2], reverse=True)
+    return {
+        "total_ms": round(total / 1000, 1),
+        "modules": len(modules),
+        "packages": {name: round(us / 1000, 1)
+                     for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]},
+        "cumulative": {name: round(cumulative / 1000, 1) for name, _, cumulative in heaviest[:top]},
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def time_to_first_request(path: str, env: Dict[str, str], timeout: float) -> float:
+    """Секунд от запуска uvicorn до первого ответа 2xx на path."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "error"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn завершился с кодом {process.returncode}:\n"
+                                   f"{process.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if 200 <= response.status < 300:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"Нет ответа {url} за {timeout} с")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def compare(report: Dict, baseline: Dict):
+    """Сравнить с предыдущим прогоном."""
+    print("\nСравнение с базовым прогоном:")
+    for key, label in (("import_ms", "импорт app"), ("first_request_ms", "первый ответ")):
+        before, after = baseline.get(key), report.get(key)
+        if before and after:
+            print(f"  {label:<20}{before:>9.1f} -> {after:>9.1f} мс ({after / before:.2f}x)")
+    before_packages = baseline.get("imports", {}).get("packages", {})
+    for name, after in report["imports"]["packages"].items():
+        if name in before_packages:
+            print(f"    {name:<30}{before_packages[name]:>9.1f} -> {after:>9.1f} мс")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Время холодного запуска")
+    parser.add_argument("--runs", type=int, default=5, help="Число запусков (медиана)")
+    parser.add_argument("--path", default="/api/health", help="Первый запрос")
+    parser.add_argument("--top", type=int, default=15, help="Сколько пакетов и модулей показать")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Предел ожидания первого ответа, с")
+    parser.add_argument("--credentials", action="store_true",
+                        help="Фиктивные учетные данные Toyota: в замер входит загрузка клиента pytoyoda")
+    parser.add_argument("--budget", type=float, help="Код возврата 1, если медиана первого ответа больше (с)")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix="toyota-startup-") as home:
+        env = isolated_env(home, args.credentials)
+        # Прогрев: .pyc, каталоги, конфигурация и новая база не входят в замеры
+        time_to_first_request(args.path, env, args.timeout)
+        
+        imports = [profile_imports("app", env, args.top) for _ in range(args.runs)]
+        first_requests = [time_to_first_request(args.path, env, args.timeout) for _ in range(args.runs)]
+    
+    imports.sort(key=lambda profile: profile["total_ms"])
+    profile = imports[len(imports) // 2]
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "path": args.path,
+        "credentials": args.credentials,
+        "import_ms": profile["total_ms"],
+        "first_request_ms": round(statistics.median(first_requests) * 1000, 1),
+        "first_request_max_ms": round(max(first_requests) * 1000, 1),
+        "imports": profile,
+    }
+    
+    print(f"Импорт app: {report['import_ms']} мс, модулей: {profile['modules']}")
+    print("Собственное время по пакетам:")
+    for name, ms in profile["packages"].items():
+        print(f"  {name:<40}{ms:>9.1f} мс")
+    print("Накопленное время модулей:")
+    for name, ms in profile["cumulative"].items():
+        print(f"  {name:<40}{ms:>9.1f} мс")
+    print(f"Первый ответ {args.path}: медиана {report['first_request_ms']} мс, "
+          f"максимум {report['first_request_max_ms']} мс ({args.runs} запусков)")
+    
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.json_path}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    
+    if args.budget is not None and report["first_request_ms"] > args.budget * 1000:
+        print(f"Бюджет превышен: {report['first_request_ms']} мс > {args.budget * 1000:.0f} мс")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
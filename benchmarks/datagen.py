@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Детерминированный генератор многолетней истории для Toyota Dashboard
+
+Заполняет базу (схема создается DatabaseManager со всеми миграциями)
+правдоподобными данными PHEV:
+- поездки на работу и обратно в будни, поручения и выезды в выходные,
+  редкие дальние поездки;
+- электрический пробег, пока есть заряд, затем бензиновый;
+- зарядка дома по ночам, заправка при низком уровне топлива;
+- стоянки дома, на работе и в нескольких постоянных местах;
+- опрос статуса с заданным интервалом, команды и уведомления.
+
+Одинаковые --seed, --start и --days дают одинаковую базу.
+
+Запуск:
+    python benchmarks/datagen.py --db /tmp/bench.db --days 1095 --trips 10000
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager, _haversine_km  # noqa: E402
+from payload_codec import PayloadCodec  # noqa: E402
+
+HOME = (45.5481, 13.7302)
+WORK = (45.6017, 13.7891)
+# Постоянные места поручений: магазины, спортзал, школа и т.п.
+PLACES = [
+    (45.5392, 13.7425), (45.5580, 13.7110), (45.5127, 13.6481), (45.5706, 13.8563),
+    (45.5488, 13.7768), (45.6495, 13.7768), (45.4811, 13.6031), (45.5230, 13.5711),
+]
+
+BATTERY_KWH = 10.5       # полезная емкость батареи
+EV_KWH_PER_KM = 0.18
+TANK_LITERS = 43.0
+FUEL_L_PER_KM = 0.055
+CHARGE_PERCENT_PER_HOUR = 30.0   # домашняя зарядка ~3.3 кВт
+ROAD_FACTOR = 1.3                # дорога длиннее прямой
+
+@dataclass
+class PlannedTrip:
+    start: int
+    origin: Tuple[float, float]
+    destination: Tuple[float, float]
+    distance_km: float
+    avg_speed: float
+    end: int = 0
+
+@dataclass
+class VehicleState:
+    battery: float = 80.0
+    fuel: float = 70.0
+    position: Tuple[float, float] = HOME
+    locked: bool = True
+
+def plan_trips(rnd: random.Random, start: datetime, days: int, target_trips: int) -> List[PlannedTrip]:
+    """Расписание поездок: будни, выходные, поручения и дальние выезды."""
+    # Ожидаемое число поездок без поручений: 2 в будни + редкие дальние поездки туда и обратно
+    base_per_day = 2 * 5 / 7 + 0.03 * 2
+    errand_rate = max(0.0, target_trips / max(days, 1) - base_per_day) / 2
+    
+    trips: List[PlannedTrip] = []
+    for day_index in range(days):
+        day = start + timedelta(days=day_index)
+        weekday = day.weekday() < 5
+        legs: List[Tuple[datetime, Tuple[float, float], Tuple[float, float], Optional[float]]] = []
+        
+        if weekday:
+            legs.append((day.replace(hour=7, minute=40) + timedelta(minutes=rnd.gauss(0, 12)), HOME, WORK, None))
+            legs.append((day.replace(hour=17, minute=15) + timedelta(minutes=rnd.gauss(0, 30)), WORK, HOME, None))
+        
+        # Поручения: поездка к месту и обратно домой
+        errands = int(errand_rate) + (1 if rnd.random() < errand_rate - int(errand_rate) else 0)
+        slot = day.replace(hour=18 if weekday else 10, minute=30)
+        for _ in range(errands):
+            place = rnd.choice(PLACES)
+            departure = slot + timedelta(minutes=rnd.randint(0, 60))
+            legs.append((departure, HOME, place, None))
+            legs.append((departure + timedelta(minutes=rnd.randint(20, 90)), place, HOME, None))
+            slot = departure + timedelta(hours=2)
+        
+        if rnd.random() < 0.03:
+            distance = rnd.uniform(120, 320)
+            departure = day.replace(hour=8, minute=0) + timedelta(minutes=rnd.randint(0, 120))
+            legs.append((departure, HOME, HOME, distance))
+        
+        legs.sort(key=lambda leg: leg[0])
+        for departure, origin, destination, distance in legs:
+            if distance is None:
+                distance = max(1.0, _haversine_km(*origin, *destination) * ROAD_FACTOR * rnd.uniform(0.95, 1.1))
+            avg_speed = min(95.0, 25.0 + distance * 1.5) * rnd.uniform(0.85, 1.1)
+            trip = PlannedTrip(int(departure.timestamp()), origin, destination, distance, avg_speed)
+            trip.end = trip.start + int(distance / avg_speed * 3600)
+            # Поездки не пересекаются
+            if trips and trip.start <= trips[-1].end:
+                shift = trips[-1].end + 600 - trip.start
+                trip.start += shift
+                trip.end += shift
+            trips.append(trip)
+    return trips
+
+def outside_temperature(moment: int, rnd: random.Random) -> float:
+    """Сезонная и суточная температура с шумом."""
+    day_of_year = datetime.fromtimestamp(moment).timetuple().tm_yday
+    hour = (moment % 86400) / 3600
+    seasonal = 13 - 10 * math.cos(2 * math.pi * (day_of_year - 15) / 365)
+    daily = -4 * math.cos(2 * math.pi * (hour - 3) / 24)
+    return round((seasonal + daily + rnd.gauss(0, 1)) * 2) / 2
+
+class HistoryGenerator:
+    """Пошаговая симуляция автомобиля с записью в базу пачками."""
+    
+    def __init__(self, conn: sqlite3.Connection, rnd: random.Random, interval: int):
+        self.conn = conn
+        self.rnd = rnd
+        self.interval = interval
+        self.codec = PayloadCodec()
+        self.state = VehicleState()
+        self.status_rows: List[tuple] = []
+        self.trip_rows: List[tuple] = []
+        self.command_rows: List[tuple] = []
+        self.notification_rows: List[tuple] = []
+        self.counts = {"vehicle_status": 0, "trips": 0, "commands": 0, "notifications": 0}
+    
+    def run(self, trips: List[PlannedTrip], start: int, end: int):
+        trip_index = 0
+        active: Optional[dict] = None
+        for moment in range(start, end, self.interval):
+            # Начало и конец поездок между опросами
+            while active is None and trip_index < len(trips) and trips[trip_index].start <= moment:
+                active = self._start_trip(trips[trip_index])
+                trip_index += 1
+                if active["trip"].end <= moment:
+                    self._finish_trip(active)
+                    active = None
+            if active is not None and active["trip"].end <= moment:
+                self._finish_trip(active)
+                active = None
+            
+            self._charge(moment)
+            self._poll(moment, active)
+            
+            if len(self.status_rows) >= 5000:
+                self.flush()
+        self.flush()
+    
+    def _start_trip(self, trip: PlannedTrip) -> dict:
+        state = self.state
+        # Перед дальней поездкой заправляются заранее
+        if trip.distance_km > 100 and state.fuel < 60:
+            state.fuel = 100.0
+        ev_available = state.battery / 100 * BATTERY_KWH / EV_KWH_PER_KM
+        # Зимой запас хода на электричестве ниже
+        if outside_temperature(trip.start, self.rnd) < 5:
+            ev_available *= 0.75
+        electric = min(trip.distance_km, ev_available)
+        fuel_km = trip.distance_km - electric
+        fuel_liters = fuel_km * FUEL_L_PER_KM * self.rnd.uniform(0.9, 1.15)
+        return {
+            "trip": trip,
+            "electric": electric,
+            "fuel_km": fuel_km,
+            "fuel_liters": fuel_liters,
+            "kwh": electric * EV_KWH_PER_KM,
+            "battery_start": state.battery,
+            "fuel_start": state.fuel,
+            "battery_end": max(0.0, state.battery - electric * EV_KWH_PER_KM / BATTERY_KWH * 100),
+            "fuel_end": max(0.0, state.fuel - fuel_liters / TANK_LITERS * 100),
+        }
+    
+    def _finish_trip(self, active: dict):
+        trip: PlannedTrip = active["trip"]
+        state = self.state
+        state.battery, state.fuel = active["battery_end"], active["fuel_end"]
+        state.position = trip.destination
+        electric_share = active["electric"] / trip.distance_km
+        self.trip_rows.append((
+            trip.start, trip.end, trip.origin[0], trip.origin[1], trip.destination[0], trip.destination[1],
+            round(trip.distance_km, 2), round(active["electric"], 2), round(active["fuel_km"], 2),
+            round(active["fuel_liters"], 2), round(active["kwh"], 2), round(trip.avg_speed, 1),
+            round(trip.avg_speed * self.rnd.uniform(1.3, 1.7), 1),
+            int(40 + 55 * electric_share + self.rnd.randint(-5, 5)), None,
+        ))
+        
+        # Заправка по дороге при низком уровне топлива
+        if state.fuel < 15:
+            state.fuel = 100.0
+        if trip.destination == HOME:
+            self.command_rows.append((trip.end + 60, "door_lock", "success", self.codec.encode({
+                "status": {"messages": [{"description": "Request Completed Successfully"}]},
+                "payload": {"returnCode": "000000"},
+            }), None))
+        if state.battery < 20 and active["battery_start"] >= 20:
+            self.notification_rows.append((trip.end, "low_battery", "Низкий заряд батареи",
+                                           f"Заряд батареи {state.battery:.0f}%", 0, None))
+    
+    def _charge(self, moment: int):
+        state = self.state
+        hour = (moment % 86400) / 3600
+        at_home = state.position == HOME
+        # Ночной тариф: с 22:00 до 06:00
+        if at_home and (hour >= 22 or hour < 6) and state.battery < 100:
+            state.battery = min(100.0, state.battery + CHARGE_PERCENT_PER_HOUR * self.interval / 3600)
+    
+    def _poll(self, moment: int, active: Optional[dict]):
+        state = self.state
+        if active is not None:
+            trip: PlannedTrip = active["trip"]
+            progress = (moment - trip.start) / max(trip.end - trip.start, 1)
+            lat = trip.origin[0] + (trip.destination[0] - trip.origin[0]) * progress
+            lon = trip.origin[1] + (trip.destination[1] - trip.origin[1]) * progress
+            battery = active["battery_start"] + (active["battery_end"] - active["battery_start"]) * progress
+            fuel = active["fuel_start"] + (active["fuel_end"] - active["fuel_start"]) * progress
+            engine_running, locked = True, False
+        else:
+            lat, lon = state.position
+            battery, fuel = state.battery, state.fuel
+            engine_running, locked = False, True
+        
+        outside = outside_temperature(moment, self.rnd)
+        battery_level = int(round(battery))
+        fuel_level = int(round(fuel))
+        self.status_rows.append((
+            moment, battery_level, fuel_level,
+            round(battery / 100 * BATTERY_KWH / EV_KWH_PER_KM, 1),
+            round(fuel / 100 * TANK_LITERS / FUEL_L_PER_KM, 1),
+            round(lat + self.rnd.gauss(0, 0.00002), 6), round(lon + self.rnd.gauss(0, 0.00002), 6),
+            locked, engine_running, engine_running and outside < 5,
+            outside + (3 if engine_running else 1), outside, None, moment, None, None,
+        ))
+    
+    def flush(self):
+        """Записать накопленные строки одной транзакцией."""
+        self.conn.executemany("""
+            INSERT INTO vehicle_status (
+                timestamp, battery_level, fuel_level, range_electric, range_fuel,
+                latitude, longitude, locked, engine_running, climate_on,
+                temperature_inside, temperature_outside, raw_data,
+                valid_until, raw_kind, raw_base_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, self.status_rows)
+        self.conn.executemany("""
+            INSERT INTO trips (
+                start_time, end_time, start_latitude, start_longitude,
+                end_latitude, end_longitude, distance_total, distance_electric,
+                distance_fuel, fuel_consumed, electricity_consumed,
+                avg_speed, max_speed, efficiency_score, route_data
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, self.trip_rows)
+        self.conn.executemany("""
+            INSERT INTO commands (timestamp, command_type, status, response_data, error_message)
+            VALUES (?, ?, ?, ?, ?)
+        """, self.command_rows)
+        self.conn.executemany("""
+            INSERT INTO notifications (timestamp, type, title, message, read, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, self.notification_rows)
+        self.conn.commit()
+        self.counts["vehicle_status"] += len(self.status_rows)
+        self.counts["trips"] += len(self.trip_rows)
+        self.counts["commands"] += len(self.command_rows)
+        self.counts["notifications"] += len(self.notification_rows)
+        self.status_rows, self.trip_rows, self.command_rows, self.notification_rows = [], [], [], []
+
+async def _create_schema(path: str):
+    db = DatabaseManager(path)
+    await db.init_database()
+    await db.close()
+
+def generate_history(path: str, days: int = 1095, trips: int = 10000, interval: int = 300,
+                     seed: int = 42, start: Optional[datetime] = None) -> dict:
+    """Создать базу path с историей за days дней, заканчивающейся в начале текущих суток.
+    
+    Возвращает количество записанных строк по таблицам.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"База уже существует: {path}")
+    if start is None:
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    asyncio.run(_create_schema(path))
+    
+    rnd = random.Random(seed)
+    planned = plan_trips(rnd, start, days, trips)
+    conn = sqlite3.connect(path)
+    try:
+        generator = HistoryGenerator(conn, rnd, interval)
+        begin = int(start.timestamp())
+        generator.run(planned, begin, begin + days * 86400)
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return generator.counts
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Генератор тестовой истории Toyota Dashboard")
+    parser.add_argument("--db", required=True, help="Путь к создаваемой базе")
+    parser.add_argument("--days", type=int, default=1095, help="Длина истории, дни")
+    parser.add_argument("--trips", type=int, default=10000, help="Примерное число поездок")
+    parser.add_argument("--interval", type=int, default=300, help="Интервал опроса статуса, секунды")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="Начало истории (по умолчанию days дней до начала текущих суток)")
+    args = parser.parse_args()
+    
+    begin = time.perf_counter()
+    counts = generate_history(args.db, args.days, args.trips, args.interval, args.seed, args.start)
+    print(f"База создана за {time.perf_counter() - begin:.1f} с: {args.db}")
+    for table, count in counts.items():
+        print(f"  {table}: {count}")
+    print(f"  размер файла: {os.path.getsize(args.db) / 1024 / 1024:.1f} МБ")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
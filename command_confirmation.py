@@ -0,0 +1,187 @@
+"""
+Подтверждение команд по состоянию автомобиля
+
+Успешный ответ post_command означает только, что Toyota приняла команду,
+а не что двери действительно заблокированы. После отправки команды
+CommandConfirmer опрашивает один endpoint, отражающий ее результат
+(get_remote_status - замки и окна, get_climate_status - климат),
+с удваивающимся интервалом, пока автомобиль не придет в ожидаемое состояние или не
+истечет confirm_timeout. Полный update() автомобиля не вызывается.
+Засчитывается только состояние, которое автомобиль сообщил после начала
+выполнения команды: уже заблокированные двери иначе "подтвердили" бы
+блокировку, даже если команда до автомобиля не дошла.
+Итог записывается в CommandJob.confirmation.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from models import CommandQueueConfig
+from pytoyoda.models.lock_status import LockStatus
+
+logger = logging.getLogger(__name__)
+
+CONFIRM_PENDING = "pending"
+CONFIRM_CONFIRMED = "confirmed"
+# Автомобиль не пришел в ожидаемое состояние за confirm_timeout
+CONFIRM_TIMEOUT = "timeout"
+# Ожидаемое состояние есть, но автомобиль не сообщал его после команды
+CONFIRM_UNCONFIRMED = "unconfirmed"
+# Состояние так и не удалось получить (ошибки API до конца ожидания)
+CONFIRM_FAILED = "failed"
+
+PROBE_REMOTE_STATUS = "remote_status"
+PROBE_CLIMATE = "climate_status"
+
+def _all_known(values: Iterable[Optional[bool]]) -> Optional[bool]:
+    """True - все известные значения True, False - хотя бы одно False, None - ничего не известно."""
+    known = [value for value in values if value is not None]
+    return all(known) if known else None
+
+async def probe_remote_status(vehicle) -> Dict[str, Any]:
+    """Замки дверей, багажника и окна (get_remote_status)."""
+    response = await vehicle._api.get_remote_status(vehicle.vin)
+    # Следующее построение статуса увидит свежие данные без update()
+    vehicle._endpoint_data["status"] = response
+    lock_status = LockStatus(response)
+    doors, windows = lock_status.doors, lock_status.windows
+    door_list = [doors.driver_seat, doors.passenger_seat, doors.driver_rear_seat,
+                 doors.passenger_rear_seat] if doors else []
+    window_list = [windows.driver_seat, windows.passenger_seat, windows.driver_rear_seat,
+                   windows.passenger_rear_seat] if windows else []
+    return {
+        "locked": _all_known(door.locked for door in door_list if door),
+        "trunk_locked": doors.trunk.locked if doors and doors.trunk else None,
+        "windows_closed": _all_known(window.closed for window in window_list if window),
+        "updated_at": lock_status.last_updated.isoformat() if lock_status.last_updated else None,
+    }
+
+async def probe_climate(vehicle) -> Dict[str, Any]:
+    """Включен ли климат-контроль (get_climate_status)."""
+    response = await vehicle._api.get_climate_status(vehicle.vin)
+    vehicle._endpoint_data["climate_status"] = response
+    # Выключенный климат приходит как status == 0 без остальных полей,
+    # в том числе без времени: такое состояние подтверждением не считается
+    payload = response.payload
+    updated_at = None
+    if payload:
+        updated_at = payload.current_temperature.timestamp if payload.current_temperature else payload.started_at
+    return {
+        "climate_on": bool(payload and payload.status),
+        "target_temperature": payload.target_temperature.value
+        if payload and payload.target_temperature else None,
+        "updated_at": updated_at.isoformat() if updated_at else None,
+    }
+
+def _reported_after(observed: Dict[str, Any], moment: float) -> bool:
+    """Автомобиль сообщил состояние позже moment (секунды эпохи)."""
+    updated_at = observed.get("updated_at")
+    if not updated_at:
+        return False
+    try:
+        return datetime.fromisoformat(updated_at).timestamp() > moment
+    except ValueError:
+        return False
+
+# endpoint -> опрос состояния
+PROBES: Dict[str, Callable[[Any], Awaitable[Dict]]] = {
+    PROBE_REMOTE_STATUS: probe_remote_status,
+    PROBE_CLIMATE: probe_climate,
+}
+
+# Команда -> (endpoint, ожидаемые значения)
+CONFIRMATIONS: Dict[str, Tuple[str, Dict[str, Any]]] = {
+    "door-lock": (PROBE_REMOTE_STATUS, {"locked": True}),
+    "door-unlock": (PROBE_REMOTE_STATUS, {"locked": False}),
+    "trunk-close": (PROBE_REMOTE_STATUS, {"trunk_locked": True}),
+    "trunk-open": (PROBE_REMOTE_STATUS, {"trunk_locked": False}),
+    "power-window-off": (PROBE_REMOTE_STATUS, {"windows_closed": True}),
+    "power-window-on": (PROBE_REMOTE_STATUS, {"windows_closed": False}),
+    "climate": (PROBE_CLIMATE, {"climate_on": True}),
+    "climate-start": (PROBE_CLIMATE, {"climate_on": True}),
+    "climate-stop": (PROBE_CLIMATE, {"climate_on": False}),
+    "ac-on": (PROBE_CLIMATE, {"climate_on": True}),
+    "ventilation-on": (PROBE_CLIMATE, {"climate_on": True}),
+}
+
+class CommandConfirmer:
+    """Опрос состояния автомобиля после команды до ожидаемого результата."""
+    
+    def __init__(self, config: CommandQueueConfig, vehicle_provider: Callable[[], Awaitable[Any]]):
+        self.config = config
+        # Возвращает объект автомобиля pytoyoda (get_vehicle в app.py)
+        self.vehicle_provider = vehicle_provider
+    
+    def supports(self, command: str) -> bool:
+        return self.config.confirm and command in CONFIRMATIONS
+    
+    def pending(self, command: str) -> Dict[str, Any]:
+        """Начальное состояние подтверждения для CommandJob.confirmation."""
+        endpoint, expected = CONFIRMATIONS[command]
+        return {
+            "state": CONFIRM_PENDING,
+            "endpoint": endpoint,
+            "expected": expected,
+            "observed": None,
+            "attempts": 0,
+            "elapsed": None,
+            "error": None,
+            "checked_at": None,
+        }
+    
+    async def confirm(self, command: str, confirmation: Dict[str, Any], since: float) -> Dict[str, Any]:
+        """Опрашивать endpoint команды, пока состояние не совпадет с ожидаемым.
+        
+        Совпадение засчитывается, только если автомобиль сообщил его позже
+        since (начало выполнения команды, секунды эпохи). Первая проверка через confirm_delay секунд, дальше интервал
+        удваивается до confirm_max_interval. confirmation (из pending)
+        обновляется по ходу опроса, поэтому GET /api/commands/{id} видит
+        число попыток и последнее наблюдаемое состояние.
+        """
+        probe = PROBES[confirmation["endpoint"]]
+        expected = confirmation["expected"]
+        started = time.monotonic()
+        deadline = started + self.config.confirm_timeout
+        delay = max(0.1, self.config.confirm_delay)
+        
+        try:
+            vehicle = await self.vehicle_provider()
+            while True:
+                await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+                confirmation["attempts"] += 1
+                try:
+                    observed = await probe(vehicle)
+                    confirmation["observed"] = observed
+                    confirmation["error"] = None
+                    matched = all(observed.get(key) == value for key, value in expected.items())
+                    if matched and _reported_after(observed, since):
+                        confirmation["state"] = CONFIRM_CONFIRMED
+                        break
+                except Exception as e:
+                    matched = False
+                    confirmation["error"] = str(getattr(e, "detail", None) or e)
+                    logger.warning(f"Ошибка проверки результата команды {command}: {confirmation['error']}")
+                
+                if time.monotonic() >= deadline:
+                    if matched:
+                        confirmation["state"] = CONFIRM_UNCONFIRMED
+                    else:
+                        confirmation["state"] = CONFIRM_TIMEOUT if confirmation["observed"] else CONFIRM_FAILED
+                    break
+                delay = min(delay * 2, self.config.confirm_max_interval)
+        except Exception as e:
+            confirmation["state"] = CONFIRM_FAILED
+            confirmation["error"] = str(getattr(e, "detail", None) or e)
+            logger.error(f"Ошибка подтверждения команды {command}: {confirmation['error']}")
+        
+        confirmation["elapsed"] = round(time.monotonic() - started, 1)
+        confirmation["checked_at"] = datetime.now().astimezone().isoformat(timespec="seconds")
+        if confirmation["state"] == CONFIRM_CONFIRMED:
+            logger.info(f"Команда {command} подтверждена за {confirmation['elapsed']} с")
+        else:
+            logger.warning(f"Команда {command} не подтверждена ({confirmation['state']}) "
+                           f"за {confirmation['elapsed']} с: {confirmation['observed']}")
+        return confirmation
@@ -0,0 +1,386 @@
+"""
+Очередь команд управления автомобилем
+
+Endpoint команды (блокировка, двигатель, климат, окна) не ждет ответа
+Toyota API: он ставит задачу в очередь и сразу отвечает 202 с ее id.
+Задачи одного автомобиля выполняются по одной в порядке поступления,
+поэтому машина не получает одновременных команд. Повторное нажатие той
+же кнопки в пределах dedup_seconds возвращает уже созданную задачу.
+Результат доступен по GET /api/commands/{id}, через push-событие
+command (/api/stream) и в таблице commands.
+
+После успешной отправки очередь ждет подтверждения от автомобиля
+(command_confirmation.py) и только потом берет следующую команду этого
+автомобиля: проверка замков не увидит состояние после следующей команды.
+
+При нескольких воркерах uvicorn задачи хранятся в таблице command_jobs.
+Команду выполняет принявший ее воркер, но начинает только после
+завершения более ранних задач автомобиля из всех процессов; повтор
+ищется среди задач всех воркеров, GET /api/commands/{id} отвечает в любом
+из них. Задачи завершившегося процесса снимаются с очереди, когда их
+ждет следующая команда.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from command_confirmation import CONFIRM_FAILED, CONFIRM_PENDING, CommandConfirmer
+from models import CommandQueueConfig
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# Поля задачи, которые хранятся в command_jobs.data
+STATE_FIELDS = ("message", "result", "error", "error_code", "record_id", "confirmation")
+
+def _iso(moment: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(moment).astimezone().isoformat(timespec="seconds") if moment else None
+
+def _process_alive(pid: int) -> bool:
+    """Процесс pid еще работает (задачи воркеров одного компьютера)."""
+    if pid == os.getpid() or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # PermissionError: процесс есть, но принадлежит другому пользователю
+        return True
+    return True
+
+class CommandJob:
+    """Одна команда автомобилю: что выполнить и чем закончилось."""
+    
+    def __init__(self, vin: str, command: str, action: Optional[Callable[[], Awaitable[Dict]]],
+                 params: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.owner_pid = os.getpid()
+        self.vin = vin
+        self.command = command
+        self.params = params or {}
+        self.action = action
+        self.status = JOB_QUEUED
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.message: Optional[str] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        # HTTP-код ошибки (HTTPException.status_code), если он был
+        self.error_code: Optional[int] = None
+        # id записи в таблице commands
+        self.record_id: Optional[int] = None
+        # Подтверждение по состоянию автомобиля (CommandConfirmer.pending)
+        self.confirmation: Optional[Dict[str, Any]] = None
+        self.done = asyncio.Event()
+    
+    @classmethod
+    def from_row(cls, row: Dict) -> "CommandJob":
+        """Задача из строки command_jobs (без action: ее выполняет другой процесс)."""
+        job = cls(row["vin"], row["command"], None, json.loads(row["params"]))
+        job.id = row["id"]
+        job.owner_pid = row["owner_pid"]
+        job.submitted_at = row["submitted_at"]
+        job.apply_row(row)
+        return job
+    
+    def apply_row(self, row: Dict):
+        """Обновить состояние по строке command_jobs."""
+        self.status = row["status"]
+        self.started_at = row["started_at"]
+        self.finished_at = row["finished_at"]
+        state = json.loads(row["data"]) if row["data"] else {}
+        for field in STATE_FIELDS:
+            setattr(self, field, state.get(field))
+        if self.finished:
+            self.done.set()
+    
+    def to_row(self) -> Dict[str, Any]:
+        """Строка command_jobs."""
+        return {
+            "id": self.id,
+            "vin": self.vin,
+            "command": self.command,
+            "params": self.params_key,
+            "status": self.status,
+            "busy": int(self.busy),
+            "owner_pid": self.owner_pid,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "data": json.dumps({field: getattr(self, field) for field in STATE_FIELDS},
+                               ensure_ascii=False, default=str),
+        }
+    
+    @property
+    def params_key(self) -> str:
+        return json.dumps(self.params, sort_keys=True, default=str)
+    
+    @property
+    def dedup_key(self) -> Tuple[str, str, str]:
+        return self.vin, self.command, self.params_key
+    
+    @property
+    def busy(self) -> bool:
+        """Задача держит очередь автомобиля: не выполнена или ждет подтверждения."""
+        return not self.finished or (self.confirmation or {}).get("state") == CONFIRM_PENDING
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+    
+    @property
+    def success(self) -> bool:
+        return self.status == JOB_SUCCEEDED
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "command": self.command,
+            "params": self.params,
+            "status": self.status,
+            "success": self.success if self.finished else None,
+            "message": self.message,
+            "error": self.error,
+            "result": self.result,
+            "record_id": self.record_id,
+            "confirmation": self.confirmation,
+            "submitted_at": _iso(self.submitted_at),
+            "started_at": _iso(self.started_at),
+            "finished_at": _iso(self.finished_at),
+        }
+
+class CommandQueue:
+    """Очереди команд по автомобилям с последовательным выполнением."""
+    
+    def __init__(self, config: Optional[CommandQueueConfig] = None):
+        self.config = config or CommandQueueConfig()
+        # Задачи этого процесса (с action); общий список - в command_jobs
+        self._jobs: "OrderedDict[str, CommandJob]" = OrderedDict()
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        # База с таблицей command_jobs; без нее очередь живет в памяти процесса
+        self.db = None
+        # Вызывается после завершения задачи (запись в базу, push-событие)
+        self.on_finished: Optional[Callable[[CommandJob], Awaitable[None]]] = None
+        # Проверка результата команды по состоянию автомобиля
+        self.confirmer: Optional[CommandConfirmer] = None
+        # Вызывается после подтверждения (или его таймаута)
+        self.on_confirmed: Optional[Callable[[CommandJob], Awaitable[None]]] = None
+    
+    async def start(self, db):
+        """Подключить общую таблицу задач (запуск приложения).
+        
+        Задачи прошлого процесса с тем же pid (перезапуск в контейнере)
+        уже никто не выполнит - они завершаются ошибкой.
+        """
+        self.db = db
+        stale = await db.get_command_jobs(limit=self.config.history_size, owner_pid=os.getpid(), busy_only=True)
+        await db.fail_command_jobs([row["id"] for row in stale], "Команда прервана перезапуском сервера", time.time())
+    
+    async def get(self, job_id: str) -> Optional[CommandJob]:
+        job = self._jobs.get(job_id)
+        if job is not None or self.db is None:
+            return job
+        row = await self.db.get_command_job(job_id)
+        return CommandJob.from_row(row) if row else None
+    
+    async def recent(self, limit: int = 20) -> List[CommandJob]:
+        """Последние задачи всех воркеров, новые первыми."""
+        if self.db is None:
+            return list(reversed(self._jobs.values()))[:limit]
+        rows = await self.db.get_command_jobs(limit=limit)
+        return [self._jobs.get(row["id"]) or CommandJob.from_row(row) for row in rows]
+    
+    async def pending(self) -> int:
+        """Число невыполненных задач."""
+        if self.db is None:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+        return await self.db.count_pending_command_jobs()
+    
+    async def submit(self, vin: str, command: str, action: Callable[[], Awaitable[Dict]],
+                     params: Optional[Dict[str, Any]] = None) -> Tuple[CommandJob, bool]:
+        """Поставить команду в очередь; вернуть задачу и признак повтора."""
+        job = CommandJob(vin, command, action, params)
+        previous = await self._find_duplicate(job)
+        if previous is not None:
+            logger.info(f"Повтор команды {command} в течение {self.config.dedup_seconds} с: задача {previous.id}")
+            return previous, True
+        
+        self._remember(job)
+        if vin not in self._queues:
+            self._queues[vin] = asyncio.Queue()
+        self._queues[vin].put_nowait(job)
+        worker = self._workers.get(vin)
+        if worker is None or worker.done():
+            self._workers[vin] = asyncio.create_task(self._worker(vin))
+        return job, False
+    
+    async def _find_duplicate(self, job: CommandJob) -> Optional[CommandJob]:
+        """Та же команда, поставленная в пределах dedup_seconds (с записью job, если повтора нет)."""
+        dedup_since = job.submitted_at - self.config.dedup_seconds
+        if self.db is not None:
+            row = await self.db.add_command_job(job.to_row(), dedup_since)
+            return (self._jobs.get(row["id"]) or CommandJob.from_row(row)) if row else None
+        for previous in reversed(self._jobs.values()):
+            if previous.submitted_at < dedup_since:
+                break
+            # После ошибки повторное нажатие - осознанная новая попытка
+            if previous.dedup_key == job.dedup_key and previous.status != JOB_FAILED:
+                return previous
+        return None
+    
+    def _remember(self, job: CommandJob):
+        self._jobs[job.id] = job
+        # Забываются только завершенные задачи: невыполненные еще нужны
+        overflow = len(self._jobs) - max(1, self.config.history_size)
+        for old in [old for old in self._jobs.values() if old.finished][:max(0, overflow)]:
+            del self._jobs[old.id]
+    
+    async def wait(self, job: CommandJob, timeout: float) -> bool:
+        """Подождать завершения задачи не дольше timeout секунд."""
+        if timeout <= 0 or job.finished:
+            return job.finished
+        if job.id in self._jobs or self.db is None:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            return job.finished
+        
+        # Задачу выполняет другой воркер: ее состояние видно только в базе
+        deadline = time.monotonic() + timeout
+        while not job.finished and time.monotonic() < deadline:
+            await asyncio.sleep(min(self.config.poll_interval, max(0.0, deadline - time.monotonic())))
+            row = await self.db.get_command_job(job.id)
+            if row is None:
+                break
+            job.apply_row(row)
+        return job.finished
+    
+    async def stop(self):
+        """Остановить обработчики очередей (завершение приложения).
+        
+        Невыполненные задачи помечаются ошибкой, ожидающие их запросы
+        (?wait=) сразу получают ответ; незаконченные подтверждения
+        прекращаются, чтобы не держать очередь других воркеров.
+        """
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+        for job in list(self._jobs.values()):
+            if not job.busy:
+                continue
+            if not job.finished:
+                job.status = JOB_FAILED
+                job.error = job.message = "Команда прервана остановкой сервера"
+                job.finished_at = time.time()
+            else:
+                job.confirmation["state"] = CONFIRM_FAILED
+                job.confirmation["error"] = "Подтверждение прервано остановкой сервера"
+            job.done.set()
+            await self._save(job)
+    
+    async def _worker(self, vin: str):
+        queue = self._queues[vin]
+        while True:
+            job = await queue.get()
+            try:
+                await self._run(job)
+            finally:
+                queue.task_done()
+    
+    async def _wait_turn(self, job: CommandJob) -> bool:
+        """Дождаться, пока более ранние задачи автомобиля в других воркерах освободят очередь.
+        
+        Возвращает False, если задачи уже нет в базе.
+        """
+        while not await self.db.claim_command_job(job.id, time.time()):
+            blocking = await self.db.get_blocking_command_jobs(job.id)
+            orphaned = [row["id"] for row in blocking if not _process_alive(row["owner_pid"])]
+            if orphaned:
+                logger.warning(f"Снимаю с очереди {len(orphaned)} задач(и) завершившегося воркера")
+                await self.db.fail_command_jobs(orphaned, "Процесс, выполнявший команду, завершился", time.time())
+                continue
+            if await self.db.get_command_job(job.id) is None:
+                return False
+            await asyncio.sleep(self.config.poll_interval)
+        return True
+    
+    async def _run(self, job: CommandJob):
+        if self.db is not None:
+            try:
+                claimed = await self._wait_turn(job)
+            except Exception as e:
+                logger.error(f"Ошибка очереди команд в базе: {e}")
+                claimed = False
+            if not claimed:
+                job.status = JOB_FAILED
+                job.error = job.message = "Задача потеряна в очереди команд"
+                job.finished_at = time.time()
+                job.done.set()
+                return
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        await self._save(job)
+        try:
+            result = await job.action()
+            job.result = result if isinstance(result, dict) else {"result": result}
+            job.message = job.result.get("message")
+            job.status = JOB_SUCCEEDED if job.result.get("success", True) else JOB_FAILED
+            if not job.success:
+                job.error = job.result.get("error") or job.message
+            elif self.confirmer and self.confirmer.supports(job.command):
+                job.confirmation = self.confirmer.pending(job.command)
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(getattr(e, "detail", None) or e)
+            job.error_code = getattr(e, "status_code", None)
+            job.message = job.error
+            logger.error(f"Ошибка выполнения команды {job.command}: {job.error}")
+        finally:
+            job.finished_at = time.time()
+            if self.on_finished:
+                try:
+                    await self.on_finished(job)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки результата команды {job.command}: {e}")
+            await self._save(job)
+            job.done.set()
+        
+        if job.confirmation:
+            await self._confirm(job)
+    
+    async def _confirm(self, job: CommandJob):
+        await self.confirmer.confirm(job.command, job.confirmation, job.started_at)
+        await self._save(job)
+        if self.on_confirmed:
+            try:
+                await self.on_confirmed(job)
+            except Exception as e:
+                logger.error(f"Ошибка обработки подтверждения команды {job.command}: {e}")
+    
+    async def _save(self, job: CommandJob):
+        """Записать состояние задачи в command_jobs."""
+        if self.db is None:
+            return
+        try:
+            await self.db.update_command_job(job.to_row(), self.config.history_size)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения задачи {job.id}: {e}")
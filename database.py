@@ -5,21 +5,129 @@
 import sqlite3
 import asyncio
 import aiosqlite
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional
 import json
 import logging
+import math
 
-from models import VehicleStatus, TripData
+from models import VehicleStatus, TripData, RetentionConfig, StorageConfig
+from payload_codec import CODEC_NAMES, PayloadCodec, train_dictionary, diff_payload, apply_diff
+from retention import RetentionEngine, ROLLUP_METRICS
 
 logger = logging.getLogger(__name__)
 
+# Поля статуса, которые сравниваются при дедупликации
+STATUS_FIELDS = (
+    "battery_level", "fuel_level", "range_electric", "range_fuel",
+    "latitude", "longitude", "locked", "engine_running", "climate_on",
+    "temperature_inside", "temperature_outside",
+)
+
+def _to_epoch(value) -> Optional[int]:
+    """Привести время (datetime, date, ISO-строка, число) к секундам эпохи UTC.
+    
+    Наивные datetime и строки без часового пояса считаются локальным временем,
+    так же как их раньше записывал datetime.now().
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise TypeError(f"Некорректное значение времени: {value!r}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        try:
+            value = datetime.fromisoformat(text)
+        except ValueError:
+            return int(float(text))
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day).timestamp())
+    raise TypeError(f"Некорректное значение времени: {value!r}")
+
+def _epoch_to_iso(value: Optional[int]) -> Optional[str]:
+    """Преобразовать секунды эпохи в ISO-строку локального времени со смещением."""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc).astimezone().isoformat()
+
+# Пространственные индексы: (таблица индекса, исходная таблица, широта, долгота)
+SPATIAL_INDEXES = (
+    ("trip_start_index", "trips", "start_latitude", "start_longitude"),
+    ("trip_end_index", "trips", "end_latitude", "end_longitude"),
+    ("status_position_index", "vehicle_status", "latitude", "longitude"),
+)
+
+EARTH_RADIUS_KM = 6371.0088
+
+def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу в километрах."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def _radius_bbox(latitude: float, longitude: float, radius_km: float):
+    """Ограничивающий прямоугольник круга: (min_lat, max_lat, min_lon, max_lon)."""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    delta_lon = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lon, longitude + delta_lon
+
+# Максимальный размер страницы истории
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(timestamp: int, row_id: int) -> str:
+    """Курсор страницы истории: время и id последней выданной строки."""
+    return f"{timestamp}:{row_id}"
+
+def decode_cursor(cursor: str):
+    """Разобрать курсор encode_cursor, ValueError при неверном формате."""
+    timestamp, row_id = cursor.split(":")
+    return int(timestamp), int(row_id)
+
+# Колонки сводки поездки для списков (без тяжелого route_data)
+TRIP_SUMMARY_COLUMNS = (
+    "id", "start_time", "end_time", "start_latitude", "start_longitude",
+    "end_latitude", "end_longitude", "distance_total", "distance_electric",
+    "distance_fuel", "fuel_consumed", "electricity_consumed",
+    "avg_speed", "max_speed", "efficiency_score",
+)
+
+def _trip_summary_row(cursor, row) -> Dict:
+    """Фабрика строк для запросов по TRIP_SUMMARY_COLUMNS."""
+    trip = dict(zip(TRIP_SUMMARY_COLUMNS, row))
+    trip['start_time'] = _epoch_to_iso(trip['start_time'])
+    trip['end_time'] = _epoch_to_iso(trip['end_time'])
+    return trip
+
+def _trip_summary_json_object() -> str:
+    """SQL-выражение json_object со сводкой поездки."""
+    fields = []
+    for column in TRIP_SUMMARY_COLUMNS:
+        value = f"epoch_to_iso({column})" if column in ("start_time", "end_time") else column
+        fields.append(f"'{column}', {value}")
+    return f"json_object({', '.join(fields)})"
+
 class DatabaseManager:
     """Менеджер базы данных для Toyota Dashboard."""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, retention: Optional[RetentionConfig] = None,
+                 storage: Optional[StorageConfig] = None):
         self.db_path = db_path
         self.connection: Optional[aiosqlite.Connection] = None
+        self.retention = retention or RetentionConfig()
+        self.storage = storage or StorageConfig()
+        self.codec = PayloadCodec(self.storage.compression, self.storage.compression_level)
+        # Последняя строка vehicle_status для дедупликации без лишнего чтения
+        self._last_status: Optional[Dict] = None
+        self._status_lock = asyncio.Lock()
+        # Вызывается с сохраненным уведомлением (push-события веб-интерфейса)
+        self.on_notification: Optional[Callable[[Dict], None]] = None
     
     async def init_database(self):
         """Инициализировать базу данных и создать таблицы."""
@@ -38,15 +146,70 @@ class DatabaseManager:
                     logger.info(f"Используется временный путь к базе данных: {fallback_db_path}")
                     self.db_path = fallback_db_path
             
-            self.connection = await aiosqlite.connect(self.db_path)
+            # Несколько воркеров uvicorn пишут в одну базу: ждать освобождения
+            # блокировки дольше стандартных 5 секунд
+            self.connection = await aiosqlite.connect(self.db_path, timeout=30)
+            # Действует только для новой базы: свободные страницы возвращаются
+            # порциями (maintenance.py), существующую переводит manage.py
+            await self.connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # WAL: выгрузка и другие читатели не блокируют запись статусов
+            await self.connection.execute("PRAGMA journal_mode=WAL")
             await self._create_tables()
+            await self._load_payload_dictionaries()
             logger.info(f"База данных инициализирована: {self.db_path}")
         except Exception as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
             raise
     
     async def _create_tables(self):
-        """Создать необходимые таблицы."""
+        """Создать необходимые таблицы и применить миграции схемы."""
+        # Результат зависит от часового пояса процесса: не deterministic, чтобы
+        # SQLite не кешировал его и не допускал в индексы
+        await self.connection.create_function("to_epoch", 1, _to_epoch)
+        await self.connection.create_function("epoch_to_iso", 1, _epoch_to_iso)
+        await self.connection.create_function("haversine_km", 4, _haversine_km, deterministic=True)
+        
+        cursor = await self.connection.execute("PRAGMA user_version")
+        row = await cursor.fetchone()
+        current_version = row[0] if row else 0
+        
+        for version, migration in enumerate(self._migrations(), start=1):
+            if version <= current_version:
+                continue
+            # IMMEDIATE: при одновременном запуске нескольких воркеров миграцию
+            # применяет один процесс, остальные ждут и видят новую версию
+            await self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = await self.connection.execute("PRAGMA user_version")
+                row = await cursor.fetchone()
+                if row and row[0] >= version:
+                    await self.connection.rollback()
+                    continue
+                logger.info(f"Применение миграции схемы базы данных v{version}")
+                await migration()
+                # PRAGMA не принимает параметры, версия всегда целое число
+                await self.connection.execute(f"PRAGMA user_version = {int(version)}")
+                await self.connection.commit()
+            except Exception:
+                await self.connection.rollback()
+                raise
+    
+    def _migrations(self) -> List:
+        """Упорядоченный список миграций схемы (позиция в списке + 1 = версия)."""
+        return [
+            self._migration_initial_schema,
+            self._migration_epoch_timestamps,
+            self._migration_status_rollup,
+            self._migration_status_dedup,
+            self._migration_payload_dictionaries,
+            self._migration_commands_index,
+            self._migration_spatial_index,
+            self._migration_shared_state,
+            self._migration_worker_queues,
+        ]
+    
+    async def _migration_initial_schema(self):
+        """Миграция v1: исходная схема (время хранится ISO-текстом)."""
         
         # Таблица статуса автомобиля
         await self.connection.execute("""
@@ -125,38 +288,521 @@ class DatabaseManager:
             CREATE INDEX IF NOT EXISTS idx_trips_start_time 
             ON trips(start_time)
         """)
+    
+    async def _migration_epoch_timestamps(self):
+        """Миграция v2: время хранится целым числом секунд эпохи (UTC).
         
-        await self.connection.commit()
+        SQLite не умеет менять тип столбца, поэтому каждая таблица
+        пересоздается, а данные переносятся с конвертацией через to_epoch().
+        Для чтения человеком создаются представления *_view с ISO-временем.
+        """
+        tables = {
+            "vehicle_status": """
+                CREATE TABLE vehicle_status (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp INTEGER NOT NULL,
+                    battery_level INTEGER,
+                    fuel_level INTEGER,
+                    range_electric INTEGER,
+                    range_fuel INTEGER,
+                    latitude REAL,
+                    longitude REAL,
+                    locked BOOLEAN,
+                    engine_running BOOLEAN,
+                    climate_on BOOLEAN,
+                    temperature_inside REAL,
+                    temperature_outside REAL,
+                    raw_data TEXT
+                )
+            """,
+            "trips": """
+                CREATE TABLE trips (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    start_time INTEGER NOT NULL,
+                    end_time INTEGER,
+                    start_latitude REAL,
+                    start_longitude REAL,
+                    end_latitude REAL,
+                    end_longitude REAL,
+                    distance_total REAL,
+                    distance_electric REAL,
+                    distance_fuel REAL,
+                    fuel_consumed REAL,
+                    electricity_consumed REAL,
+                    avg_speed REAL,
+                    max_speed REAL,
+                    efficiency_score INTEGER,
+                    route_data TEXT
+                )
+            """,
+            "commands": """
+                CREATE TABLE commands (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp INTEGER NOT NULL,
+                    command_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    response_data TEXT,
+                    error_message TEXT
+                )
+            """,
+            "notifications": """
+                CREATE TABLE notifications (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    read BOOLEAN DEFAULT FALSE,
+                    data TEXT
+                )
+            """,
+        }
+        time_columns = {
+            "vehicle_status": ("timestamp",),
+            "trips": ("start_time", "end_time"),
+            "commands": ("timestamp",),
+            "notifications": ("timestamp",),
+        }
+        
+        await self.connection.execute("DROP INDEX IF EXISTS idx_vehicle_status_timestamp")
+        await self.connection.execute("DROP INDEX IF EXISTS idx_trips_start_time")
+        
+        for table, create_sql in tables.items():
+            legacy_table = f"{table}_legacy"
+            await self.connection.execute(f"ALTER TABLE {table} RENAME TO {legacy_table}")
+            await self.connection.execute(create_sql)
+            
+            cursor = await self.connection.execute(f"SELECT * FROM {legacy_table} LIMIT 0")
+            columns = [description[0] for description in cursor.description]
+            select_list = ", ".join(
+                f"to_epoch({column})" if column in time_columns[table] else column
+                for column in columns
+            )
+            await self.connection.execute(f"""
+                INSERT INTO {table} ({", ".join(columns)})
+                SELECT {select_list} FROM {legacy_table}
+            """)
+            await self.connection.execute(f"DROP TABLE {legacy_table}")
+        
+        await self.connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_vehicle_status_timestamp
+            ON vehicle_status(timestamp)
+        """)
+        
+        await self.connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_trips_start_time
+            ON trips(start_time)
+        """)
+        
+        # Представления с читаемым временем для ручных запросов (sqlite3 CLI и т.п.)
+        await self.connection.execute("""
+            CREATE VIEW IF NOT EXISTS vehicle_status_view AS
+            SELECT *, datetime(timestamp, 'unixepoch') AS timestamp_utc
+            FROM vehicle_status
+        """)
+        await self.connection.execute("""
+            CREATE VIEW IF NOT EXISTS trips_view AS
+            SELECT *,
+                datetime(start_time, 'unixepoch') AS start_time_utc,
+                datetime(end_time, 'unixepoch') AS end_time_utc
+            FROM trips
+        """)
+        await self.connection.execute("""
+            CREATE VIEW IF NOT EXISTS commands_view AS
+            SELECT *, datetime(timestamp, 'unixepoch') AS timestamp_utc
+            FROM commands
+        """)
+        await self.connection.execute("""
+            CREATE VIEW IF NOT EXISTS notifications_view AS
+            SELECT *, datetime(timestamp, 'unixepoch') AS timestamp_utc
+            FROM notifications
+        """)
+    
+    async def _migration_status_rollup(self):
+        """Миграция v3: агрегаты истории статусов для многоуровневого хранения."""
+        metric_columns = ",\n".join(
+            f"                {metric}_avg REAL, {metric}_min REAL, {metric}_max REAL"
+            for metric in ROLLUP_METRICS
+        )
+        await self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS vehicle_status_rollup (
+                bucket_seconds INTEGER NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                sample_count INTEGER NOT NULL,
+{metric_columns},
+                PRIMARY KEY (bucket_seconds, bucket_start)
+            ) WITHOUT ROWID
+        """)
+    
+    async def _migration_status_dedup(self):
+        """Миграция v4: дедупликация статусов и дельты raw_data."""
+        await self.connection.execute("ALTER TABLE vehicle_status ADD COLUMN valid_until INTEGER")
+        await self.connection.execute("ALTER TABLE vehicle_status ADD COLUMN raw_kind TEXT")
+        await self.connection.execute("ALTER TABLE vehicle_status ADD COLUMN raw_base_id INTEGER")
+        await self.connection.execute("""
+            UPDATE vehicle_status SET valid_until = timestamp,
+                raw_kind = CASE WHEN raw_data IS NOT NULL THEN 'full' END
+        """)
+        await self.connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_vehicle_status_raw_base
+            ON vehicle_status(raw_base_id) WHERE raw_base_id IS NOT NULL
+        """)
+    
+    async def _migration_payload_dictionaries(self):
+        """Миграция v5: словари для сжатия raw_data и response_data."""
+        await self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS payload_dictionaries (
+                id INTEGER PRIMARY KEY,
+                algorithm TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                sample_count INTEGER NOT NULL,
+                data BLOB NOT NULL
+            )
+        """)
     
-    async def save_vehicle_status(self, status: VehicleStatus):
-        """Сохранить статус автомобиля."""
+    async def _migration_commands_index(self):
+        """Миграция v6: индекс по времени команд для постраничной истории."""
+        await self.connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_commands_timestamp ON commands(timestamp)
+        """)
+    
+    async def _migration_spatial_index(self):
+        """Миграция v7: пространственные индексы точек поездок и положений автомобиля.
+        
+        Используется R*Tree, а если SQLite собрана без него - обычные таблицы
+        с индексом по координатам (запросы к ним одинаковые). Индексы
+        поддерживаются триггерами при вставке, изменении и удалении строк.
+        Нулевые координаты (значение по умолчанию в поездках) не индексируются.
+        """
         try:
-            await self.connection.execute("""
-                INSERT INTO vehicle_status (
-                    timestamp, battery_level, fuel_level, range_electric, range_fuel,
-                    latitude, longitude, locked, engine_running, climate_on,
-                    temperature_inside, temperature_outside, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                status.timestamp,
-                status.battery_level,
-                status.fuel_level,
-                status.range_electric,
-                status.range_fuel,
-                status.latitude,
-                status.longitude,
-                status.locked,
-                status.engine_running,
-                status.climate_on,
-                status.temperature_inside,
-                status.temperature_outside,
-                json.dumps(status.raw_data) if status.raw_data else None
-            ))
-            await self.connection.commit()
+            await self.connection.execute(
+                "CREATE VIRTUAL TABLE temp.rtree_probe USING rtree(id, min_x, max_x)"
+            )
+            await self.connection.execute("DROP TABLE temp.rtree_probe")
+            use_rtree = True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite собрана без R*Tree, используются обычные индексы координат")
+            use_rtree = False
+        
+        for table, source, lat, lon in SPATIAL_INDEXES:
+            if use_rtree:
+                await self.connection.execute(f"""
+                    CREATE VIRTUAL TABLE {table} USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+                """)
+            else:
+                await self.connection.execute(f"""
+                    CREATE TABLE {table} (
+                        id INTEGER PRIMARY KEY,
+                        min_lat REAL, max_lat REAL, min_lon REAL, max_lon REAL
+                    )
+                """)
+                await self.connection.execute(f"CREATE INDEX idx_{table}_lat_lon ON {table}(min_lat, min_lon)")
+            
+            has_position = f"NEW.{lat} IS NOT NULL AND NEW.{lon} IS NOT NULL AND NOT (NEW.{lat} = 0 AND NEW.{lon} = 0)"
+            await self.connection.execute(f"""
+                CREATE TRIGGER {table}_insert AFTER INSERT ON {source}
+                WHEN {has_position}
+                BEGIN
+                    INSERT INTO {table} VALUES (NEW.id, NEW.{lat}, NEW.{lat}, NEW.{lon}, NEW.{lon});
+                END
+            """)
+            await self.connection.execute(f"""
+                CREATE TRIGGER {table}_update AFTER UPDATE OF {lat}, {lon} ON {source}
+                BEGIN
+                    DELETE FROM {table} WHERE id = OLD.id;
+                    INSERT INTO {table}
+                    SELECT NEW.id, NEW.{lat}, NEW.{lat}, NEW.{lon}, NEW.{lon} WHERE {has_position};
+                END
+            """)
+            await self.connection.execute(f"""
+                CREATE TRIGGER {table}_delete AFTER DELETE ON {source}
+                BEGIN
+                    DELETE FROM {table} WHERE id = OLD.id;
+                END
+            """)
+            await self.connection.execute(f"""
+                INSERT INTO {table}
+                SELECT id, {lat}, {lat}, {lon}, {lon} FROM {source}
+                WHERE {has_position.replace("NEW.", "")}
+            """)
+    
+    async def _migration_shared_state(self):
+        """Миграция v8: состояние, общее для процессов-воркеров.
+        
+        shared_state - последние значения (снимок статуса, возможности
+        автомобиля) с номером версии, по которому процессы замечают
+        изменения; rate_limits - маркерные корзины ограничения обращений
+        к Toyota API (rate_limit.SharedTokenBucket).
+        """
+        await self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS shared_state (
+                key TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                value TEXT NOT NULL
+            )
+        """)
+        await self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+    
+    async def _migration_worker_queues(self):
+        """Миграция v9: очередь команд и push-события, общие для воркеров.
+        
+        command_jobs - задачи очереди команд (command_queue.py): любой
+        воркер видит задачу по id, повторы отсекаются, а команды одного
+        автомобиля выполняются по очереди (busy - задача держит очередь
+        автомобиля до конца подтверждения). events - последние события
+        EventHub со сквозной нумерацией для Last-Event-ID.
+        """
+        await self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS command_jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                vin TEXT NOT NULL,
+                command TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                busy INTEGER NOT NULL DEFAULT 1,
+                owner_pid INTEGER NOT NULL,
+                submitted_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                data TEXT
+            )
+        """)
+        await self.connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_command_jobs_vin_busy ON command_jobs(vin, busy, seq)
+        """)
+        await self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+    
+    async def _load_payload_dictionaries(self):
+        """Загрузить словари сжатия и выбрать словарь для новых записей."""
+        cursor = await self.connection.execute("""
+            SELECT id, algorithm, data FROM payload_dictionaries ORDER BY id
+        """)
+        active_id = 0
+        for dictionary_id, algorithm, data in await cursor.fetchall():
+            self.codec.add_dictionary(dictionary_id, algorithm, data)
+            if algorithm == self.codec.algorithm:
+                active_id = dictionary_id
+        if self.storage.compression_dictionary:
+            self.codec.use_dictionary(active_id)
+    
+    async def save_vehicle_status(self, status: VehicleStatus) -> Optional[int]:
+        """Сохранить статус автомобиля.
+        
+        Если отслеживаемые поля не изменились (в пределах допусков), новая
+        строка не пишется - продлевается valid_until предыдущей (raw_data
+        при этом не сравнивается и остается от первой записи). raw_data
+        хранится сжатым: полная копия раз в keyframe_interval строк,
+        в остальных строках - дельта относительно этой копии.
+        Возвращает id строки, в которую попал статус.
+        """
+        try:
+            async with self._status_lock:
+                timestamp = _to_epoch(status.timestamp)
+                previous = await self._get_last_status_state()
+                
+                if previous and self._is_status_unchanged(previous, status, timestamp):
+                    await self.connection.execute("""
+                        UPDATE vehicle_status SET valid_until = ? WHERE id = ?
+                    """, (timestamp, previous['id']))
+                    await self.connection.commit()
+                    previous['valid_until'] = timestamp
+                    return previous['id']
+                
+                raw_kind, raw_base_id, raw_value = self._encode_status_payload(previous, status.raw_data)
+                
+                cursor = await self.connection.execute("""
+                    INSERT INTO vehicle_status (
+                        timestamp, battery_level, fuel_level, range_electric, range_fuel,
+                        latitude, longitude, locked, engine_running, climate_on,
+                        temperature_inside, temperature_outside, raw_data,
+                        valid_until, raw_kind, raw_base_id
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    timestamp,
+                    status.battery_level,
+                    status.fuel_level,
+                    status.range_electric,
+                    status.range_fuel,
+                    status.latitude,
+                    status.longitude,
+                    status.locked,
+                    status.engine_running,
+                    status.climate_on,
+                    status.temperature_inside,
+                    status.temperature_outside,
+                    raw_value,
+                    timestamp,
+                    raw_kind,
+                    raw_base_id
+                ))
+                await self.connection.commit()
+                
+                row_id = cursor.lastrowid
+                self._last_status = self._status_state(row_id, timestamp, status.model_dump())
+                if raw_kind == 'full':
+                    self._last_status.update(keyframe_id=row_id, keyframe_payload=status.raw_data, rows_since_keyframe=0)
+                else:
+                    self._last_status.update(
+                        keyframe_id=previous.get('keyframe_id') if previous else None,
+                        keyframe_payload=previous.get('keyframe_payload') if previous else None,
+                        rows_since_keyframe=previous.get('rows_since_keyframe', 0) + (1 if raw_kind else 0) if previous else 0
+                    )
+                return row_id
         except Exception as e:
             logger.error(f"Ошибка сохранения статуса автомобиля: {e}")
+            self._last_status = None
             raise
     
+    @staticmethod
+    def _status_state(row_id: int, timestamp: int, fields: Dict) -> Dict:
+        """Состояние последней строки статуса для дедупликации."""
+        state = {field: fields.get(field) for field in STATUS_FIELDS}
+        state.update(id=row_id, timestamp=timestamp, valid_until=timestamp)
+        return state
+    
+    async def _get_last_status_state(self) -> Optional[Dict]:
+        """Последняя строка статуса (из памяти или, после запуска, из базы)."""
+        if self._last_status is not None:
+            return self._last_status
+        
+        cursor = await self.connection.execute(f"""
+            SELECT id, timestamp, valid_until, raw_kind, raw_base_id, {", ".join(STATUS_FIELDS)}
+            FROM vehicle_status ORDER BY id DESC LIMIT 1
+        """)
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        
+        row_id, timestamp, valid_until, raw_kind, raw_base_id = row[:5]
+        state = self._status_state(row_id, timestamp, dict(zip(STATUS_FIELDS, row[5:])))
+        state['valid_until'] = valid_until or timestamp
+        
+        keyframe_id = row_id if raw_kind == 'full' else raw_base_id
+        if keyframe_id is not None:
+            cursor = await self.connection.execute("""
+                SELECT raw_data FROM vehicle_status WHERE id = ?
+            """, (keyframe_id,))
+            keyframe_row = await cursor.fetchone()
+            cursor = await self.connection.execute("""
+                SELECT COUNT(*) FROM vehicle_status WHERE raw_base_id = ?
+            """, (keyframe_id,))
+            count_row = await cursor.fetchone()
+            state.update(
+                keyframe_id=keyframe_id,
+                keyframe_payload=self.codec.decode(keyframe_row[0]) if keyframe_row else None,
+                rows_since_keyframe=count_row[0] if count_row else 0
+            )
+        
+        self._last_status = state
+        return state
+    
+    def _is_status_unchanged(self, previous: Dict, status: VehicleStatus, timestamp: int) -> bool:
+        """Совпадает ли новый статус с предыдущим в пределах допусков."""
+        settings = self.storage
+        if not settings.dedup_enabled or timestamp < previous['timestamp']:
+            return False
+        if settings.max_unchanged_minutes and timestamp - previous['timestamp'] >= settings.max_unchanged_minutes * 60:
+            return False
+        
+        for field in settings.exact_fields:
+            if getattr(status, field) != previous.get(field):
+                return False
+        for field, tolerance in settings.tolerances.items():
+            old_value, new_value = previous.get(field), getattr(status, field, None)
+            if old_value is None or new_value is None:
+                if old_value is not new_value:
+                    return False
+            elif abs(new_value - old_value) > tolerance:
+                return False
+        return True
+    
+    def _encode_status_payload(self, previous: Optional[Dict], payload: Optional[Dict]):
+        """Выбрать представление raw_data: (raw_kind, raw_base_id, значение)."""
+        if not payload:
+            return None, None, None
+        
+        full_value = self.codec.encode(payload)
+        keyframe_payload = previous.get('keyframe_payload') if previous else None
+        if (
+            keyframe_payload is None
+            or previous.get('rows_since_keyframe', 0) + 1 >= self.storage.keyframe_interval
+        ):
+            return 'full', None, full_value
+        
+        delta_value = self.codec.encode(diff_payload(keyframe_payload, payload))
+        # Дельта, сравнимая по размеру с полной копией, не дает выигрыша
+        if len(delta_value) * 2 >= len(full_value):
+            return 'full', None, full_value
+        return 'delta', previous['keyframe_id'], delta_value
+    
+    async def _load_status_payload(self, raw_kind: Optional[str], raw_base_id: Optional[int], raw_data) -> Optional[Dict]:
+        """Восстановить полный raw_data строки статуса."""
+        if raw_data is None:
+            return None
+        if raw_kind != 'delta':
+            return self.codec.decode(raw_data)
+        
+        cursor = await self.connection.execute("""
+            SELECT raw_data FROM vehicle_status WHERE id = ?
+        """, (raw_base_id,))
+        base_row = await cursor.fetchone()
+        if not base_row:
+            logger.warning(f"Не найдена ключевая запись raw_data {raw_base_id}")
+            return None
+        return apply_diff(self.codec.decode(base_row[0]), self.codec.decode(raw_data))
+    
+    async def _status_row_to_dict(self, cursor, row) -> Dict:
+        """Преобразовать строку vehicle_status в словарь с полным raw_data."""
+        columns = [description[0] for description in cursor.description]
+        status = dict(zip(columns, row))
+        status['raw_data'] = await self._load_status_payload(
+            status.pop('raw_kind', None), status.pop('raw_base_id', None), status.get('raw_data')
+        )
+        status['timestamp'] = _epoch_to_iso(status['timestamp'])
+        status['valid_until'] = _epoch_to_iso(status.get('valid_until'))
+        return status
+    
+    async def _rebase_status_payloads(self, window_start: int, window_end: int):
+        """Перед удалением окна retention сделать ключевыми дельты, чья база удаляется."""
+        cursor = await self.connection.execute("""
+            SELECT id, raw_base_id, raw_data FROM vehicle_status
+            WHERE raw_kind = 'delta'
+              AND raw_base_id IN (
+                  SELECT id FROM vehicle_status
+                  WHERE timestamp >= ? AND timestamp < ?
+                    AND id < (SELECT MAX(id) FROM vehicle_status)
+              )
+              AND NOT (
+                  timestamp >= ? AND timestamp < ?
+                  AND id < (SELECT MAX(id) FROM vehicle_status)
+              )
+        """, (window_start, window_end, window_start, window_end))
+        rows = await cursor.fetchall()
+        for row_id, raw_base_id, raw_data in rows:
+            payload = await self._load_status_payload('delta', raw_base_id, raw_data)
+            await self.connection.execute("""
+                UPDATE vehicle_status SET raw_kind = 'full', raw_base_id = NULL, raw_data = ?
+                WHERE id = ?
+            """, (self.codec.encode(payload), row_id))
+        if rows:
+            # Ключевая запись сменилась - перечитать состояние при следующей записи
+            self._last_status = None
+    
     async def get_latest_status(self) -> Optional[Dict]:
         """Получить последний статус автомобиля."""
         try:
@@ -168,13 +814,45 @@ class DatabaseManager:
             row = await cursor.fetchone()
             
             if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
+                return await self._status_row_to_dict(cursor, row)
             return None
         except Exception as e:
             logger.error(f"Ошибка получения последнего статуса: {e}")
             return None
     
+    async def get_status_at(self, moment: datetime) -> Optional[Dict]:
+        """Получить статус автомобиля, действовавший в указанный момент."""
+        try:
+            cursor = await self.connection.execute("""
+                SELECT * FROM vehicle_status
+                WHERE timestamp <= ?
+                ORDER BY timestamp DESC
+                LIMIT 1
+            """, (_to_epoch(moment),))
+            row = await cursor.fetchone()
+            
+            if row:
+                return await self._status_row_to_dict(cursor, row)
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка получения статуса на момент {moment}: {e}")
+            return None
+    
+    async def get_recent_status_rows(self, limit: int) -> List[Dict]:
+        """Последние limit статусов без raw_data по возрастанию времени.
+        
+        timestamp и valid_until - секунды эпохи. Используется для
+        прогрева буфера снимков в памяти (vehicle_state.py).
+        """
+        columns = ("timestamp", "valid_until") + STATUS_FIELDS
+        cursor = await self.connection.execute(f"""
+            SELECT {", ".join(columns)} FROM vehicle_status
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """, (limit,))
+        rows = await cursor.fetchall()
+        return [dict(zip(columns, row)) for row in reversed(rows)]
+    
     async def get_phev_statistics(self, period: str) -> Dict:
         """Получить статистику автомобиля за период."""
         try:
@@ -217,7 +895,7 @@ class DatabaseManager:
                     AVG(efficiency_score) as avg_efficiency
                 FROM trips 
                 WHERE start_time >= ?
-            """, (start_time,))
+            """, (_to_epoch(start_time),))
             
             row = await cursor.fetchone()
             
@@ -330,7 +1008,7 @@ class DatabaseManager:
                     COUNT(*) as trip_count
                 FROM trips 
                 WHERE start_time >= ? AND start_time < ?
-            """, (start_date, end_date))
+            """, (_to_epoch(start_date), _to_epoch(end_date)))
             
             row = await cursor.fetchone()
             
@@ -470,43 +1148,166 @@ class DatabaseManager:
             raise
     
     async def get_recent_trips(self, limit: int = 10) -> List[Dict]:
-        """Получить последние поездки."""
+        """Получить сводки последних поездок (без маршрута, см. get_trip_route)."""
         try:
-            cursor = await self.connection.execute("""
-                SELECT * FROM trips 
+            cursor = await self.connection.execute(f"""
+                SELECT {", ".join(TRIP_SUMMARY_COLUMNS)} FROM trips 
                 ORDER BY start_time DESC 
                 LIMIT ?
             """, (limit,))
-            
+            cursor.row_factory = _trip_summary_row
+            return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения поездок: {e}")
+            return []
+    
+    async def get_recent_trips_json(self, limit: int = 10) -> str:
+        """Сводки последних поездок JSON-массивом, собранным самой SQLite."""
+        try:
+            cursor = await self.connection.execute(f"""
+                SELECT json_group_array({_trip_summary_json_object()}) FROM (
+                    SELECT {", ".join(TRIP_SUMMARY_COLUMNS)} FROM trips
+                    ORDER BY start_time DESC
+                    LIMIT ?
+                )
+            """, (limit,))
+            row = await cursor.fetchone()
+            return row[0] if row and row[0] else "[]"
+        except Exception as e:
+            logger.error(f"Ошибка получения поездок: {e}")
+            return "[]"
+    
+    async def find_trips_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                                 endpoint: str = "start", limit: int = 100) -> List[Dict]:
+        """Поездки, начавшиеся (endpoint="start") или закончившиеся ("end") в прямоугольнике."""
+        index = self._trip_spatial_index(endpoint)
+        try:
+            cursor = await self.connection.execute(f"""
+                SELECT {", ".join("t." + column for column in TRIP_SUMMARY_COLUMNS)}
+                FROM {index} AS s JOIN trips AS t ON t.id = s.id
+                WHERE s.min_lat >= ? AND s.max_lat <= ? AND s.min_lon >= ? AND s.max_lon <= ?
+                ORDER BY t.start_time DESC
+                LIMIT ?
+            """, (min_lat, max_lat, min_lon, max_lon, limit))
+            cursor.row_factory = _trip_summary_row
+            return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка поиска поездок в области: {e}")
+            return []
+    
+    async def find_trips_near(self, latitude: float, longitude: float, radius_km: float = 0.5,
+                              endpoint: str = "start", limit: int = 100) -> List[Dict]:
+        """Поездки, начавшиеся или закончившиеся в радиусе radius_km, ближайшие первыми."""
+        index = self._trip_spatial_index(endpoint)
+        point = "start" if endpoint == "start" else "end"
+        min_lat, max_lat, min_lon, max_lon = _radius_bbox(latitude, longitude, radius_km)
+        try:
+            cursor = await self.connection.execute(f"""
+                SELECT {", ".join("t." + column for column in TRIP_SUMMARY_COLUMNS)}, distance_km FROM (
+                    SELECT id, haversine_km(?, ?, min_lat, min_lon) AS distance_km FROM {index}
+                    WHERE min_lat >= ? AND max_lat <= ? AND min_lon >= ? AND max_lon <= ?
+                ) AS s JOIN trips AS t ON t.id = s.id
+                WHERE s.distance_km <= ?
+                ORDER BY s.distance_km
+                LIMIT ?
+            """, (latitude, longitude, min_lat, max_lat, min_lon, max_lon, radius_km, limit))
             rows = await cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            
             trips = []
             for row in rows:
-                trip = dict(zip(columns, row))
-                # Преобразовать JSON данные
-                if trip['route_data']:
-                    trip['route_data'] = json.loads(trip['route_data'])
+                trip = _trip_summary_row(cursor, row[:-1])
+                trip[f"{point}_distance_km"] = round(row[-1], 3)
                 trips.append(trip)
-            
             return trips
         except Exception as e:
-            logger.error(f"Ошибка получения поездок: {e}")
+            logger.error(f"Ошибка поиска поездок рядом с точкой: {e}")
+            return []
+    
+    async def find_positions_near(self, latitude: float, longitude: float, radius_km: float = 0.5,
+                                  limit: int = 100) -> List[Dict]:
+        """Записи статуса, в которых автомобиль находился в радиусе radius_km."""
+        min_lat, max_lat, min_lon, max_lon = _radius_bbox(latitude, longitude, radius_km)
+        try:
+            cursor = await self.connection.execute("""
+                SELECT v.id, v.timestamp, v.valid_until, v.latitude, v.longitude, s.distance_km FROM (
+                    SELECT id, haversine_km(?, ?, min_lat, min_lon) AS distance_km FROM status_position_index
+                    WHERE min_lat >= ? AND max_lat <= ? AND min_lon >= ? AND max_lon <= ?
+                ) AS s JOIN vehicle_status AS v ON v.id = s.id
+                WHERE s.distance_km <= ?
+                ORDER BY v.timestamp DESC
+                LIMIT ?
+            """, (latitude, longitude, min_lat, max_lat, min_lon, max_lon, radius_km, limit))
+            return [
+                {
+                    'id': row[0],
+                    'timestamp': _epoch_to_iso(row[1]),
+                    'valid_until': _epoch_to_iso(row[2]),
+                    'latitude': row[3],
+                    'longitude': row[4],
+                    'distance_km': round(row[5], 3)
+                }
+                for row in await cursor.fetchall()
+            ]
+        except Exception as e:
+            logger.error(f"Ошибка поиска положений рядом с точкой: {e}")
             return []
     
+    async def get_parking_locations(self, precision: int = 3, limit: int = 10) -> List[Dict]:
+        """Частые места стоянки: конечные точки поездок, сгруппированные по сетке.
+        
+        precision - знаков после запятой в координатах (3 - ячейка около 100 м).
+        Читается только индекс конечных точек, без обращения к trips.
+        """
+        try:
+            cursor = await self.connection.execute("""
+                SELECT ROUND(min_lat, ?) AS lat, ROUND(min_lon, ?) AS lon,
+                       COUNT(*) AS visits, AVG(min_lat), AVG(min_lon)
+                FROM trip_end_index
+                GROUP BY lat, lon
+                ORDER BY visits DESC
+                LIMIT ?
+            """, (precision, precision, limit))
+            return [
+                # R*Tree хранит координаты с точностью float32 (~0.5 м)
+                {'latitude': round(row[3], 6), 'longitude': round(row[4], 6), 'visits': row[2]}
+                for row in await cursor.fetchall()
+            ]
+        except Exception as e:
+            logger.error(f"Ошибка получения мест стоянки: {e}")
+            return []
+    
+    @staticmethod
+    def _trip_spatial_index(endpoint: str) -> str:
+        if endpoint not in ("start", "end"):
+            raise ValueError(f"endpoint должен быть start или end, получено: {endpoint}")
+        return f"trip_{endpoint}_index"
+    
+    async def get_trip_route(self, trip_id: int) -> Optional[Dict]:
+        """Загрузить маршрут поездки по требованию."""
+        try:
+            cursor = await self.connection.execute("""
+                SELECT route_data FROM trips WHERE id = ?
+            """, (trip_id,))
+            row = await cursor.fetchone()
+            if row and row[0]:
+                return json.loads(row[0])
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка получения маршрута поездки {trip_id}: {e}")
+            return None
+    
     async def get_trip_by_time(self, start_time: datetime) -> Dict:
         """Получить поездку по времени начала."""
         try:
             cursor = await self.connection.execute("""
                 SELECT * FROM trips WHERE start_time = ?
-            """, (start_time,))
+            """, (_to_epoch(start_time),))
             
             row = await cursor.fetchone()
             if row:
                 return {
                     'id': row[0],
-                    'start_time': row[1],
-                    'end_time': row[2],
+                    'start_time': _epoch_to_iso(row[1]),
+                    'end_time': _epoch_to_iso(row[2]),
                     'start_latitude': row[3],
                     'start_longitude': row[4],
                     'end_latitude': row[5],
@@ -537,8 +1338,8 @@ class DatabaseManager:
                     avg_speed, max_speed, efficiency_score, route_data
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
-                trip_data.get('start_time'),
-                trip_data.get('end_time'),
+                _to_epoch(trip_data.get('start_time')),
+                _to_epoch(trip_data.get('end_time')),
                 trip_data.get('start_latitude', 0.0),
                 trip_data.get('start_longitude', 0.0),
                 trip_data.get('end_latitude', 0.0),
@@ -558,37 +1359,185 @@ class DatabaseManager:
             logger.error(f"Ошибка сохранения поездки: {e}")
             raise
     
-    async def save_command(self, command_type: str, status: str, response_data: Dict = None, error_message: str = None):
-        """Сохранить выполненную команду."""
+    async def save_command(self, command_type: str, status: str, response_data: Dict = None,
+                           error_message: str = None) -> Optional[int]:
+        """Сохранить выполненную команду; вернуть id записи."""
         try:
-            await self.connection.execute("""
+            cursor = await self.connection.execute("""
                 INSERT INTO commands (timestamp, command_type, status, response_data, error_message)
                 VALUES (?, ?, ?, ?, ?)
             """, (
-                datetime.now(),
+                _to_epoch(datetime.now()),
                 command_type,
                 status,
-                json.dumps(response_data) if response_data else None,
+                self.codec.encode(response_data) if response_data else None,
                 error_message
             ))
             await self.connection.commit()
+            return cursor.lastrowid
         except Exception as e:
             logger.error(f"Ошибка сохранения команды: {e}")
+            return None
+    
+    async def update_command_response(self, command_id: int, response_data: Dict):
+        """Заменить ответ сохраненной команды (например, после подтверждения)."""
+        try:
+            await self.connection.execute(
+                "UPDATE commands SET response_data = ? WHERE id = ?",
+                (self.codec.encode(response_data) if response_data else None, command_id)
+            )
+            await self.connection.commit()
+        except Exception as e:
+            logger.error(f"Ошибка обновления команды: {e}")
+    
+    async def _get_history_page(self, table: str, time_column: str, columns, limit: int,
+                                cursor: Optional[str], start: Optional[datetime],
+                                end: Optional[datetime]) -> Dict:
+        """Страница истории от новых к старым с пагинацией по ключу (time, id).
+        
+        Условие (time, id) < курсор и ORDER BY time DESC, id DESC идут по
+        индексу времени (rowid входит в каждый индекс), поэтому глубина
+        пролистывания не влияет на стоимость запроса, в отличие от OFFSET.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions, params = [], []
+        if start is not None:
+            conditions.append(f"{time_column} >= ?")
+            params.append(_to_epoch(start))
+        if end is not None:
+            conditions.append(f"{time_column} < ?")
+            params.append(_to_epoch(end))
+        if cursor:
+            conditions.append(f"({time_column}, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        db_cursor = await self.connection.execute(f"""
+            SELECT {", ".join(columns)} FROM {table}
+            {where}
+            ORDER BY {time_column} DESC, id DESC
+            LIMIT ?
+        """, (*params, limit + 1))
+        rows = await db_cursor.fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = dict(zip(columns, rows[-1]))
+            next_cursor = encode_cursor(last[time_column], last["id"])
+        
+        items = []
+        for row in rows:
+            item = dict(zip(columns, row))
+            for column in ("timestamp", "start_time", "end_time", "valid_until"):
+                if column in item:
+                    item[column] = _epoch_to_iso(item[column])
+            items.append(item)
+        return {"items": items, "next_cursor": next_cursor}
+    
+    async def iter_metric_points(self, metric: str, start: int, end: int,
+                                 batch_size: int = 2000) -> AsyncIterator[List[tuple]]:
+        """Точки (время, значение) метрики за [start, end) по возрастанию времени.
+        
+        Объединяет сырые записи (включая конец интервала valid_until
+        у продленных строк) и средние из vehicle_status_rollup.
+        Отдает порциями по batch_size, не загружая ряд целиком.
+        """
+        if metric not in ROLLUP_METRICS:
+            raise ValueError(f"Неизвестная метрика: {metric}")
+        cursor = await self.connection.execute(f"""
+            SELECT t, v FROM (
+                SELECT timestamp AS t, {metric} AS v FROM vehicle_status
+                WHERE timestamp >= ? AND timestamp < ? AND {metric} IS NOT NULL
+                UNION ALL
+                SELECT valid_until, {metric} FROM vehicle_status
+                WHERE timestamp < ? AND valid_until > timestamp
+                  AND valid_until >= ? AND valid_until < ? AND {metric} IS NOT NULL
+                UNION ALL
+                SELECT bucket_start + bucket_seconds / 2, {metric}_avg FROM vehicle_status_rollup
+                WHERE bucket_start >= ? AND bucket_start < ? AND {metric}_avg IS NOT NULL
+            )
+            ORDER BY t
+        """, (start, end, end, start, end, start, end))
+        try:
+            while True:
+                batch = await cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            await cursor.close()
+    
+    async def get_trips_page(self, limit: int = 50, cursor: Optional[str] = None,
+                             start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict:
+        """Страница сводок поездок (по времени начала)."""
+        return await self._get_history_page(
+            "trips", "start_time", TRIP_SUMMARY_COLUMNS, limit, cursor, start, end
+        )
+    
+    async def get_status_page(self, limit: int = 50, cursor: Optional[str] = None,
+                              start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict:
+        """Страница истории статусов (без raw_data)."""
+        return await self._get_history_page(
+            "vehicle_status", "timestamp", ("id", "timestamp", "valid_until") + STATUS_FIELDS,
+            limit, cursor, start, end
+        )
+    
+    async def get_commands_page(self, limit: int = 50, cursor: Optional[str] = None,
+                                start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict:
+        """Страница истории команд (без response_data)."""
+        return await self._get_history_page(
+            "commands", "timestamp", ("id", "timestamp", "command_type", "status", "error_message"),
+            limit, cursor, start, end
+        )
+    
+    async def get_recent_commands(self, limit: int = 50) -> List[Dict]:
+        """Получить последние выполненные команды."""
+        try:
+            cursor = await self.connection.execute("""
+                SELECT id, timestamp, command_type, status, response_data, error_message
+                FROM commands
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            """, (limit,))
+            rows = await cursor.fetchall()
+            
+            columns = [description[0] for description in cursor.description]
+            commands = []
+            for row in rows:
+                command = dict(zip(columns, row))
+                command['timestamp'] = _epoch_to_iso(command['timestamp'])
+                command['response_data'] = self.codec.decode(command['response_data'])
+                commands.append(command)
+            return commands
+        except Exception as e:
+            logger.error(f"Ошибка получения команд: {e}")
+            return []
     
     async def add_notification(self, notification_type: str, title: str, message: str, data: Dict = None):
         """Добавить уведомление."""
         try:
-            await self.connection.execute("""
+            timestamp = _to_epoch(datetime.now())
+            cursor = await self.connection.execute("""
                 INSERT INTO notifications (timestamp, type, title, message, data)
                 VALUES (?, ?, ?, ?, ?)
             """, (
-                datetime.now(),
+                timestamp,
                 notification_type,
                 title,
                 message,
                 json.dumps(data) if data else None
             ))
             await self.connection.commit()
+            if self.on_notification:
+                self.on_notification({
+                    "id": cursor.lastrowid,
+                    "timestamp": _epoch_to_iso(timestamp),
+                    "type": notification_type,
+                    "title": title,
+                    "message": message,
+                    "data": data,
+                })
         except Exception as e:
             logger.error(f"Ошибка добавления уведомления: {e}")
     
@@ -607,6 +1556,7 @@ class DatabaseManager:
             notifications = []
             for row in rows:
                 notification = dict(zip(columns, row))
+                notification['timestamp'] = _epoch_to_iso(notification['timestamp'])
                 if notification['data']:
                     notification['data'] = json.loads(notification['data'])
                 notifications.append(notification)
@@ -641,7 +1591,7 @@ class DatabaseManager:
                     SUM(electricity_consumed) as electricity_consumed
                 FROM trips 
                 WHERE start_time >= ? AND start_time < ?
-            """, (start_of_day, end_of_day))
+            """, (_to_epoch(start_of_day), _to_epoch(end_of_day)))
             
             row = await cursor.fetchone()
             
@@ -667,40 +1617,390 @@ class DatabaseManager:
             logger.error(f"Ошибка получения сводки за день: {e}")
             return {}
     
-    async def cleanup_old_data(self, days_to_keep: int = 365):
-        """Очистить старые данные."""
+    async def cleanup_old_data(self, commands_days: Optional[int] = None) -> Dict:
+        """Очистить старые данные и понизить детализацию истории статусов.
+        
+        Сроки хранения берутся из RetentionConfig; commands_days заменяет
+        только срок хранения команд. Ошибка пробрасывается, чтобы
+        планировщик записал неудачный запуск.
+        """
         try:
-            cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+            engine = RetentionEngine(self.connection, self.retention,
+                                     before_delete=self._rebase_status_payloads)
+            now = datetime.now()
             
-            # Удалить старые статусы (оставить только последний за каждый день)
-            await self.connection.execute("""
-                DELETE FROM vehicle_status 
-                WHERE timestamp < ? 
-                AND id NOT IN (
-                    SELECT MAX(id) 
-                    FROM vehicle_status 
-                    WHERE timestamp < ?
-                    GROUP BY DATE(timestamp)
-                )
-            """, (cutoff_date, cutoff_date))
+            # Сырые статусы -> средние за интервал -> почасовые min/max/avg
+            stats = await engine.run(_to_epoch(now))
             
             # Удалить старые команды
-            await self.connection.execute("""
-                DELETE FROM commands WHERE timestamp < ?
-            """, (cutoff_date,))
+            commands_days = commands_days or self.retention.commands_days
+            stats["commands_deleted"] = await engine.delete_older_than(
+                "commands", _to_epoch(now - timedelta(days=commands_days))
+            )
             
-            # Удалить прочитанные уведомления старше 30 дней
-            notification_cutoff = datetime.now() - timedelta(days=30)
-            await self.connection.execute("""
-                DELETE FROM notifications 
-                WHERE timestamp < ? AND read = TRUE
-            """, (notification_cutoff,))
+            # Удалить прочитанные уведомления
+            notification_cutoff = now - timedelta(days=self.retention.notifications_days)
+            stats["notifications_deleted"] = await engine.delete_older_than(
+                "notifications", _to_epoch(notification_cutoff), condition="read = TRUE"
+            )
             
-            await self.connection.commit()
-            logger.info(f"Очистка старых данных завершена (старше {days_to_keep} дней)")
+            logger.info(f"Очистка старых данных завершена: {stats}")
+            return stats
             
         except Exception as e:
             logger.error(f"Ошибка очистки данных: {e}")
+            raise
+    
+    async def train_payload_dictionary(self, sample_limit: int = 500) -> int:
+        """Обучить словарь сжатия на последних полных raw_data и ответах команд.
+        
+        Новый словарь начинает использоваться для записи, если включен
+        storage.compression_dictionary. Старые строки остаются читаемыми
+        и переупаковываются командой compact_payloads.
+        """
+        samples = []
+        for query in (
+            "SELECT raw_data FROM vehicle_status WHERE raw_kind = 'full' ORDER BY id DESC LIMIT ?",
+            "SELECT response_data FROM commands WHERE response_data IS NOT NULL ORDER BY id DESC LIMIT ?",
+        ):
+            cursor = await self.connection.execute(query, (sample_limit,))
+            samples.extend(self.codec.decode(row[0]) for row in await cursor.fetchall())
+        
+        algorithm = self.codec.algorithm
+        data = await asyncio.to_thread(train_dictionary, samples, algorithm, self.storage.dictionary_size)
+        
+        cursor = await self.connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM payload_dictionaries")
+        dictionary_id = (await cursor.fetchone())[0]
+        self.codec.add_dictionary(dictionary_id, algorithm, data)
+        await self.connection.execute("""
+            INSERT INTO payload_dictionaries (id, algorithm, created_at, sample_count, data)
+            VALUES (?, ?, ?, ?, ?)
+        """, (dictionary_id, algorithm, _to_epoch(datetime.now()), len(samples), data))
+        await self.connection.commit()
+        
+        if self.storage.compression_dictionary:
+            self.codec.use_dictionary(dictionary_id)
+        logger.info(f"Обучен словарь сжатия {dictionary_id} ({algorithm}, {len(data)} байт, {len(samples)} примеров)")
+        return dictionary_id
+    
+    async def compact_payloads(self, batch_size: int = 200) -> Dict:
+        """Переупаковать raw_data и response_data текущим алгоритмом и словарем.
+        
+        Обрабатывает только строки, записанные в другом формате (несжатый
+        JSON, другой алгоритм или словарь), короткими транзакциями.
+        """
+        stats = {}
+        for table, column in (("vehicle_status", "raw_data"), ("commands", "response_data")):
+            rows = bytes_before = bytes_after = 0
+            last_id = 0
+            while True:
+                async with self._status_lock:
+                    cursor = await self.connection.execute(f"""
+                        SELECT id, {column} FROM {table}
+                        WHERE id > ? AND {column} IS NOT NULL
+                        ORDER BY id LIMIT ?
+                    """, (last_id, batch_size))
+                    batch = await cursor.fetchall()
+                    for row_id, value in batch:
+                        if self.codec.is_current(value):
+                            continue
+                        packed = self.codec.encode(self.codec.decode(value))
+                        size = len(value.encode("utf-8") if isinstance(value, str) else value)
+                        if len(packed) >= size:
+                            # Короткий несжатый JSON: заголовок формата только увеличит строку
+                            continue
+                        await self.connection.execute(
+                            f"UPDATE {table} SET {column} = ? WHERE id = ?", (packed, row_id)
+                        )
+                        rows += 1
+                        bytes_before += size
+                        bytes_after += len(packed)
+                    await self.connection.commit()
+                if len(batch) < batch_size:
+                    break
+                last_id = batch[-1][0]
+                await asyncio.sleep(self.retention.batch_pause)
+            stats[f"{table}.{column}"] = {
+                "rows_rewritten": rows,
+                "bytes_before": bytes_before,
+                "bytes_after": bytes_after,
+                "bytes_saved": bytes_before - bytes_after,
+            }
+        logger.info(f"Переупаковка полезной нагрузки завершена: {stats}")
+        return stats
+    
+    async def get_payload_stats(self, sample_size: Optional[int] = 200) -> Dict:
+        """Статистика хранения raw_data и response_data.
+        
+        Число строк и занятые байты считаются в SQL по кодекам. bytes_json -
+        размер тех же данных в виде json.dumps полного документа (как они
+        хранились раньше): он оценивается по последним sample_size строкам
+        (None - точный подсчет по всем строкам, для manage.py),
+        bytes_saved - экономия относительно него.
+        """
+        stats = {
+            "algorithm": self.codec.algorithm,
+            "level": self.codec.level,
+            "dictionary_id": self.codec.active_dictionary_id,
+        }
+        for table, column in (("vehicle_status", "raw_data"), ("commands", "response_data")):
+            cursor = await self.connection.execute(f"""
+                SELECT CASE WHEN typeof({column}) = 'text' THEN '' ELSE hex(substr({column}, 1, 1)) END,
+                       COUNT(*), SUM(length(CAST({column} AS BLOB)))
+                FROM {table} WHERE {column} IS NOT NULL
+                GROUP BY 1
+            """)
+            codecs = {}
+            rows = stored = 0
+            for marker, count, size in await cursor.fetchall():
+                name = CODEC_NAMES.get(int(marker, 16), "zlib-legacy") if marker else "json"
+                codecs[name] = {"rows": count, "bytes_stored": size}
+                rows += count
+                stored += size
+            
+            sampled, sample_stored, sample_original = await self._sample_payload_sizes(table, column, sample_size)
+            # Оценка по выборке: та же степень сжатия для всех строк
+            original = round(stored * sample_original / sample_stored) if sample_stored else 0
+            stats[f"{table}.{column}"] = {
+                "rows": rows,
+                "codecs": codecs,
+                "bytes_stored": stored,
+                "bytes_json": original,
+                "bytes_saved": original - stored,
+                "ratio": round(stored / original, 3) if original else None,
+                "sampled_rows": sampled,
+            }
+        return stats
+    
+    async def _sample_payload_sizes(self, table: str, column: str, limit: Optional[int]):
+        """(строк, байт в базе, байт json.dumps) для последних limit строк."""
+        kind_column = "raw_kind, raw_base_id" if table == "vehicle_status" else "NULL, NULL"
+        cursor = await self.connection.execute(f"""
+            SELECT {kind_column}, {column} FROM {table}
+            WHERE {column} IS NOT NULL ORDER BY id DESC LIMIT ?
+        """, (-1 if limit is None else limit,))
+        rows = stored = original = 0
+        keyframes: Dict[int, Dict] = {}
+        while True:
+            batch = await cursor.fetchmany(500)
+            if not batch:
+                break
+            for raw_kind, raw_base_id, value in batch:
+                payload = self.codec.decode(value)
+                if raw_kind == 'delta':
+                    if raw_base_id not in keyframes:
+                        base_cursor = await self.connection.execute(
+                            "SELECT raw_data FROM vehicle_status WHERE id = ?", (raw_base_id,)
+                        )
+                        base_row = await base_cursor.fetchone()
+                        keyframes[raw_base_id] = self.codec.decode(base_row[0]) if base_row else {}
+                    payload = apply_diff(keyframes[raw_base_id], payload)
+                rows += 1
+                stored += len(value.encode("utf-8") if isinstance(value, str) else value)
+                original += len(json.dumps(payload).encode("utf-8"))
+        return rows, stored, original
+    
+    async def put_shared_state(self, key: str, value, updated_at: float) -> int:
+        """Записать общее значение и вернуть его новую версию."""
+        await self.connection.execute("""
+            INSERT INTO shared_state (key, version, updated_at, value) VALUES (?, 1, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                version = version + 1, updated_at = excluded.updated_at, value = excluded.value
+        """, (key, updated_at, json.dumps(value, ensure_ascii=False, default=str)))
+        cursor = await self.connection.execute("SELECT version FROM shared_state WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+        await self.connection.commit()
+        return row[0]
+    
+    async def get_shared_state_versions(self) -> Dict[str, int]:
+        """Версии всех общих значений (дешевый опрос без чтения самих значений)."""
+        cursor = await self.connection.execute("SELECT key, version FROM shared_state")
+        return {key: version for key, version in await cursor.fetchall()}
+    
+    async def get_shared_state(self, key: str) -> Optional[Dict]:
+        """Общее значение: {value, updated_at, version} или None."""
+        cursor = await self.connection.execute(
+            "SELECT value, updated_at, version FROM shared_state WHERE key = ?", (key,)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return None
+        return {"value": json.loads(row[0]), "updated_at": row[1], "version": row[2]}
+    
+    async def take_rate_limit_tokens(self, key: str, capacity: float, rate: float,
+                                     tokens: float, now: float) -> bool:
+        """Забрать tokens из общей маркерной корзины key, если они есть.
+        
+        Пополнение и списание - один UPDATE, поэтому воркеры не могут
+        потратить один и тот же токен дважды.
+        """
+        params = {"key": key, "capacity": capacity, "rate": rate, "tokens": tokens, "now": now}
+        await self.connection.execute("""
+            INSERT OR IGNORE INTO rate_limits (key, tokens, updated_at) VALUES (:key, :capacity, :now)
+        """, params)
+        cursor = await self.connection.execute("""
+            UPDATE rate_limits
+            SET tokens = MIN(:capacity, tokens + MAX(0, :now - updated_at) * :rate) - :tokens,
+                updated_at = :now
+            WHERE key = :key AND MIN(:capacity, tokens + MAX(0, :now - updated_at) * :rate) >= :tokens
+        """, params)
+        acquired = cursor.rowcount > 0
+        await self.connection.commit()
+        return acquired
+    
+    async def get_rate_limit_tokens(self, key: str, capacity: float, rate: float, now: float) -> float:
+        """Токенов в общей корзине key на момент now."""
+        cursor = await self.connection.execute("""
+            SELECT MIN(?, tokens + MAX(0, ? - updated_at) * ?) FROM rate_limits WHERE key = ?
+        """, (capacity, now, rate, key))
+        row = await cursor.fetchone()
+        return capacity if row is None else row[0]
+    
+    async def add_command_job(self, job: Dict, dedup_since: float) -> Optional[Dict]:
+        """Записать новую задачу очереди команд, если это не повтор.
+        
+        Повтор - задача с теми же автомобилем, командой и параметрами,
+        поставленная после dedup_since и не завершившаяся ошибкой; тогда
+        возвращается она, иначе None. Проверка и вставка - один INSERT,
+        поэтому два воркера не создадут одну задачу дважды.
+        """
+        cursor = await self.connection.execute("""
+            INSERT INTO command_jobs (id, vin, command, params, status, owner_pid, submitted_at, data)
+            SELECT :id, :vin, :command, :params, :status, :owner_pid, :submitted_at, :data
+            WHERE NOT EXISTS (
+                SELECT 1 FROM command_jobs
+                WHERE vin = :vin AND command = :command AND params = :params
+                  AND submitted_at >= :dedup_since AND status != 'failed'
+            )
+        """, {**job, "dedup_since": dedup_since})
+        inserted = cursor.rowcount > 0
+        await self.connection.commit()
+        if inserted:
+            return None
+        cursor = await self.connection.execute("""
+            SELECT * FROM command_jobs
+            WHERE vin = ? AND command = ? AND params = ? AND submitted_at >= ? AND status != 'failed'
+            ORDER BY seq DESC LIMIT 1
+        """, (job["vin"], job["command"], job["params"], dedup_since))
+        cursor.row_factory = aiosqlite.Row
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+    
+    async def claim_command_job(self, job_id: str, started_at: float) -> bool:
+        """Начать задачу, если раньше нее у автомобиля нет незавершенных задач."""
+        cursor = await self.connection.execute("""
+            UPDATE command_jobs SET status = 'running', started_at = ?
+            WHERE id = ? AND status = 'queued' AND NOT EXISTS (
+                SELECT 1 FROM command_jobs AS earlier
+                WHERE earlier.vin = command_jobs.vin AND earlier.busy AND earlier.seq < command_jobs.seq
+            )
+        """, (started_at, job_id))
+        claimed = cursor.rowcount > 0
+        await self.connection.commit()
+        return claimed
+    
+    async def get_blocking_command_jobs(self, job_id: str) -> List[Dict]:
+        """Незавершенные задачи того же автомобиля, поставленные раньше job_id."""
+        cursor = await self.connection.execute("""
+            SELECT earlier.id, earlier.owner_pid FROM command_jobs AS job
+            JOIN command_jobs AS earlier
+              ON earlier.vin = job.vin AND earlier.busy AND earlier.seq < job.seq
+            WHERE job.id = ?
+        """, (job_id,))
+        return [{"id": row[0], "owner_pid": row[1]} for row in await cursor.fetchall()]
+    
+    async def update_command_job(self, job: Dict, keep: int):
+        """Сохранить состояние задачи и забыть завершенные сверх последних keep."""
+        await self.connection.execute("""
+            UPDATE command_jobs
+            SET status = :status, busy = :busy, started_at = :started_at, finished_at = :finished_at, data = :data
+            WHERE id = :id
+        """, job)
+        if not job["busy"]:
+            await self.connection.execute("""
+                DELETE FROM command_jobs
+                WHERE NOT busy AND seq <= (SELECT MAX(seq) FROM command_jobs) - ?
+            """, (max(1, keep),))
+        await self.connection.commit()
+    
+    async def fail_command_jobs(self, job_ids: List[str], error: str, finished_at: float):
+        """Освободить очередь от задач, которые уже некому выполнить или подтвердить.
+        
+        Невыполненные задачи завершаются ошибкой error, у выполненных
+        подтверждение получает состояние failed с той же ошибкой.
+        """
+        if not job_ids:
+            return
+        data = json.dumps({"message": error, "error": error}, ensure_ascii=False)
+        await self.connection.executemany("""
+            UPDATE command_jobs
+            SET status = CASE WHEN status IN ('queued', 'running') THEN 'failed' ELSE status END,
+                busy = 0, finished_at = COALESCE(finished_at, ?),
+                data = CASE
+                    WHEN status IN ('queued', 'running') THEN ?
+                    WHEN json_extract(data, '$.confirmation.state') = 'pending'
+                        THEN json_set(data, '$.confirmation.state', 'failed', '$.confirmation.error', ?)
+                    ELSE data
+                END
+            WHERE id = ? AND busy
+        """, [(finished_at, data, error, job_id) for job_id in job_ids])
+        await self.connection.commit()
+    
+    async def get_command_job(self, job_id: str) -> Optional[Dict]:
+        """Задача очереди команд по id (строка command_jobs) или None."""
+        cursor = await self.connection.execute("SELECT * FROM command_jobs WHERE id = ?", (job_id,))
+        cursor.row_factory = aiosqlite.Row
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+    
+    async def get_command_jobs(self, limit: int = 20, owner_pid: Optional[int] = None,
+                               busy_only: bool = False) -> List[Dict]:
+        """Последние задачи очереди команд, новые первыми."""
+        conditions, params = [], []
+        if owner_pid is not None:
+            conditions.append("owner_pid = ?")
+            params.append(owner_pid)
+        if busy_only:
+            conditions.append("busy")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = await self.connection.execute(
+            f"SELECT * FROM command_jobs {where} ORDER BY seq DESC LIMIT ?", (*params, limit)
+        )
+        cursor.row_factory = aiosqlite.Row
+        return [dict(row) for row in await cursor.fetchall()]
+    
+    async def count_pending_command_jobs(self) -> int:
+        """Число невыполненных задач очереди команд всех воркеров."""
+        cursor = await self.connection.execute(
+            "SELECT COUNT(*) FROM command_jobs WHERE status IN ('queued', 'running')"
+        )
+        return (await cursor.fetchone())[0]
+    
+    async def add_event(self, event_type: str, data: str, keep: int) -> int:
+        """Записать push-событие (data - JSON) и вернуть его сквозной id."""
+        cursor = await self.connection.execute(
+            "INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)",
+            (event_type, data, datetime.now().timestamp())
+        )
+        event_id = cursor.lastrowid
+        await self.connection.execute("DELETE FROM events WHERE id <= ?", (event_id - max(1, keep),))
+        await self.connection.commit()
+        return event_id
+    
+    async def get_events_after(self, last_id: int, limit: int = 500) -> List[tuple]:
+        """События с id больше last_id: [(id, type, data JSON)] по возрастанию id."""
+        cursor = await self.connection.execute(
+            "SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+        )
+        return list(await cursor.fetchall())
+    
+    async def get_last_events(self, limit: int) -> List[tuple]:
+        """Последние limit событий по возрастанию id."""
+        cursor = await self.connection.execute(
+            "SELECT id, type, data FROM (SELECT id, type, data FROM events ORDER BY id DESC LIMIT ?) ORDER BY id",
+            (limit,)
+        )
+        return list(await cursor.fetchall())
     
     async def check_connection(self) -> bool:
         """Проверить соединение с базой данных."""
@@ -0,0 +1,201 @@
+"""
+Push-события для веб-интерфейса Toyota Dashboard
+
+EventHub рассылает события (status, command, notification) всем
+подписчикам - открытым вкладкам через Server-Sent Events (/api/stream)
+или WebSocket (/api/ws). Последние события хранятся в памяти, поэтому
+переподключившийся клиент получает пропущенное по Last-Event-ID.
+Медленный подписчик, переполнивший очередь, отключается и
+переподключается сам, догоняя историю по тому же Last-Event-ID.
+
+После start(db) события идут через таблицу events: publish записывает
+событие в базу, а каждый воркер uvicorn раз в poll_interval (и сразу
+после своей записи) читает новые строки и рассылает своим подписчикам.
+Так вкладка получает события всех воркеров, а id событий сквозные и
+Last-Event-ID работает при переподключении к другому воркеру.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Пауза переподключения EventSource, миллисекунды
+SSE_RETRY_MS = 5000
+# Комментарий-пинг, чтобы прокси не закрывали простаивающее соединение
+KEEPALIVE_SECONDS = 15
+
+class Event(NamedTuple):
+    id: Optional[int]
+    type: str
+    data: Any
+
+def event_json(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str, separators=(",", ":"))
+
+def format_sse(event: Event) -> str:
+    """Событие в формате text/event-stream."""
+    lines = []
+    if event.id is not None:
+        lines.append(f"id: {event.id}")
+    lines.append(f"event: {event.type}")
+    lines.append(f"data: {event_json(event.data)}")
+    return "\n".join(lines) + "\n\n"
+
+class Subscription:
+    """Подписка одного клиента: пропущенные события и очередь новых."""
+    
+    def __init__(self, hub: "EventHub", last_event_id: Optional[int], queue_size: int):
+        self.hub = hub
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        # Пропущенные события и признак, что история покрывает разрыв целиком
+        self.replay, self.covered = hub.replay(last_event_id)
+    
+    def deliver(self, event: Event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Подписчик не успевает получать события, соединение будет закрыто")
+            self.overflowed = True
+            self.hub.unsubscribe(self)
+    
+    async def events(self, keepalive: float = KEEPALIVE_SECONDS) -> AsyncIterator[Optional[Event]]:
+        """Пропущенные, затем новые события; None - пора отправить пинг."""
+        for event in self.replay:
+            yield event
+        while not self.overflowed:
+            try:
+                yield await asyncio.wait_for(self.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+    
+    def __enter__(self) -> "Subscription":
+        return self
+    
+    def __exit__(self, *exc):
+        self.hub.unsubscribe(self)
+
+class EventHub:
+    """Рассылка событий подписчикам с историей для повтора."""
+    
+    def __init__(self, history_size: int = 256, queue_size: int = 64):
+        self._history: Deque[Event] = deque(maxlen=history_size)
+        self._subscribers: Set[Subscription] = set()
+        self.queue_size = queue_size
+        # id от времени запуска: растут и после перезапуска сервера
+        self._last_id = int(time.time() * 1000)
+        # База с таблицей events (start); без нее события только в памяти процесса
+        self.db = None
+        # Как часто проверять события других воркеров (секунды)
+        self.poll_interval = 1.0
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+    
+    async def start(self, db):
+        """Перейти на общую таблицу events (запуск приложения)."""
+        rows = await db.get_last_events(self._history.maxlen)
+        self._history.clear()
+        self._history.extend(self._event(row) for row in rows)
+        # Сквозные id из базы: до первой записи новых событий нет
+        self._last_id = rows[-1][0] if rows else 0
+        self.db = db
+        self._tasks = [asyncio.create_task(self._write_loop()), asyncio.create_task(self._poll_loop())]
+    
+    async def stop(self):
+        """Записать оставшиеся события и остановить фоновые задачи."""
+        if self.db is None:
+            return
+        try:
+            await asyncio.wait_for(self._outbox.join(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не записано событий при остановке: {self._outbox.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.db = None
+    
+    @property
+    def last_event_id(self) -> int:
+        return self._last_id
+    
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+    
+    def publish(self, event_type: str, data: Any):
+        """Отправить событие всем подписчикам и сохранить в истории."""
+        if self.db is not None:
+            # id назначит база; подписчики получат событие из _poll_loop
+            self._outbox.put_nowait((event_type, event_json(data)))
+            return
+        self._last_id += 1
+        self._dispatch(Event(self._last_id, event_type, data))
+    
+    def _dispatch(self, event: Event):
+        self._last_id = event.id
+        self._history.append(event)
+        for subscription in list(self._subscribers):
+            subscription.deliver(event)
+    
+    @staticmethod
+    def _event(row: Tuple[int, str, str]) -> Event:
+        event_id, event_type, data = row
+        return Event(event_id, event_type, json.loads(data))
+    
+    async def _write_loop(self):
+        """Записывать события этого процесса в базу в порядке публикации."""
+        while True:
+            event_type, data = await self._outbox.get()
+            try:
+                await self.db.add_event(event_type, data, self._history.maxlen)
+                self._wakeup.set()
+            except Exception as e:
+                logger.error(f"Ошибка записи события {event_type}: {e}")
+            finally:
+                self._outbox.task_done()
+    
+    async def _poll_loop(self):
+        """Рассылать подписчикам новые события всех воркеров."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                for row in await self.db.get_events_after(self._last_id):
+                    self._dispatch(self._event(row))
+            except Exception as e:
+                logger.error(f"Ошибка чтения событий: {e}")
+    
+    def replay(self, last_event_id: Optional[int]) -> tuple:
+        """События после last_event_id и признак полного покрытия разрыва."""
+        if last_event_id is None or last_event_id > self._last_id:
+            return [], False
+        oldest = self._history[0].id if self._history else self._last_id + 1
+        if last_event_id < oldest - 1:
+            # Часть событий уже вытеснена: клиент начинает с текущего статуса
+            return [], False
+        return [event for event in self._history if event.id > last_event_id], True
+    
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """Подписаться; используется как контекстный менеджер."""
+        # Регистрация и снимок истории без await между ними: события не теряются
+        subscription = Subscription(self, last_event_id, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+# Глобальный концентратор событий
+event_hub = EventHub()
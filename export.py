@@ -0,0 +1,268 @@
+"""
+Потоковая выгрузка данных Toyota Dashboard
+
+Таблицы читаются отдельным соединением только для чтения порциями
+по курсору SQLite, поэтому расход памяти не зависит от размера
+таблицы, а сборщик данных продолжает писать (база в режиме WAL).
+
+Форматы: ndjson, csv, а при установленном pyarrow - parquet и arrow
+(поток Arrow IPC).
+"""
+
+import csv
+import io
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiosqlite
+
+from database import _epoch_to_iso, _to_epoch
+from payload_codec import apply_diff
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Параметры выгрузки таблиц: колонка фильтра по времени, порядок обхода
+# (по индексу, без сортировки в памяти) и колонки с JSON-нагрузкой
+EXPORT_TABLES = {
+    "trips": {
+        "time_column": "start_time",
+        "order_by": "start_time, id",
+        "time_columns": ("start_time", "end_time"),
+        "payload_columns": ("route_data",),
+    },
+    "vehicle_status": {
+        "time_column": "timestamp",
+        "order_by": "timestamp, id",
+        "time_columns": ("timestamp", "valid_until"),
+        "payload_columns": ("raw_data",),
+    },
+    "commands": {
+        "time_column": "timestamp",
+        "order_by": "timestamp, id",
+        "time_columns": ("timestamp",),
+        "payload_columns": ("response_data",),
+    },
+    "notifications": {
+        "time_column": "timestamp",
+        "order_by": "id",
+        "time_columns": ("timestamp",),
+        "payload_columns": ("data",),
+    },
+}
+
+# Служебные колонки, которые не выгружаются
+_INTERNAL_COLUMNS = {"raw_kind", "raw_base_id"}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+def available_formats() -> List[str]:
+    """Форматы, доступные в текущем окружении."""
+    formats = ["ndjson", "csv"]
+    if pa is not None:
+        formats += ["parquet", "arrow"]
+    return formats
+
+class TableExporter:
+    """Выгрузка одной таблицы в выбранном формате."""
+    
+    def __init__(self, db, table: str, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, batch_size: int = 1000):
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Таблица {table} не поддерживает выгрузку")
+        self.db = db
+        self.table = table
+        self.spec = EXPORT_TABLES[table]
+        self.start = start
+        self.end = end
+        self.batch_size = batch_size
+        self.columns: List[str] = []
+        self.column_types: Dict[str, str] = {}
+        # Последние ключевые записи raw_data для восстановления дельт
+        self._keyframes: "OrderedDict[int, Dict]" = OrderedDict()
+    
+    async def iter_batches(self) -> AsyncIterator[List[Dict]]:
+        """Строки таблицы порциями по batch_size."""
+        async with aiosqlite.connect(f"file:{self.db.db_path}?mode=ro", uri=True) as connection:
+            cursor = await connection.execute(f"PRAGMA table_info({self.table})")
+            table_info = await cursor.fetchall()
+            self.columns = [row[1] for row in table_info if row[1] not in _INTERNAL_COLUMNS]
+            self.column_types = {row[1]: (row[2] or "").upper() for row in table_info}
+            select_columns = [row[1] for row in table_info]
+            
+            conditions, params = [], []
+            time_column = self.spec["time_column"]
+            if self.start is not None:
+                conditions.append(f"{time_column} >= ?")
+                params.append(_to_epoch(self.start))
+            if self.end is not None:
+                conditions.append(f"{time_column} < ?")
+                params.append(_to_epoch(self.end))
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            
+            cursor = await connection.execute(f"""
+                SELECT {", ".join(select_columns)} FROM {self.table}
+                {where}
+                ORDER BY {self.spec["order_by"]}
+            """, params)
+            while True:
+                rows = await cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                yield [await self._prepare_row(connection, dict(zip(select_columns, row))) for row in rows]
+    
+    async def _prepare_row(self, connection: aiosqlite.Connection, row: Dict) -> Dict:
+        """Распаковать JSON-нагрузку и убрать служебные колонки."""
+        for column in self.spec["payload_columns"]:
+            row[column] = self.db.codec.decode(row[column])
+        if row.get("raw_kind") == "delta":
+            row["raw_data"] = await self._apply_keyframe(connection, row["raw_base_id"], row["raw_data"])
+        for column in _INTERNAL_COLUMNS:
+            row.pop(column, None)
+        return row
+    
+    async def _apply_keyframe(self, connection: aiosqlite.Connection, base_id: int, changes: Dict) -> Optional[Dict]:
+        base = self._keyframes.get(base_id)
+        if base is None:
+            cursor = await connection.execute("SELECT raw_data FROM vehicle_status WHERE id = ?", (base_id,))
+            base_row = await cursor.fetchone()
+            if not base_row:
+                return None
+            base = self.db.codec.decode(base_row[0])
+            self._keyframes[base_id] = base
+            if len(self._keyframes) > 4:
+                self._keyframes.popitem(last=False)
+        return apply_diff(base, changes)
+    
+    def _text_row(self, row: Dict) -> Dict:
+        """Строка для текстовых форматов: ISO-время, JSON-нагрузка."""
+        for column in self.spec["time_columns"]:
+            if column in row:
+                row[column] = _epoch_to_iso(row[column])
+        return row
+    
+    async def stream(self, fmt: str) -> AsyncIterator[bytes]:
+        """Выгрузка в формате fmt порциями байтов."""
+        if fmt not in available_formats():
+            raise ValueError(f"Формат {fmt} недоступен (доступны: {', '.join(available_formats())})")
+        if fmt == "ndjson":
+            generator = self._stream_ndjson()
+        elif fmt == "csv":
+            generator = self._stream_csv()
+        else:
+            generator = self._stream_arrow(fmt)
+        async for chunk in generator:
+            yield chunk
+    
+    async def _stream_ndjson(self) -> AsyncIterator[bytes]:
+        async for batch in self.iter_batches():
+            lines = [json.dumps(self._text_row(row), ensure_ascii=False, default=str) for row in batch]
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+    
+    async def _stream_csv(self) -> AsyncIterator[bytes]:
+        header_written = False
+        async for batch in self.iter_batches():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if not header_written:
+                writer.writerow(self.columns)
+                header_written = True
+            for row in batch:
+                row = self._text_row(row)
+                writer.writerow([
+                    json.dumps(row[column], ensure_ascii=False) if column in self.spec["payload_columns"]
+                    and row[column] is not None else row[column]
+                    for column in self.columns
+                ])
+            yield buffer.getvalue().encode("utf-8")
+        if not header_written:
+            # Пустая выгрузка: только заголовок (колонки известны после открытия таблицы)
+            yield (",".join(self.columns) + "\r\n").encode("utf-8")
+    
+    def _arrow_schema(self) -> "pa.Schema":
+        fields = []
+        for column in self.columns:
+            declared = self.column_types.get(column, "")
+            if column in self.spec["time_columns"]:
+                arrow_type = pa.timestamp("s", tz="UTC")
+            elif column in self.spec["payload_columns"]:
+                arrow_type = pa.string()  # JSON-текст
+            elif "INT" in declared:
+                arrow_type = pa.int64()
+            elif "REAL" in declared:
+                arrow_type = pa.float64()
+            elif "BOOL" in declared:
+                arrow_type = pa.bool_()
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(column, arrow_type))
+        return pa.schema(fields)
+    
+    async def _stream_arrow(self, fmt: str) -> AsyncIterator[bytes]:
+        sink = _ChunkSink()
+        writer = None
+        schema = None
+        async for batch in self.iter_batches():
+            if writer is None:
+                schema = self._arrow_schema()
+                bool_columns = [field.name for field in schema if pa.types.is_boolean(field.type)]
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+                else:
+                    writer = pa.ipc.new_stream(sink, schema)
+            for row in batch:
+                for column in self.spec["payload_columns"]:
+                    if row[column] is not None:
+                        row[column] = json.dumps(row[column], ensure_ascii=False)
+                # SQLite хранит BOOLEAN как 0/1
+                for column in bool_columns:
+                    if row[column] is not None:
+                        row[column] = bool(row[column])
+            # Каждая порция - отдельная группа строк, память не растет с размером таблицы
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        if writer is None:
+            schema = self._arrow_schema()
+            writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+        writer.close()
+        yield sink.drain()
+
+class _ChunkSink(io.RawIOBase):
+    """Файлоподобный приемник, из которого записанные байты забираются порциями."""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
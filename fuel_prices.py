@@ -3,16 +3,16 @@
 
 Автоматически обновляет цены с сайта autotraveler.ru раз в день.
 Определяет местоположение автомобиля и использует цены соответствующей страны.
+httpx и BeautifulSoup импортируются только при обращении к сети: приложению
+при запуске достаточно кэша цен.
 """
 
-import httpx
 import asyncio
 from typing import Dict, Optional
 from loguru import logger
 from datetime import datetime, timedelta
 import json
 import re
-from bs4 import BeautifulSoup
 import os
 
 class FuelPriceService:
@@ -84,6 +84,8 @@ class FuelPriceService:
         try:
             logger.info("Загружаем актуальные цены с autotraveler.ru...")
             
+            import httpx
+            from bs4 import BeautifulSoup
             async with httpx.AsyncClient(timeout=30.0) as client:
                 response = await client.get(self.autotraveler_url)
                 
@@ -175,6 +177,7 @@ class FuelPriceService:
     async def get_country_by_coordinates(self, latitude: float, longitude: float) -> str:
         """Определить страну по координатам"""
         try:
+            import httpx
             async with httpx.AsyncClient(timeout=10.0) as client:
                 # Используем бесплатный API для геокодирования
                 response = await client.get(
@@ -0,0 +1,120 @@
+"""
+Выбор процесса, выполняющего фоновые задачи
+
+При запуске uvicorn --workers N каждый воркер выполняет lifespan
+приложения. Сбор данных, вход в Toyota API, обновление цен на топливо,
+резервное копирование и обслуживание базы должны идти в одном процессе:
+им становится тот, кто первым захватил эксклюзивную блокировку flock на
+файле рядом с базой данных. ОС снимает блокировку при завершении
+процесса (в том числе аварийном), остальные процессы пытаются захватить
+ее раз в retry_interval секунд и один из них продолжает фоновые задачи.
+
+Без fcntl (Windows) процесс всегда считается лидером: несколько воркеров
+там не поддерживаются.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class LeaderElection:
+    """Эксклюзивная блокировка файла: ее владелец выполняет фоновые задачи."""
+    
+    def __init__(self, path: str, retry_interval: float = 5.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        # Вызывается один раз, когда процесс становится лидером
+        self.on_elected: Optional[Callable[[], Awaitable[None]]] = None
+        self._file = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def try_acquire(self) -> bool:
+        """Захватить блокировку без ожидания."""
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            self.is_leader = True
+            return True
+        
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # PID владельца - для /api/scheduler в остальных процессах
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        self.is_leader = True
+        return True
+    
+    def leader_pid(self) -> Optional[int]:
+        """PID процесса, выполняющего фоновые задачи (по файлу блокировки)."""
+        if self.is_leader:
+            return os.getpid()
+        try:
+            with open(self.path) as lock_file:
+                return int(lock_file.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+    
+    async def start(self):
+        """Стать лидером сейчас или ждать освобождения блокировки в фоне."""
+        try:
+            elected = self.try_acquire()
+        except OSError as e:
+            # Файл блокировки недоступен (например, файловая система только
+            # для чтения): единственный процесс выполняет задачи сам
+            logger.warning(f"Не удалось открыть файл блокировки {self.path}: {e}")
+            self.is_leader = elected = True
+        
+        if elected:
+            await self._elected()
+        else:
+            logger.info(f"Фоновые задачи выполняет процесс {self.leader_pid()}, процесс {os.getpid()} ожидает")
+            self._task = asyncio.create_task(self._campaign())
+    
+    async def _campaign(self):
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            try:
+                if self.try_acquire():
+                    break
+            except OSError as e:
+                logger.error(f"Ошибка захвата блокировки {self.path}: {e}")
+        await self._elected()
+    
+    async def _elected(self):
+        logger.info(f"Процесс {os.getpid()} выполняет фоновые задачи")
+        if self.on_elected:
+            await self.on_elected()
+    
+    async def stop(self):
+        """Прекратить ожидание и освободить блокировку."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._file:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self.is_leader = False
+
+# Блокировка фоновых задач (путь задается в lifespan рядом с базой данных)
+leader = LeaderElection("toyota.db.leader")
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """
 Сервис для определения местоположения и цен на топливо
+
+aiohttp импортируется при первом обращении к геокодеру, а не при
+запуске приложения.
 """
 
-import aiohttp
 import asyncio
 import logging
 from typing import Dict, Optional, Tuple
@@ -68,6 +70,7 @@ class LocationService:
     async def get_session(self):
         """Получить HTTP сессию."""
         if self.session is None:
+            import aiohttp
             self.session = aiohttp.ClientSession()
         return self.session
     
@@ -0,0 +1,201 @@
+"""
+Обслуживание файла базы данных Toyota Dashboard
+
+Очистка истории удаляет строки, но файл SQLite от этого не уменьшается,
+а планировщик запросов без статистики (sqlite_stat1) выбирает индексы
+наугад. MaintenanceEngine в окне простоя выполняет:
+- optimize: PRAGMA optimize, а при отсутствии статистики - ANALYZE
+  с ограничением analysis_limit;
+- vacuum: PRAGMA incremental_vacuum порциями страниц с паузами, чтобы
+  не держать блокировку записи (нужен auto_vacuum=INCREMENTAL);
+- quick_check: проверка структуры файла в отдельном соединении только
+  для чтения, не мешающая сборщику данных.
+Отчет содержит размеры страниц и списка свободных страниц до и после,
+а также время каждой задачи.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from models import MaintenanceConfig
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_TASKS = ("optimize", "vacuum", "quick_check")
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+class MaintenanceEngine:
+    """Плановое обслуживание файла базы данных."""
+    
+    def __init__(self, db, config: Optional[MaintenanceConfig] = None):
+        self.db = db
+        self.config = config or MaintenanceConfig()
+        self.last_run: Optional[datetime] = None
+        self.last_report: Optional[Dict] = None
+        self._last_quick_check: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+    
+    async def _pragma(self, name: str) -> int:
+        cursor = await self.db.connection.execute(f"PRAGMA {name}")
+        row = await cursor.fetchone()
+        return row[0] if row else 0
+    
+    async def database_stats(self) -> Dict:
+        """Размер файла, страницы и свободные страницы."""
+        page_size = await self._pragma("page_size")
+        page_count = await self._pragma("page_count")
+        freelist_count = await self._pragma("freelist_count")
+        wal_path = self.db.db_path + "-wal"
+        return {
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist_count,
+            "free_bytes": freelist_count * page_size,
+            "auto_vacuum": AUTO_VACUUM_MODES.get(await self._pragma("auto_vacuum"), "unknown"),
+            "file_bytes": os.path.getsize(self.db.db_path) if os.path.exists(self.db.db_path) else 0,
+            "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        }
+    
+    def _current_window_start(self, now: datetime) -> Optional[datetime]:
+        """Начало окна простоя, в котором находится now (None - вне окна)."""
+        length = (self.config.window_end_hour - self.config.window_start_hour) % 24 or 24
+        for days_back in (0, 1):
+            start = (now - timedelta(days=days_back)).replace(
+                hour=self.config.window_start_hour, minute=0, second=0, microsecond=0
+            )
+            if start <= now < start + timedelta(hours=length):
+                return start
+        return None
+    
+    def seconds_until_window(self, now: Optional[datetime] = None) -> float:
+        """Сколько ждать до следующего прохода (0 - окно открыто, прохода еще не было)."""
+        now = now or datetime.now()
+        window_start = self._current_window_start(now)
+        if window_start and (self.last_run is None or self.last_run < window_start):
+            return 0.0
+        next_start = now.replace(hour=self.config.window_start_hour, minute=0, second=0, microsecond=0)
+        if next_start <= now:
+            next_start += timedelta(days=1)
+        return (next_start - now).total_seconds()
+    
+    def _quick_check_due(self) -> bool:
+        if self._last_quick_check is None:
+            return True
+        return datetime.now() - self._last_quick_check >= timedelta(days=self.config.quick_check_interval_days)
+    
+    async def run(self, tasks: Optional[Iterable[str]] = None) -> Dict:
+        """Выполнить задачи обслуживания и вернуть отчет.
+        
+        Без tasks выполняются задачи, включенные в конфигурации
+        (quick_check - не чаще quick_check_interval_days).
+        """
+        if tasks is None:
+            tasks = [name for name, enabled in (
+                ("optimize", self.config.optimize),
+                ("vacuum", self.config.incremental_vacuum),
+                ("quick_check", self.config.quick_check and self._quick_check_due()),
+            ) if enabled]
+        async with self._lock:
+            self.last_run = datetime.now()
+            report = {
+                "started_at": self.last_run.isoformat(timespec="seconds"),
+                "before": await self.database_stats(),
+                "tasks": {},
+            }
+            for name in tasks:
+                handler = getattr(self, name, None) if name in MAINTENANCE_TASKS else None
+                if handler is None:
+                    raise ValueError(f"Неизвестная задача обслуживания: {name}")
+                started = time.monotonic()
+                try:
+                    result = await handler()
+                except Exception as e:
+                    logger.error(f"Ошибка задачи обслуживания {name}: {e}")
+                    result = {"error": str(e)}
+                result["seconds"] = round(time.monotonic() - started, 3)
+                report["tasks"][name] = result
+            report["after"] = await self.database_stats()
+            self.last_report = report
+            logger.info(f"Обслуживание базы данных завершено: {report['tasks']}, "
+                        f"страниц {report['before']['page_count']} -> {report['after']['page_count']}, "
+                        f"свободных {report['before']['freelist_count']} -> {report['after']['freelist_count']}")
+            return report
+    
+    async def optimize(self) -> Dict:
+        """Обновить статистику планировщика запросов."""
+        if self.config.analysis_limit:
+            # Ограничивает число строк индекса, просматриваемых ANALYZE
+            await self.db.connection.execute(f"PRAGMA analysis_limit = {int(self.config.analysis_limit)}")
+        cursor = await self.db.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        )
+        if await cursor.fetchone() is None:
+            # Статистики еще нет: PRAGMA optimize пропустил бы большинство таблиц
+            await self.db.connection.execute("ANALYZE")
+            mode = "analyze"
+        else:
+            await self.db.connection.execute("PRAGMA optimize")
+            mode = "optimize"
+        await self.db.connection.commit()
+        return {"mode": mode}
+    
+    async def vacuum(self) -> Dict:
+        """Вернуть свободные страницы файловой системе порциями."""
+        if await self._pragma("auto_vacuum") != 2:
+            return {"skipped": "auto_vacuum не INCREMENTAL, выполните manage.py maintenance --enable-incremental-vacuum"}
+        step = max(1, self.config.vacuum_pages_per_step)
+        released = steps = 0
+        while released < self.config.vacuum_max_pages:
+            freelist = await self._pragma("freelist_count")
+            if not freelist:
+                break
+            pages = min(step, freelist, self.config.vacuum_max_pages - released)
+            # executescript выполняет PRAGMA до конца: execute освободил бы одну страницу
+            await self.db.connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            released += pages
+            steps += 1
+            await asyncio.sleep(self.config.step_pause)
+        # Усечение основного файла происходит при переносе журнала WAL
+        await self.db.connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return {"pages_released": released, "steps": steps}
+    
+    async def quick_check(self) -> Dict:
+        """Проверить структуру файла, не блокируя основное соединение."""
+        result = await asyncio.to_thread(self._quick_check_sync, self.db.db_path)
+        self._last_quick_check = datetime.now()
+        if result != ["ok"]:
+            logger.error(f"PRAGMA quick_check обнаружил проблемы: {result[:10]}")
+            await self.db.add_notification(
+                "system", "Проблема с базой данных",
+                "Проверка целостности базы данных обнаружила ошибки. "
+                "Восстановите базу из резервной копии (manage.py restore).",
+                {"quick_check": result[:10]}
+            )
+        return {"ok": result == ["ok"], "messages": result[:10]}
+    
+    @staticmethod
+    def _quick_check_sync(db_path: str):
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            return [row[0] for row in conn.execute("PRAGMA quick_check")]
+        finally:
+            conn.close()
+    
+    async def enable_incremental_vacuum(self) -> Dict:
+        """Перевести существующую базу в auto_vacuum=INCREMENTAL.
+        
+        Требует полного VACUUM (перезапись файла, блокирует запись на все
+        время), поэтому выполняется вручную при остановленном сервере.
+        """
+        started = time.monotonic()
+        await self.db.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await self.db.connection.execute("VACUUM")
+        return {
+            "auto_vacuum": AUTO_VACUUM_MODES.get(await self._pragma("auto_vacuum"), "unknown"),
+            "seconds": round(time.monotonic() - started, 3),
+        }
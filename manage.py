@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Служебные команды Toyota Dashboard
+
+Использование:
+    python manage.py stats            # статистика сжатия данных
+    python manage.py train-dict       # обучить словарь сжатия
+    python manage.py compact          # переупаковать старые записи
+    python manage.py export trips --format csv -o trips.csv
+    python manage.py backup           # резервная копия (restore PATH - восстановление)
+    python manage.py maintenance      # ANALYZE, incremental vacuum, quick_check
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Optional
+
+import yaml
+
+from backup import BackupManager
+from database import DatabaseManager
+from export import EXPORT_TABLES, TableExporter, available_formats
+from maintenance import MAINTENANCE_TASKS, MaintenanceEngine
+from models import BackupConfig, MaintenanceConfig, RetentionConfig, StorageConfig
+from paths import paths
+
+def load_config() -> dict:
+    """Прочитать config.yaml без побочных эффектов запуска сервера."""
+    config_path = paths.config_file
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+def create_database(args) -> DatabaseManager:
+    """Создать менеджер базы данных с настройками из конфигурации."""
+    config = load_config()
+    return DatabaseManager(
+        args.db or paths.database_path,
+        retention=RetentionConfig(**(config.get('retention') or {})),
+        storage=StorageConfig(**(config.get('storage') or {}))
+    )
+
+async def cmd_stats(db: DatabaseManager, args):
+    # Вне сервера можно разобрать все строки: точный размер в виде JSON
+    print(json.dumps(await db.get_payload_stats(sample_size=args.sample), indent=2, ensure_ascii=False))
+
+async def cmd_train_dict(db: DatabaseManager, args):
+    dictionary_id = await db.train_payload_dictionary(sample_limit=args.samples)
+    print(f"✓ Словарь сжатия {dictionary_id} сохранен")
+    if not db.storage.compression_dictionary:
+        print("  Включите storage.compression_dictionary в config.yaml, чтобы использовать его")
+
+async def cmd_compact(db: DatabaseManager, args):
+    stats = await db.compact_payloads(batch_size=args.batch_size)
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+    if args.vacuum:
+        # Освободившиеся страницы возвращаются файловой системе только после VACUUM
+        await db.connection.execute("VACUUM")
+        print("✓ VACUUM выполнен")
+
+async def cmd_export(db: DatabaseManager, args):
+    exporter = TableExporter(db, args.table, start=args.start, end=args.end)
+    written = 0
+    with open(args.output, 'wb') as output:
+        async for chunk in exporter.stream(args.format):
+            output.write(chunk)
+            written += len(chunk)
+    print(f"✓ {args.table} выгружена в {args.output} ({written} байт)")
+
+def create_backup_manager(args) -> BackupManager:
+    config = load_config()
+    return BackupManager(args.db or paths.database_path, BackupConfig(**(config.get('backup') or {})))
+
+async def cmd_backup(db: DatabaseManager, args):
+    result = await create_backup_manager(args).create_backup()
+    print(f"✓ Резервная копия: {result['path']} ({result['bytes']} байт, {result['seconds']} с)")
+    for name in result['removed']:
+        print(f"  удалена старая копия {name}")
+
+async def cmd_list_backups(db: Optional[DatabaseManager], args):
+    for path in create_backup_manager(args).list_backups():
+        modified = datetime.fromtimestamp(os.path.getmtime(path))
+        print(f"{modified:%Y-%m-%d %H:%M}  {os.path.getsize(path):>12}  {path}")
+
+async def cmd_verify_backup(db: Optional[DatabaseManager], args):
+    info = create_backup_manager(args).verify_backup(args.path)
+    print(f"✓ Копия исправна: {json.dumps(info, ensure_ascii=False)}")
+
+async def cmd_restore(db: Optional[DatabaseManager], args):
+    manager = create_backup_manager(args)
+    if not args.yes:
+        answer = input(f"Заменить {manager.db_path} копией {args.path}? Сервер должен быть остановлен [y/N]: ")
+        if answer.strip().lower() not in ('y', 'yes', 'д', 'да'):
+            print("Отменено")
+            return
+    info = manager.restore(args.path)
+    print(f"✓ База восстановлена: {json.dumps(info, ensure_ascii=False)}")
+    print(f"  прежняя база сохранена как {manager.db_path}.before-restore")
+
+async def cmd_maintenance(db: DatabaseManager, args):
+    engine = MaintenanceEngine(db, MaintenanceConfig(**(load_config().get('maintenance') or {})))
+    if args.enable_incremental_vacuum:
+        print("VACUUM всей базы, это может занять несколько минут...")
+        print(json.dumps(await engine.enable_incremental_vacuum(), ensure_ascii=False))
+    if args.stats_only:
+        print(json.dumps(await engine.database_stats(), indent=2, ensure_ascii=False))
+        return
+    report = await engine.run([task.replace('-', '_') for task in args.task] if args.task else None)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+async def run(args):
+    # Восстановление и проверка копий работают с файлами, база не открывается
+    if not args.needs_db:
+        await args.handler(None, args)
+        return
+    db = create_database(args)
+    await db.init_database()
+    try:
+        await args.handler(db, args)
+    finally:
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды Toyota Dashboard")
+    parser.add_argument("--db", help="Путь к базе данных (по умолчанию из настроек)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser.set_defaults(needs_db=True)
+    
+    stats_parser = subparsers.add_parser("stats", help="Статистика сжатия raw_data и ответов команд")
+    stats_parser.add_argument("--sample", type=int, default=None,
+                              help="Оценить размер JSON по последним N строкам (по умолчанию все строки)")
+    stats_parser.set_defaults(handler=cmd_stats)
+    
+    train_parser = subparsers.add_parser("train-dict", help="Обучить словарь сжатия на сохраненных данных")
+    train_parser.add_argument("--samples", type=int, default=500, help="Примеров из каждой таблицы")
+    train_parser.set_defaults(handler=cmd_train_dict)
+    
+    compact_parser = subparsers.add_parser("compact", help="Переупаковать записи текущим форматом сжатия")
+    compact_parser.add_argument("--batch-size", type=int, default=200)
+    compact_parser.add_argument("--vacuum", action="store_true", help="Выполнить VACUUM после переупаковки")
+    compact_parser.set_defaults(handler=cmd_compact)
+    
+    export_parser = subparsers.add_parser("export", help="Выгрузить таблицу в файл")
+    export_parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    export_parser.add_argument("--format", default="ndjson", choices=available_formats())
+    export_parser.add_argument("--output", "-o", required=True, help="Файл для выгрузки")
+    export_parser.add_argument("--start", type=datetime.fromisoformat, help="Начало периода (ISO)")
+    export_parser.add_argument("--end", type=datetime.fromisoformat, help="Конец периода (ISO)")
+    export_parser.set_defaults(handler=cmd_export)
+    
+    backup_parser = subparsers.add_parser("backup", help="Создать резервную копию базы")
+    backup_parser.set_defaults(handler=cmd_backup, needs_db=False)
+    
+    list_parser = subparsers.add_parser("list-backups", help="Список резервных копий")
+    list_parser.set_defaults(handler=cmd_list_backups, needs_db=False)
+    
+    verify_parser = subparsers.add_parser("verify-backup", help="Проверить резервную копию")
+    verify_parser.add_argument("path")
+    verify_parser.set_defaults(handler=cmd_verify_backup, needs_db=False)
+    
+    restore_parser = subparsers.add_parser("restore", help="Восстановить базу из резервной копии")
+    restore_parser.add_argument("path")
+    restore_parser.add_argument("--yes", "-y", action="store_true", help="Не спрашивать подтверждение")
+    restore_parser.set_defaults(handler=cmd_restore, needs_db=False)
+    
+    maintenance_parser = subparsers.add_parser("maintenance", help="Обслуживание файла базы данных")
+    maintenance_parser.add_argument("--task", action="append",
+                                    choices=[task.replace('_', '-') for task in MAINTENANCE_TASKS],
+                                    help="Выполнить только указанные задачи (по умолчанию - все включенные)")
+    maintenance_parser.add_argument("--stats-only", action="store_true", help="Только размеры файла и страниц")
+    maintenance_parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                                    help="Перевести базу в auto_vacuum=INCREMENTAL (полный VACUUM, сервер остановлен)")
+    maintenance_parser.set_defaults(handler=cmd_maintenance)
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    try:
+        asyncio.run(run(args))
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
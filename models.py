@@ -4,7 +4,7 @@
 
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from enum import Enum
 
 class VehicleStatus(BaseModel):
@@ -98,13 +98,113 @@ class ServerConfig(BaseModel):
     host: str = "0.0.0.0"
     port: int = 8000
     debug: bool = False
-    secret_key: str
+    secret_key: str = ""
+    compress_min_size: int = Field(1024, ge=0)  # сжимать ответы API больше этого размера (байты)
+    workers: int = Field(1, ge=1)  # процессов uvicorn
+    state_sync_interval: float = Field(2.0, gt=0)  # опрос общего состояния воркерами (секунды)
 
 class MonitoringConfig(BaseModel):
     """Конфигурация мониторинга."""
     data_collection_interval: int = 300  # секунды
     trip_detection: bool = True
     auto_refresh: bool = True
+    max_api_calls_per_hour: int = Field(100, gt=0)  # обновлений статуса по запросу клиентов
+    # Старше (секунды) - /api/vehicle/status обновляет снимок в фоне
+    # (по умолчанию два интервала сбора данных)
+    status_max_age: Optional[int] = Field(None, gt=0)
+    snapshot_buffer_size: int = Field(288, gt=0)  # последних статусов в памяти (сутки при опросе раз в 5 минут)
+    
+    @model_validator(mode="after")
+    def _default_status_max_age(self) -> "MonitoringConfig":
+        if self.status_max_age is None:
+            self.status_max_age = 2 * self.data_collection_interval
+        return self
+
+class RetentionConfig(BaseModel):
+    """Конфигурация хранения истории статусов."""
+    raw_days: int = Field(7, ge=0)  # сырые записи vehicle_status
+    medium_days: int = Field(90, ge=0)  # средние за medium_bucket_minutes
+    medium_bucket_minutes: int = Field(15, gt=0)
+    coarse_bucket_minutes: int = Field(60, gt=0)  # min/max/avg старше medium_days
+    batch_buckets: int = Field(96, gt=0)  # интервалов агрегации за одну транзакцию
+    batch_pause: float = Field(0.05, ge=0)  # пауза между транзакциями, секунды
+    interval_minutes: int = Field(60, gt=0)  # периодичность запуска
+    commands_days: int = Field(365, gt=0)
+    notifications_days: int = Field(30, gt=0)  # для прочитанных уведомлений
+    
+    @model_validator(mode="after")
+    def _check_tiers(self) -> "RetentionConfig":
+        if self.medium_days < self.raw_days:
+            raise ValueError("medium_days не может быть меньше raw_days")
+        if self.coarse_bucket_minutes % self.medium_bucket_minutes:
+            raise ValueError("coarse_bucket_minutes должен быть кратен medium_bucket_minutes")
+        return self
+
+class StorageConfig(BaseModel):
+    """Конфигурация записи статусов (дедупликация и дельты raw_data)."""
+    dedup_enabled: bool = True
+    max_unchanged_minutes: int = 60  # не реже этого пишется новая строка (0 - без ограничения)
+    keyframe_interval: int = 24  # полная копия raw_data каждые N строк
+    tolerances: Dict[str, float] = {
+        "battery_level": 0,
+        "fuel_level": 0,
+        "range_electric": 1.0,
+        "range_fuel": 1.0,
+        "latitude": 0.0001,  # ~11 м
+        "longitude": 0.0001,
+        "temperature_inside": 0.5,
+        "temperature_outside": 0.5,
+    }
+    # Логические поля сравниваются точно
+    exact_fields: List[str] = ["locked", "engine_running", "climate_on"]
+    compression: str = "zlib"  # zlib, zstd (нужен пакет zstandard)
+    compression_level: int = 6
+    compression_dictionary: bool = False  # сжимать общим словарем (manage.py train-dict)
+    dictionary_size: int = 16384  # байты
+
+class BackupConfig(BaseModel):
+    """Конфигурация резервного копирования базы данных."""
+    enabled: bool = True
+    interval_hours: int = 24
+    keep: int = 7  # сколько последних копий хранить
+    compress: bool = True  # gzip
+    verify: bool = True  # integrity_check копии перед сохранением
+    pages_per_step: int = 256  # страниц за один шаг онлайн-копирования
+    step_pause: float = 0.01  # пауза между шагами, секунды
+    directory: Optional[str] = None  # по умолчанию каталог backups в данных приложения
+
+class MaintenanceConfig(BaseModel):
+    """Конфигурация обслуживания файла базы данных."""
+    enabled: bool = True
+    window_start_hour: int = 3  # окно простоя (местное время), в котором выполняется обслуживание
+    window_end_hour: int = 5
+    optimize: bool = True  # PRAGMA optimize / ANALYZE
+    analysis_limit: int = 1000  # строк индекса на таблицу при ANALYZE (0 - без ограничения)
+    incremental_vacuum: bool = True
+    vacuum_pages_per_step: int = 512  # страниц за одну транзакцию incremental_vacuum
+    vacuum_max_pages: int = 25600  # не больше страниц за проход (~100 МБ при 4 КБ)
+    step_pause: float = 0.05  # пауза между порциями, секунды
+    quick_check: bool = True
+    quick_check_interval_days: int = 7
+
+class CommandQueueConfig(BaseModel):
+    """Конфигурация очереди команд управления автомобилем."""
+    dedup_seconds: float = 10.0  # повторное нажатие той же команды в этом окне - та же задача
+    history_size: int = 100  # последних задач в command_jobs для GET /api/commands/{job_id}
+    wait_limit: float = 30.0  # максимум ожидания результата в запросе (?wait=)
+    confirm: bool = True  # проверять, что автомобиль перешел в ожидаемое состояние
+    confirm_timeout: float = 90.0  # сколько ждать подтверждения (секунды)
+    confirm_delay: float = 3.0  # первая проверка через (секунды), затем интервал удваивается
+    confirm_max_interval: float = 20.0  # максимальный интервал между проверками (секунды)
+    poll_interval: float = Field(0.5, gt=0)  # проверка очереди и задач других воркеров (секунды)
+
+class SchedulerConfig(BaseModel):
+    """Конфигурация расписания фоновых задач."""
+    trip_sync_interval: int = 1800  # синхронизация поездок (секунды)
+    trip_sync_days: int = 7  # за сколько последних дней запрашивать поездки
+    fuel_prices_cron: str = "0 6 * * *"  # обновление цен на топливо (выражение cron)
+    fuel_prices_jitter: float = 600.0  # случайный сдвиг обновления цен (секунды)
+    job_timeout: float = 300.0  # предел выполнения задач, обращающихся к сети (секунды)
 
 class NotificationConfig(BaseModel):
     """Конфигурация уведомлений."""
@@ -65,13 +65,10 @@ class PathManager:
                     os.makedirs(directory, exist_ok=True)
                     print(f"✅ Создана директория {name}: {directory}")
                     created_count += 1
-                else:
-                    # Проверяем права на запись
-                    if os.access(directory, os.W_OK):
-                        print(f"✅ Директория {name} доступна: {directory}")
-                    else:
-                        print(f"⚠️ Директория {name} недоступна для записи: {directory}")
-                        failed_count += 1
+                elif not os.access(directory, os.W_OK):
+                    # Доступные директории не перечисляются: сообщения только о проблемах
+                    print(f"⚠️ Директория {name} недоступна для записи: {directory}")
+                    failed_count += 1
                         
             except (OSError, PermissionError) as e:
                 print(f"❌ Не удалось создать директорию {name} ({directory}): {e}")
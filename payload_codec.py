@@ -0,0 +1,227 @@
+"""
+Кодирование JSON-полезной нагрузки для хранения в базе данных
+
+- PayloadCodec: компактный JSON, сжатый zlib или zstd (если установлен
+  пакет zstandard), с необязательным общим словарем, обученным на наших
+  данных. Формат значения: [кодек][id словаря][сжатые данные]. Если
+  сжатие не уменьшает размер, данные хранятся как есть (кодек none).
+  Старые значения читаются как раньше: голый zlib-поток и несжатые
+  JSON-строки.
+- diff_payload / apply_diff: дельта между двумя JSON-документами,
+  чтобы хранить изменения raw_data вместо полной копии.
+"""
+
+import copy
+import json
+import logging
+import re
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Уровень сжатия по умолчанию (компромисс скорость/размер для Raspberry Pi)
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# Первый байт значения - алгоритм сжатия
+CODEC_NONE = 0x00
+CODEC_ZLIB = 0x01
+CODEC_ZSTD = 0x02
+CODECS = {"zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+CODEC_NAMES = {CODEC_NONE: "none", CODEC_ZLIB: "zlib", CODEC_ZSTD: "zstd"}
+
+# Первый байт zlib-потока без заголовка (значения до появления формата)
+_LEGACY_ZLIB_MARKER = 0x78
+
+# zlib использует не более 32 КБ словаря
+ZLIB_MAX_DICTIONARY_SIZE = 32768
+# id словаря хранится в одном байте, 0 - без словаря
+MAX_DICTIONARY_ID = 255
+
+def _dumps(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+class PayloadCodec:
+    """Сжатие и распаковка полезной нагрузки с поддержкой словарей."""
+    
+    def __init__(self, algorithm: str = "zlib", level: int = DEFAULT_COMPRESSION_LEVEL):
+        if algorithm not in CODECS:
+            raise ValueError(f"Неизвестный алгоритм сжатия: {algorithm}")
+        if algorithm == "zstd" and zstandard is None:
+            logger.warning("Пакет zstandard не установлен, для сжатия используется zlib")
+            algorithm = "zlib"
+        self.algorithm = algorithm
+        self.level = level
+        self.dictionaries: Dict[int, bytes] = {}
+        self.dictionary_algorithms: Dict[int, str] = {}
+        # Словарь, которым сжимаются новые значения (0 - без словаря)
+        self.active_dictionary_id = 0
+        self._zstd_compressors: Dict[int, Any] = {}
+        self._zstd_decompressors: Dict[int, Any] = {}
+    
+    def add_dictionary(self, dictionary_id: int, algorithm: str, data: bytes):
+        """Зарегистрировать словарь, сохраненный в базе данных."""
+        if not 0 < dictionary_id <= MAX_DICTIONARY_ID:
+            raise ValueError(f"id словаря должен быть от 1 до {MAX_DICTIONARY_ID}")
+        self.dictionaries[dictionary_id] = bytes(data)
+        self.dictionary_algorithms[dictionary_id] = algorithm
+        self._zstd_compressors.pop(dictionary_id, None)
+        self._zstd_decompressors.pop(dictionary_id, None)
+    
+    def use_dictionary(self, dictionary_id: int):
+        """Сжимать новые значения указанным словарем (0 - без словаря)."""
+        if dictionary_id and self.dictionary_algorithms.get(dictionary_id) != self.algorithm:
+            raise ValueError(f"Словарь {dictionary_id} не подходит для алгоритма {self.algorithm}")
+        self.active_dictionary_id = dictionary_id
+    
+    def encode(self, payload: Any) -> Optional[bytes]:
+        """Сериализовать и сжать полезную нагрузку (несжатой, если так короче)."""
+        if payload is None:
+            return None
+        data = _dumps(payload)
+        dictionary_id = self.active_dictionary_id
+        if self.algorithm == "zstd":
+            body = self._zstd_compressor(dictionary_id).compress(data)
+        elif dictionary_id:
+            compressor = zlib.compressobj(self.level, zdict=self.dictionaries[dictionary_id])
+            body = compressor.compress(data) + compressor.flush()
+        else:
+            body = zlib.compress(data, self.level)
+        if len(body) >= len(data):
+            # id словаря сохраняется: is_current не переупаковывает значение
+            # снова, пока не сменится словарь
+            return bytes((CODEC_NONE, dictionary_id)) + data
+        return bytes((CODECS[self.algorithm], dictionary_id)) + body
+    
+    def decode(self, value: Union[bytes, str, None]) -> Any:
+        """Распаковать полезную нагрузку любого поддерживаемого формата."""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return json.loads(value)
+        
+        value = bytes(value)
+        marker = value[0]
+        if marker == _LEGACY_ZLIB_MARKER:
+            return json.loads(zlib.decompress(value))
+        
+        dictionary_id, body = value[1], value[2:]
+        if marker == CODEC_NONE:
+            return json.loads(body)
+        if dictionary_id and dictionary_id not in self.dictionaries:
+            raise ValueError(f"Словарь сжатия {dictionary_id} не найден")
+        if marker == CODEC_ZLIB:
+            if dictionary_id:
+                decompressor = zlib.decompressobj(zdict=self.dictionaries[dictionary_id])
+                data = decompressor.decompress(body) + decompressor.flush()
+            else:
+                data = zlib.decompress(body)
+        elif marker == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Для чтения данных, сжатых zstd, нужен пакет zstandard")
+            data = self._zstd_decompressor(dictionary_id).decompress(body)
+        else:
+            raise ValueError(f"Неизвестный формат сжатых данных: {marker:#x}")
+        return json.loads(data)
+    
+    def is_current(self, value: Union[bytes, str, None]) -> bool:
+        """Значение уже сжато текущим алгоритмом и словарем."""
+        if value is None:
+            return True
+        if isinstance(value, str) or len(value) < 2:
+            return False
+        return value[0] in (CODEC_NONE, CODECS[self.algorithm]) and value[1] == self.active_dictionary_id
+    
+    def _zstd_compressor(self, dictionary_id: int):
+        if dictionary_id not in self._zstd_compressors:
+            dict_data = zstandard.ZstdCompressionDict(self.dictionaries[dictionary_id]) if dictionary_id else None
+            self._zstd_compressors[dictionary_id] = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+        return self._zstd_compressors[dictionary_id]
+    
+    def _zstd_decompressor(self, dictionary_id: int):
+        if dictionary_id not in self._zstd_decompressors:
+            dict_data = zstandard.ZstdCompressionDict(self.dictionaries[dictionary_id]) if dictionary_id else None
+            self._zstd_decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return self._zstd_decompressors[dictionary_id]
+
+def train_dictionary(samples: Iterable[Any], algorithm: str = "zlib", size: int = 16384) -> bytes:
+    """Обучить общий словарь сжатия на примерах полезной нагрузки.
+    
+    Для zstd используется штатное обучение zstandard. Для zlib словарь
+    собирается из самых частых JSON-токенов (ключей и строковых значений):
+    zlib ищет совпадения в словаре, а ближе к концу находятся самые частые.
+    """
+    encoded = [_dumps(sample) for sample in samples if sample is not None]
+    if not encoded:
+        raise ValueError("Нет данных для обучения словаря")
+    
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Для обучения словаря zstd нужен пакет zstandard")
+        return zstandard.train_dictionary(size, encoded).as_bytes()
+    
+    size = min(size, ZLIB_MAX_DICTIONARY_SIZE)
+    counter = Counter()
+    for data in encoded:
+        counter.update(set(re.findall(rb'"[^"\\]{1,64}":?', data)))
+    # Токен, встречающийся в одном примере, словарю не поможет
+    tokens = [token for token, count in counter.most_common() if count > 1]
+    
+    dictionary = b""
+    for token in tokens:
+        if len(dictionary) + len(token) > size:
+            break
+        dictionary = token + dictionary
+    return dictionary
+
+def diff_payload(base: Any, target: Any) -> Dict[str, List]:
+    """Вычислить дельту, превращающую base в target.
+    
+    Формат: {"set": [[путь, значение], ...], "del": [путь, ...]},
+    где путь - список ключей вложенных словарей. Списки и скаляры
+    заменяются целиком.
+    """
+    changes: Dict[str, List] = {"set": [], "del": []}
+    _diff(base, target, [], changes)
+    return changes
+
+def _diff(base: Any, target: Any, path: List[str], changes: Dict[str, List]):
+    if isinstance(base, dict) and isinstance(target, dict):
+        for key, value in target.items():
+            if key not in base:
+                changes["set"].append([path + [key], value])
+            else:
+                _diff(base[key], value, path + [key], changes)
+        for key in base:
+            if key not in target:
+                changes["del"].append(path + [key])
+    elif base != target:
+        changes["set"].append([path, target])
+
+def apply_diff(base: Any, changes: Dict[str, List]) -> Any:
+    """Применить дельту diff_payload к base, не изменяя исходный объект."""
+    result = copy.deepcopy(base)
+    for path, value in changes.get("set", []):
+        if not path:
+            result = copy.deepcopy(value)
+            continue
+        target = result
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = copy.deepcopy(value)
+    for path in changes.get("del", []):
+        target = result
+        for key in path[:-1]:
+            target = target.get(key, {})
+        target.pop(path[-1], None)
+    return result
+
+def is_empty_diff(changes: Dict[str, List]) -> bool:
+    """Дельта не содержит изменений."""
+    return not changes.get("set") and not changes.get("del")
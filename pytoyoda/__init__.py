@@ -4,6 +4,23 @@
 
 """
 
-from pytoyoda.client import MyT  # noqa : F401
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytoyoda.client import MyT  # noqa : F401
 
 __version__ = "0.0.0"
+
+
+def __getattr__(name: str):  # noqa : ANN202
+    """Import the client on first access.
+
+    The client pulls in httpx, hishel and the full model tree; importing
+    ``pytoyoda.models`` (for example ``CommandType``) should not pay for it.
+    """
+    if name == "MyT":
+        from pytoyoda.client import MyT
+
+        return MyT
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
@@ -6,7 +6,7 @@ import asyncio
 import copy
 import json
 from dataclasses import dataclass
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from enum import Enum, auto
 from functools import partial
 from itertools import groupby
@@ -22,8 +22,10 @@ from pytoyoda.exceptions import ToyotaApiError
 from pytoyoda.models.climate import ClimateSettings, ClimateStatus
 from pytoyoda.models.dashboard import Dashboard
 from pytoyoda.models.electric_status import ElectricStatus
+from pytoyoda.models.endpoints.climate import ClimateStatusResponseModel
 from pytoyoda.models.endpoints.command import CommandType
 from pytoyoda.models.endpoints.common import StatusModel
+from pytoyoda.models.endpoints.electric import ElectricResponseModel
 from pytoyoda.models.endpoints.trips import _SummaryItemModel
 from pytoyoda.models.endpoints.vehicle_guid import VehicleGuidModel
 from pytoyoda.models.location import Location
@@ -41,6 +43,77 @@ T = TypeVar(
     bound=Union[Api, VehicleGuidModel, bool],
 )
 
+# Defaults for the refresh-and-wait helpers (seconds)
+REFRESH_WAIT_TIMEOUT = 60.0
+REFRESH_POLL_INITIAL_INTERVAL = 2.0
+REFRESH_POLL_MAX_INTERVAL = 15.0
+
+
+def _electric_last_updated(
+    response: Optional[ElectricResponseModel],
+) -> Optional[datetime]:
+    """Return the time the electric status was last reported by the vehicle."""
+    if response is None or response.payload is None:
+        return None
+    return response.payload.last_update_timestamp
+
+
+def _electric_changed(
+    baseline: Optional[ElectricResponseModel],
+    previous: Optional[ElectricResponseModel],  # noqa: ARG001
+    response: Optional[ElectricResponseModel],
+) -> bool:
+    """Return True once the vehicle reported electric data after the refresh."""
+    updated = _electric_last_updated(response)
+    return updated is not None and updated != _electric_last_updated(baseline)
+
+
+def _climate_last_updated(
+    response: Optional[ClimateStatusResponseModel],
+) -> Optional[datetime]:
+    """Return the time the climate status was last reported by the vehicle.
+
+    The climate endpoint has no dedicated timestamp: the cabin temperature
+    reading carries one while climate control runs, otherwise the start
+    time is used. Both are None while climate control is off.
+    """
+    if response is None or response.payload is None:
+        return None
+    payload = response.payload
+    if payload.current_temperature is not None:
+        return payload.current_temperature.timestamp
+    return payload.started_at
+
+
+def _climate_payload(
+    response: Optional[ClimateStatusResponseModel],
+) -> Optional[dict[str, Any]]:
+    """Return the climate payload as a dict for comparison."""
+    if response is None or response.payload is None:
+        return None
+    return response.payload.model_dump()
+
+
+def _climate_changed(
+    baseline: Optional[ClimateStatusResponseModel],
+    previous: Optional[ClimateStatusResponseModel],
+    response: Optional[ClimateStatusResponseModel],
+) -> bool:
+    """Return True once the climate status after the refresh is known.
+
+    A running climate control reports a timestamp. Any other change shows
+    up as a payload different from the pre-refresh one. Climate control
+    that stays off has neither, so two identical polls after the refresh
+    are taken as the current state instead of waiting for the timeout.
+    """
+    updated = _climate_last_updated(response)
+    if updated is not None:
+        return updated != _climate_last_updated(baseline)
+    payload = _climate_payload(response)
+    if payload != _climate_payload(baseline):
+        return True
+    return previous is not None and payload == _climate_payload(previous)
+
 
 class VehicleType(Enum):
     """Vehicle types."""
@@ -106,6 +179,8 @@ class Vehicle(CustomAPIBaseModel[type[T]]):
         self._vehicle_info = vehicle_info
         self._metric = metric
         self._endpoint_data: dict[str, Any] = {}
+        # Running refresh-and-wait tasks by endpoint name, shared by waiters
+        self._refresh_waiters: dict[str, asyncio.Task] = {}
 
         if self._vehicle_info.vin:
             self._api_endpoints: list[EndpointDefinition] = [
@@ -263,6 +338,87 @@ class Vehicle(CustomAPIBaseModel[type[T]]):
         for name, data in await responses:
             self._endpoint_data[name] = data
 
+    async def _refresh_and_wait(  # noqa: PLR0913
+        self,
+        name: str,
+        refresh: Callable,
+        fetch: Callable,
+        changed: Callable[[Any, Any, Any], bool],
+        timeout: float,
+        initial_interval: float,
+        max_interval: float,
+    ) -> Optional[Any]:
+        """Request a refresh and poll the GET endpoint until its data changes.
+
+        Concurrent callers for the same endpoint share one refresh request
+        and one polling loop. Cancelling a caller does not cancel the shared
+        loop for the others.
+
+        Args:
+            name: Endpoint name in the endpoint data (e.g. "climate_status")
+            refresh: Coroutine function sending the refresh request
+            fetch: Coroutine function reading the current endpoint data
+            changed: Called with the pre-refresh, previous and current
+                responses; returns True once the current one is fresh
+            timeout: Maximum time to wait for fresh data in seconds
+            initial_interval: Delay before the first poll in seconds,
+                doubled after each unchanged poll
+            max_interval: Upper bound for the poll interval in seconds
+
+        Returns:
+            The new endpoint response, or None if the data did not change
+            within the timeout.
+
+        """
+        waiter = self._refresh_waiters.get(name)
+        if waiter is None or waiter.done():
+            waiter = asyncio.create_task(
+                self._poll_after_refresh(
+                    name,
+                    refresh,
+                    fetch,
+                    changed,
+                    timeout,
+                    initial_interval,
+                    max_interval,
+                )
+            )
+            self._refresh_waiters[name] = waiter
+        return await asyncio.shield(waiter)
+
+    async def _poll_after_refresh(  # noqa: PLR0913
+        self,
+        name: str,
+        refresh: Callable,
+        fetch: Callable,
+        changed: Callable[[Any, Any, Any], bool],
+        timeout: float,
+        initial_interval: float,
+        max_interval: float,
+    ) -> Optional[Any]:
+        """Polling loop behind _refresh_and_wait."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # The baseline is read right before the refresh: cached endpoint
+        # data may be older than what the server already has.
+        baseline = await fetch()
+        await refresh()
+
+        previous = None
+        interval = initial_interval
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.debug("No fresh {} data within {} seconds", name, timeout)
+                return None
+            await asyncio.sleep(min(interval, remaining))
+            response = await fetch()
+            self._endpoint_data[name] = response
+            if changed(baseline, previous, response):
+                return response
+            previous = response
+            interval = min(interval * 2, max_interval)
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def vin(self) -> Optional[str]:
@@ -365,6 +521,40 @@ class Vehicle(CustomAPIBaseModel[type[T]]):
         """
         return await self._api.refresh_electric_realtime_status(self.vin)
 
+    async def refresh_electric_realtime_status_and_wait(
+        self,
+        timeout: float = REFRESH_WAIT_TIMEOUT,
+        initial_interval: float = REFRESH_POLL_INITIAL_INTERVAL,
+        max_interval: float = REFRESH_POLL_MAX_INTERVAL,
+    ) -> Optional[ElectricStatus]:
+        """Force update of electric realtime status and wait for the new data.
+
+        Polls the electric status with increasing intervals until its
+        last update timestamp changes. Concurrent calls share a single
+        refresh request, so waiting callers do not drain the 12V battery
+        any further.
+
+        Args:
+            timeout: Maximum time to wait for fresh data in seconds
+            initial_interval: Delay before the first poll in seconds
+            max_interval: Upper bound for the poll interval in seconds
+
+        Returns:
+            Optional[ElectricStatus]: The fresh electric status, or None if
+                the vehicle did not report within the timeout.
+
+        """
+        response = await self._refresh_and_wait(
+            "electric_status",
+            self.refresh_electric_realtime_status,
+            partial(self._api.get_vehicle_electric_status, vin=self.vin),
+            _electric_changed,
+            timeout,
+            initial_interval,
+            max_interval,
+        )
+        return None if response is None else ElectricStatus(response)
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def location(self) -> Optional[Location]:
@@ -670,6 +860,40 @@ class Vehicle(CustomAPIBaseModel[type[T]]):
         """
         return await self._api.refresh_climate_status(self.vin)
 
+    async def refresh_climate_status_and_wait(
+        self,
+        timeout: float = REFRESH_WAIT_TIMEOUT,
+        initial_interval: float = REFRESH_POLL_INITIAL_INTERVAL,
+        max_interval: float = REFRESH_POLL_MAX_INTERVAL,
+    ) -> Optional[ClimateStatus]:
+        """Force update of climate status and wait for the new data.
+
+        Polls the climate status with increasing intervals until its
+        timestamp or payload changes. Climate control that stays off
+        reports neither, so it is returned after two identical polls.
+        Concurrent calls share a single refresh request.
+
+        Args:
+            timeout: Maximum time to wait for fresh data in seconds
+            initial_interval: Delay before the first poll in seconds
+            max_interval: Upper bound for the poll interval in seconds
+
+        Returns:
+            Optional[ClimateStatus]: The fresh climate status, or None if
+                the vehicle did not report within the timeout.
+
+        """
+        response = await self._refresh_and_wait(
+            "climate_status",
+            self.refresh_climate_status,
+            partial(self._api.get_climate_status, vin=self.vin),
+            _climate_changed,
+            timeout,
+            initial_interval,
+            max_interval,
+        )
+        return None if response is None else ClimateStatus(response)
+
     async def post_command(self, command: CommandType, beeps: int = 0) -> StatusModel:
         """Send remote command to the vehicle.
 
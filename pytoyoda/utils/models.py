@@ -45,6 +45,10 @@ class CustomEndpointBaseModel(BaseModel):
 
     """
 
+    # Endpoint models are only validated once the Toyota API responds: build
+    # the pydantic-core schema on first use instead of at import time.
+    model_config = ConfigDict(defer_build=True)
+
     def __init_subclass__(cls, **kwargs: dict) -> None:
         """Automatically add validation wrapper to all fields of subclasses.
 
@@ -0,0 +1,85 @@
+"""
+Ограничение частоты обращений к Toyota API
+
+TokenBucket: емкость capacity токенов, пополняются равномерно со
+скоростью rate в секунду. Вызов разрешен, если есть целый токен,
+иначе вызывающий получает отказ и время до следующего токена.
+
+SharedTokenBucket хранит корзину в базе данных, поэтому лимит общий
+для всех процессов-воркеров uvicorn, а не свой у каждого.
+"""
+
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Ограничитель частоты по алгоритму маркерной корзины."""
+    
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = max(1.0, float(capacity))
+        self.rate = max(rate, 1e-9)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+    
+    @classmethod
+    def per_hour(cls, calls: int, burst: Optional[int] = None) -> "TokenBucket":
+        """calls вызовов в час, не больше burst подряд (по умолчанию десятая часть)."""
+        return cls(burst or max(1, calls // 10), calls / 3600)
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Забрать токены, если они есть."""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+    
+    def retry_after(self, tokens: float = 1.0) -> float:
+        """Секунд до появления нужного числа токенов."""
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+class SharedTokenBucket(TokenBucket):
+    """Маркерная корзина в таблице rate_limits, общая для процессов.
+    
+    db подключается после инициализации базы (lifespan в app.py). Без
+    базы или при ее ошибке корзина работает как обычная TokenBucket
+    этого процесса.
+    """
+    
+    def __init__(self, key: str, capacity: float, rate: float):
+        super().__init__(capacity, rate)
+        self.key = key
+        self.db = None
+    
+    @classmethod
+    def shared_per_hour(cls, key: str, calls: int, burst: Optional[int] = None) -> "SharedTokenBucket":
+        """calls вызовов в час на все процессы, не больше burst подряд."""
+        return cls(key, burst or max(1, calls // 10), calls / 3600)
+    
+    async def acquire(self, tokens: float = 1.0) -> bool:
+        """Забрать токены из общей корзины, если они есть."""
+        if self.db is not None:
+            try:
+                return await self.db.take_rate_limit_tokens(self.key, self.capacity, self.rate, tokens, time.time())
+            except Exception as e:
+                logger.error(f"Ошибка общего ограничителя {self.key}: {e}")
+        return self.try_acquire(tokens)
+    
+    async def wait_time(self, tokens: float = 1.0) -> float:
+        """Секунд до появления нужного числа токенов в общей корзине."""
+        if self.db is not None:
+            try:
+                available = await self.db.get_rate_limit_tokens(self.key, self.capacity, self.rate, time.time())
+                return max(0.0, (tokens - available) / self.rate)
+            except Exception as e:
+                logger.error(f"Ошибка общего ограничителя {self.key}: {e}")
+        return self.retry_after(tokens)
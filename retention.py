@@ -0,0 +1,209 @@
+"""
+Многоуровневое хранение истории статусов автомобиля
+
+Уровни хранения vehicle_status:
+- сырые записи за последние raw_days дней;
+- средние (а также min/max) за medium_bucket_minutes до medium_days дней;
+- почасовые min/max/avg для более старых данных.
+
+Агрегация выполняется небольшими транзакциями (batch_buckets интервалов
+за раз) с паузой между ними, чтобы не держать блокировку записи долго
+и не мешать сборщику данных.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiosqlite
+
+from models import RetentionConfig
+
+logger = logging.getLogger(__name__)
+
+# Метрики, для которых считаются агрегаты
+ROLLUP_METRICS = ("battery_level", "fuel_level", "range_electric", "range_fuel")
+
+def _merge_average(column: str) -> str:
+    """SQL-выражение слияния взвешенного среднего при конфликте интервала."""
+    return (
+        f"{column} = CASE "
+        f"WHEN excluded.{column} IS NULL THEN {column} "
+        f"WHEN {column} IS NULL THEN excluded.{column} "
+        f"ELSE ({column} * sample_count + excluded.{column} * excluded.sample_count) "
+        f"/ (sample_count + excluded.sample_count) END"
+    )
+
+def _upsert_clause() -> str:
+    """ON CONFLICT для vehicle_status_rollup: объединить с уже сохраненным интервалом."""
+    assignments = []
+    for metric in ROLLUP_METRICS:
+        assignments.append(_merge_average(f"{metric}_avg"))
+        assignments.append(f"{metric}_min = MIN(COALESCE({metric}_min, excluded.{metric}_min), "
+                           f"COALESCE(excluded.{metric}_min, {metric}_min))")
+        assignments.append(f"{metric}_max = MAX(COALESCE({metric}_max, excluded.{metric}_max), "
+                           f"COALESCE(excluded.{metric}_max, {metric}_max))")
+    # В правых частях SET везде используется прежний sample_count строки
+    assignments.append("sample_count = sample_count + excluded.sample_count")
+    return "ON CONFLICT(bucket_seconds, bucket_start) DO UPDATE SET " + ", ".join(assignments)
+
+class RetentionEngine:
+    """Движок понижения детализации и очистки истории статусов."""
+    
+    def __init__(self, connection: aiosqlite.Connection, policy: Optional[RetentionConfig] = None,
+                 before_delete: Optional[Callable[[int, int], Awaitable[None]]] = None):
+        self.connection = connection
+        self.policy = policy or RetentionConfig()
+        # Вызывается в той же транзакции перед удалением окна сырых записей
+        self.before_delete = before_delete
+    
+    @property
+    def medium_bucket(self) -> int:
+        return self.policy.medium_bucket_minutes * 60
+    
+    @property
+    def coarse_bucket(self) -> int:
+        return self.policy.coarse_bucket_minutes * 60
+    
+    async def run(self, now: Optional[int] = None) -> Dict[str, int]:
+        """Выполнить полный проход: сырые -> средние -> почасовые.
+        
+        Возвращает количество обработанных записей по уровням.
+        """
+        now = int(now if now is not None else time.time())
+        raw_cutoff = self._floor(now - self.policy.raw_days * 86400, self.medium_bucket)
+        medium_cutoff = self._floor(now - self.policy.medium_days * 86400, self.coarse_bucket)
+        
+        stats = {
+            "raw_rows_rolled_up": await self._rollup_raw(raw_cutoff),
+            "medium_rows_rolled_up": await self._rollup_medium(medium_cutoff),
+        }
+        logger.info(f"Понижение детализации истории завершено: {stats}")
+        return stats
+    
+    @staticmethod
+    def _floor(value: int, bucket: int) -> int:
+        return value - value % bucket
+    
+    async def _pause(self):
+        """Отдать управление циклу событий между транзакциями."""
+        await asyncio.sleep(self.policy.batch_pause)
+    
+    async def _rollup_raw(self, cutoff: int) -> int:
+        """Свернуть сырые записи старше cutoff в интервалы medium_bucket."""
+        bucket = self.medium_bucket
+        window = bucket * self.policy.batch_buckets
+        aggregates = ", ".join(
+            f"AVG({metric}), MIN({metric}), MAX({metric})" for metric in ROLLUP_METRICS
+        )
+        insert_sql = f"""
+            INSERT INTO vehicle_status_rollup (
+                bucket_seconds, bucket_start, sample_count, {self._rollup_columns()}
+            )
+            SELECT ?, (timestamp / ?) * ?, COUNT(*), {aggregates}
+            FROM vehicle_status
+            WHERE timestamp >= ? AND timestamp < ?
+              AND id < (SELECT MAX(id) FROM vehicle_status)
+            GROUP BY timestamp / ?
+            {_upsert_clause()}
+        """
+        processed = 0
+        while True:
+            # Самая новая запись всегда остается сырой: это текущий статус
+            cursor = await self.connection.execute("""
+                SELECT MIN(timestamp) FROM vehicle_status
+                WHERE id < (SELECT MAX(id) FROM vehicle_status)
+            """)
+            row = await cursor.fetchone()
+            if not row or row[0] is None or row[0] >= cutoff:
+                break
+            
+            window_start = self._floor(row[0], bucket)
+            window_end = min(window_start + window, cutoff)
+            
+            await self.connection.execute(insert_sql, (
+                bucket, bucket, bucket, window_start, window_end, bucket
+            ))
+            if self.before_delete:
+                await self.before_delete(window_start, window_end)
+            cursor = await self.connection.execute("""
+                DELETE FROM vehicle_status
+                WHERE timestamp >= ? AND timestamp < ?
+                  AND id < (SELECT MAX(id) FROM vehicle_status)
+            """, (window_start, window_end))
+            await self.connection.commit()
+            processed += cursor.rowcount
+            await self._pause()
+        return processed
+    
+    async def _rollup_medium(self, cutoff: int) -> int:
+        """Свернуть интервалы medium_bucket старше cutoff в почасовые."""
+        medium, coarse = self.medium_bucket, self.coarse_bucket
+        if coarse <= medium:
+            return 0
+        window = coarse * self.policy.batch_buckets
+        aggregates = []
+        for metric in ROLLUP_METRICS:
+            aggregates.append(
+                f"SUM({metric}_avg * sample_count) / "
+                f"SUM(CASE WHEN {metric}_avg IS NOT NULL THEN sample_count END)"
+            )
+            aggregates.append(f"MIN({metric}_min)")
+            aggregates.append(f"MAX({metric}_max)")
+        insert_sql = f"""
+            INSERT INTO vehicle_status_rollup (
+                bucket_seconds, bucket_start, sample_count, {self._rollup_columns()}
+            )
+            SELECT ?, (bucket_start / ?) * ?, SUM(sample_count), {", ".join(aggregates)}
+            FROM vehicle_status_rollup
+            WHERE bucket_seconds = ? AND bucket_start >= ? AND bucket_start < ?
+            GROUP BY bucket_start / ?
+            {_upsert_clause()}
+        """
+        processed = 0
+        while True:
+            cursor = await self.connection.execute("""
+                SELECT MIN(bucket_start) FROM vehicle_status_rollup
+                WHERE bucket_seconds = ?
+            """, (medium,))
+            row = await cursor.fetchone()
+            if not row or row[0] is None or row[0] >= cutoff:
+                break
+            
+            window_start = self._floor(row[0], coarse)
+            window_end = min(window_start + window, cutoff)
+            
+            await self.connection.execute(insert_sql, (
+                coarse, coarse, coarse, medium, window_start, window_end, coarse
+            ))
+            cursor = await self.connection.execute("""
+                DELETE FROM vehicle_status_rollup
+                WHERE bucket_seconds = ? AND bucket_start >= ? AND bucket_start < ?
+            """, (medium, window_start, window_end))
+            await self.connection.commit()
+            processed += cursor.rowcount
+            await self._pause()
+        return processed
+    
+    async def delete_older_than(self, table: str, cutoff: int, condition: str = "", batch_size: int = 500) -> int:
+        """Удалить записи таблицы старше cutoff порциями по batch_size."""
+        extra = f" AND {condition}" if condition else ""
+        deleted = 0
+        while True:
+            cursor = await self.connection.execute(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table} WHERE timestamp < ?{extra} LIMIT ?
+                )
+            """, (cutoff, batch_size))
+            await self.connection.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+            await self._pause()
+    
+    @staticmethod
+    def _rollup_columns() -> str:
+        return ", ".join(
+            f"{metric}_avg, {metric}_min, {metric}_max" for metric in ROLLUP_METRICS
+        )
@@ -0,0 +1,349 @@
+"""
+Планировщик фоновых задач Toyota Dashboard
+
+Все периодические задачи приложения (сбор данных автомобиля, поездки,
+цены на топливо, очистка истории, резервные копии, обслуживание базы)
+выполняются в event loop приложения: без потоков и отдельных циклов
+событий. Планировщик запускается и останавливается из lifespan.
+
+Расписание задачи задается триггером:
+- IntervalTrigger - через N секунд после предыдущего запуска;
+- CronTrigger - по выражению cron из пяти полей ("0 6 * * *");
+- DelayTrigger - задача сама сообщает, сколько ждать (резервная копия
+  по возрасту последнего файла, обслуживание по окну простоя).
+У любого триггера может быть jitter - случайный сдвиг до N секунд,
+чтобы установки не обращались к внешним сервисам в одну и ту же секунду.
+
+Гарантии:
+- задача не выполняется параллельно сама с собой: запуск, пришедшийся
+  на еще идущий (например, ручной через run_now), пропускается;
+- пропущенные запуски (сервер был выключен, система спала) выполняются
+  один раз при первой возможности, а не по разу за каждый пропуск;
+  с catch_up=False опоздавший больше misfire_grace запуск пропускается;
+- по каждой задаче ведется статистика: число запусков, ошибок,
+  таймаутов и пропусков, длительность последнего/среднего/худшего запуска.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Сон дробится на отрезки не длиннее этого: после сна системы или перевода
+# часов просроченный запуск замечается не позже чем через минуту
+MAX_SLEEP_CHUNK = 60.0
+# Насколько запуск может опоздать, чтобы не считаться пропущенным
+MISFIRE_GRACE = 60.0
+
+def _iso(moment: Optional[datetime]) -> Optional[str]:
+    return moment.isoformat(timespec="seconds") if moment else None
+
+class Trigger:
+    """Расписание: следующий запуск после момента moment."""
+    
+    def __init__(self, jitter: float = 0.0):
+        self.jitter = jitter
+    
+    def next_after(self, moment: datetime) -> datetime:
+        raise NotImplementedError
+    
+    def _with_jitter(self, moment: datetime) -> datetime:
+        if self.jitter > 0:
+            moment += timedelta(seconds=random.uniform(0, self.jitter))
+        return moment
+
+class IntervalTrigger(Trigger):
+    """Каждые seconds секунд."""
+    
+    def __init__(self, seconds: float, jitter: float = 0.0):
+        super().__init__(jitter)
+        self.seconds = max(1.0, float(seconds))
+    
+    def next_after(self, moment: datetime) -> datetime:
+        return self._with_jitter(moment + timedelta(seconds=self.seconds))
+    
+    def __repr__(self) -> str:
+        return f"every {self.seconds:g}s"
+
+class DelayTrigger(Trigger):
+    """Задержка до следующего запуска считается функцией (секунды от текущего момента)."""
+    
+    def __init__(self, delay: Callable[[], float], jitter: float = 0.0):
+        super().__init__(jitter)
+        self.delay = delay
+    
+    def next_after(self, moment: datetime) -> datetime:
+        return self._with_jitter(datetime.now() + timedelta(seconds=max(0.0, self.delay())))
+    
+    def __repr__(self) -> str:
+        return "delay"
+
+class CronTrigger(Trigger):
+    """Выражение cron: минута, час, день месяца, месяц, день недели (0 - воскресенье).
+    
+    Поддерживаются *, числа, списки (1,15), диапазоны (1-5) и шаги (*/10, 8-20/2).
+    Как в cron, если ограничены и день месяца, и день недели, достаточно
+    совпадения любого из них.
+    """
+    
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6))
+    
+    def __init__(self, expression: str, jitter: float = 0.0):
+        super().__init__(jitter)
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Выражение cron должно состоять из 5 полей: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)
+        )
+        # 7 в поле дня недели - тоже воскресенье
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+    
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values: Set[int] = set()
+        for item in field.split(","):
+            body, _, step_text = item.partition("/")
+            step = int(step_text) if step_text else 1
+            if body == "*":
+                start, end = low, high
+            elif "-" in body:
+                start, end = (int(value) for value in body.split("-", 1))
+            else:
+                start = int(body)
+                end = high if step_text else start
+            # Для дня недели допускается 7 (воскресенье)
+            if step < 1 or start < low or end > (7 if high == 6 else high) or start > end:
+                raise ValueError(f"Недопустимое поле cron: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+    
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        # isoweekday: 1 - понедельник ... 7 - воскресенье
+        weekday_ok = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+    
+    def next_after(self, moment: datetime) -> datetime:
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Не дольше нескольких лет вперед (например, 29 февраля)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return self._with_jitter(candidate)
+        raise ValueError(f"Выражение cron никогда не срабатывает: {self.expression!r}")
+    
+    def __repr__(self) -> str:
+        return f"cron {self.expression}"
+
+class Job:
+    """Задача планировщика и статистика ее запусков."""
+    
+    def __init__(self, name: str, func: Callable[[], Awaitable[Any]], trigger: Trigger,
+                 timeout: Optional[float] = None, run_at_start: bool = False,
+                 catch_up: bool = True, misfire_grace: float = MISFIRE_GRACE,
+                 retry_delay: Optional[float] = None,
+                 last_run: Optional[Callable[[], Optional[datetime]]] = None):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.timeout = timeout
+        self.run_at_start = run_at_start
+        self.catch_up = catch_up
+        self.misfire_grace = misfire_grace
+        # Через сколько повторить после ошибки (None - по расписанию)
+        self.retry_delay = retry_delay
+        # Когда задача на самом деле выполнялась в последний раз (например,
+        # время изменения файла кэша): пропуск, пока сервер был выключен
+        self.last_run = last_run
+        self.lock = asyncio.Lock()
+        self.next_run_at: Optional[datetime] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_finished_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_lateness: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.missed = 0
+    
+    @property
+    def running(self) -> bool:
+        return self.lock.locked()
+    
+    def first_run(self, now: datetime) -> datetime:
+        if self.run_at_start:
+            return now
+        if self.last_run:
+            try:
+                previous = self.last_run()
+            except Exception as e:
+                logger.error(f"Ошибка определения последнего запуска задачи {self.name}: {e}")
+                previous = None
+            if previous:
+                # Плановый запуск уже прошел - выполнить сразу (catch_up)
+                return self.trigger.next_after(previous)
+        return self.trigger.next_after(now)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        completed = self.runs - self.failures
+        return {
+            "name": self.name,
+            "schedule": repr(self.trigger),
+            "running": self.running,
+            "next_run_at": _iso(self.next_run_at),
+            "last_started_at": _iso(self.last_started_at),
+            "last_finished_at": _iso(self.last_finished_at),
+            "last_duration": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "avg_duration": round(self.total_duration / completed, 3) if completed > 0 else None,
+            "max_duration": round(self.max_duration, 3),
+            "last_lateness": round(self.last_lateness, 1) if self.last_lateness is not None else None,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "missed": self.missed,
+        }
+
+class Scheduler:
+    """Задачи по расписанию в текущем event loop."""
+    
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+    
+    def add(self, name: str, func: Callable[[], Awaitable[Any]], trigger: Trigger, **options) -> Job:
+        """Зарегистрировать задачу (задача с тем же именем заменяется).
+        
+        options - параметры Job: timeout, run_at_start, catch_up,
+        misfire_grace, retry_delay, last_run.
+        """
+        job = Job(name, func, trigger, **options)
+        previous = self._tasks.pop(name, None)
+        if previous:
+            previous.cancel()
+        self.jobs[name] = job
+        if self.started:
+            self._tasks[name] = asyncio.create_task(self._job_loop(job))
+        return job
+    
+    def start(self):
+        for name, job in self.jobs.items():
+            if name not in self._tasks:
+                self._tasks[name] = asyncio.create_task(self._job_loop(job))
+        logger.info(f"Планировщик запущен: {', '.join(self.jobs) or 'нет задач'}")
+    
+    async def stop(self):
+        """Остановить все задачи, в том числе прервать выполняющиеся."""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def status(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in self.jobs.values()]
+    
+    async def run_now(self, name: str) -> Optional[bool]:
+        """Выполнить задачу вне расписания.
+        
+        None - задача уже выполняется (запуск пропущен), иначе признак успеха.
+        """
+        job = self.jobs.get(name)
+        if job is None:
+            raise KeyError(name)
+        if job.running:
+            job.skipped += 1
+            return None
+        return await self._execute(job)
+    
+    async def _job_loop(self, job: Job):
+        job.next_run_at = job.first_run(datetime.now())
+        while True:
+            # Сон по настенным часам, отрезками: сон системы не сдвигает расписание
+            while True:
+                remaining = (job.next_run_at - datetime.now()).total_seconds()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, MAX_SLEEP_CHUNK))
+            
+            now = datetime.now()
+            job.last_lateness = (now - job.next_run_at).total_seconds()
+            if job.running:
+                # Еще идет ручной запуск: этот не нужен
+                job.skipped += 1
+                logger.info(f"Задача {job.name} еще выполняется, запуск пропущен")
+                success = True
+            elif job.last_lateness > job.misfire_grace and not job.catch_up:
+                job.missed += 1
+                logger.warning(f"Задача {job.name} пропущена: опоздание {job.last_lateness:.0f} с")
+                success = True
+            else:
+                if job.last_lateness > job.misfire_grace:
+                    logger.info(f"Задача {job.name} выполняется с опозданием {job.last_lateness:.0f} с")
+                success = await self._execute(job)
+            
+            now = datetime.now()
+            if not success and job.retry_delay:
+                job.next_run_at = now + timedelta(seconds=job.retry_delay)
+            else:
+                job.next_run_at = job.trigger.next_after(now)
+    
+    async def _execute(self, job: Job) -> bool:
+        async with job.lock:
+            job.last_started_at = datetime.now()
+            started = time.monotonic()
+            success = False
+            try:
+                if job.timeout:
+                    await asyncio.wait_for(job.func(), timeout=job.timeout)
+                else:
+                    await job.func()
+                success = True
+                job.last_error = None
+            except asyncio.TimeoutError:
+                job.timeouts += 1
+                job.last_error = f"Превышено время выполнения ({job.timeout:g} с)"
+                logger.error(f"Задача {job.name}: {job.last_error}")
+            except Exception as e:
+                job.last_error = str(e)
+                logger.error(f"Ошибка задачи {job.name}: {e}")
+            finally:
+                duration = time.monotonic() - started
+                job.runs += 1
+                job.last_finished_at = datetime.now()
+                job.last_duration = duration
+                if success:
+                    job.total_duration += duration
+                    job.max_duration = max(job.max_duration, duration)
+                else:
+                    job.failures += 1
+            return success
+
+# Глобальный экземпляр планировщика
+scheduler = Scheduler()
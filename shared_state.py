@@ -0,0 +1,99 @@
+"""
+Состояние, общее для процессов-воркеров
+
+Снимок статуса и возможности автомобиля каждый процесс держит в памяти,
+а обновляет их обычно только процесс фоновых задач (leader.py). Чтобы
+остальные воркеры отдавали те же данные, значения публикуются в таблицу
+shared_state базы данных с номером версии. Каждый процесс раз в
+poll_interval секунд читает версии ключей и передает изменившиеся
+значения подписчикам (watch). Свои записи процесс не получает обратно.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class SharedState:
+    """Публикация значений в базу и применение чужих изменений."""
+    
+    def __init__(self, poll_interval: float = 2.0):
+        self.poll_interval = poll_interval
+        self.db = None
+        # Последняя увиденная версия каждого ключа
+        self._versions: Dict[str, int] = {}
+        self._watchers: Dict[str, List[Callable]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+    
+    def watch(self, key: str, callback: Callable[[Any, float], Any]):
+        """callback(value, updated_at) - при изменении key другим процессом (может быть async)."""
+        self._watchers.setdefault(key, []).append(callback)
+    
+    async def put(self, key: str, value: Any, updated_at: Optional[float] = None):
+        """Опубликовать значение для остальных процессов."""
+        if self.db is None:
+            return
+        try:
+            self._versions[key] = await self.db.put_shared_state(key, value, updated_at or time.time())
+        except Exception as e:
+            logger.error(f"Ошибка публикации общего состояния {key}: {e}")
+    
+    def publish(self, key: str, value: Any, updated_at: Optional[float] = None):
+        """put из синхронного кода (обработчики on_update): запись идет в фоне."""
+        if self.db is None:
+            return
+        task = asyncio.get_running_loop().create_task(self.put(key, value, updated_at))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+    
+    async def start(self, db):
+        """Применить текущие значения (новый воркер сразу отдает данные) и следить за изменениями."""
+        self.db = db
+        await self.poll()
+        self._task = asyncio.create_task(self._poll_loop())
+    
+    async def poll(self):
+        """Передать подписчикам значения, измененные другими процессами."""
+        versions = await self.db.get_shared_state_versions()
+        for key, version in versions.items():
+            if key not in self._watchers or version <= self._versions.get(key, 0):
+                continue
+            state = await self.db.get_shared_state(key)
+            if state is None:
+                continue
+            self._versions[key] = state["version"]
+            for callback in self._watchers[key]:
+                try:
+                    result = callback(state["value"], state["updated_at"])
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"Ошибка применения общего состояния {key}: {e}")
+    
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Ошибка чтения общего состояния: {e}")
+    
+    async def stop(self):
+        """Остановить опрос и дождаться незавершенных публикаций."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        self.db = None
+
+# Общее состояние процессов (подключается к базе в lifespan)
+shared_state = SharedState()
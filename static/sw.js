@@ -0,0 +1,178 @@
+/*
+ * Service worker Toyota Dashboard
+ *
+ * Списки PRECACHE_URLS и CACHE_VERSION подставляет сервер (assets.py)
+ * из манифеста статических файлов при запуске.
+ * - страницы и файлы интерфейса кэшируются при установке;
+ * - страницы и данные API отдаются из кэша сразу и обновляются в фоне
+ *   (stale-while-revalidate), ?fresh=1 всегда идет в сеть;
+ * - команды без связи ставятся в очередь (IndexedDB) и отправляются
+ *   при появлении сети, если не устарели.
+ */
+
+const CACHE_VERSION = 'dev';
+const PRECACHE_URLS = [];
+
+const SHELL_CACHE = `shell-${CACHE_VERSION}`;
+const API_CACHE = 'api-v1';
+// Ответы API, которые можно показать до ответа сервера
+const CACHED_API_PREFIXES = [
+    '/api/vehicle/status', '/api/vehicle/location', '/api/vehicle/capabilities',
+    '/api/bootstrap', '/api/stats/', '/api/statistics', '/api/fuel-prices', '/api/trips',
+];
+// Команды управления, которые ставятся в очередь без сети
+const COMMAND_PATTERN = /^\/api\/(command|vehicle\/(lock|unlock|start|stop|find|climate|windows)(\/.*)?)$/;
+// Команда, не отправленная за это время, отбрасывается (двери не должны открыться через час)
+const COMMAND_TTL_MS = 5 * 60 * 1000;
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then((cache) => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter((name) => name.startsWith('shell-') && name !== SHELL_CACHE)
+            .map((name) => caches.delete(name)));
+        await self.clients.claim();
+        await flushCommands();
+    })());
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (request.method === 'POST' && COMMAND_PATTERN.test(url.pathname)) {
+        event.respondWith(sendOrQueue(request));
+        return;
+    }
+    if (request.method !== 'GET') return;
+
+    if (url.pathname.startsWith('/static/') && PRECACHE_URLS.includes(url.pathname)) {
+        // Имя с хэшем: содержимое не меняется
+        event.respondWith(caches.match(request).then((cached) => cached || fetch(request)));
+    } else if (request.mode === 'navigate' || PRECACHE_URLS.includes(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event, SHELL_CACHE));
+    } else if (CACHED_API_PREFIXES.some((prefix) => url.pathname.startsWith(prefix))) {
+        if (url.searchParams.get('fresh') === '1') {
+            event.respondWith(networkAndStore(request, API_CACHE));
+        } else {
+            event.respondWith(staleWhileRevalidate(event, API_CACHE));
+        }
+    }
+});
+
+self.addEventListener('sync', (event) => {
+    if (event.tag === 'commands') event.waitUntil(flushCommands());
+});
+
+self.addEventListener('message', (event) => {
+    // Страница сообщает о восстановлении связи (Background Sync есть не везде)
+    if (event.data === 'flush-commands') event.waitUntil(flushCommands());
+});
+
+async function networkAndStore(request, cacheName) {
+    const response = await fetch(request);
+    if (response.ok) {
+        const cache = await caches.open(cacheName);
+        await cache.put(stripFresh(request), response.clone());
+    }
+    return response;
+}
+
+function stripFresh(request) {
+    const url = new URL(request.url);
+    url.searchParams.delete('fresh');
+    return new Request(url.toString());
+}
+
+async function staleWhileRevalidate(event, cacheName) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(event.request);
+    const network = networkAndStore(event.request, cacheName);
+    if (cached) {
+        // Ответ уже отдан из кэша, обновление досрочно не прерывается
+        event.waitUntil(network.catch(() => null));
+        return cached;
+    }
+    return network;
+}
+
+// --- Очередь команд ---
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open('toyota-commands', 1);
+        open.onupgradeneeded = () => open.result.createObjectStore('commands', { keyPath: 'id', autoIncrement: true });
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+async function queueOperation(mode, operation) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const transaction = db.transaction('commands', mode);
+        const result = operation(transaction.objectStore('commands'));
+        transaction.oncomplete = () => resolve(result.result);
+        transaction.onerror = () => reject(transaction.error);
+    });
+}
+
+async function sendOrQueue(request) {
+    const body = await request.clone().text();
+    try {
+        return await fetch(request);
+    } catch (error) {
+        await queueOperation('readwrite', (store) => store.add({
+            url: request.url,
+            body,
+            contentType: request.headers.get('Content-Type'),
+            queuedAt: Date.now(),
+        }));
+        if (self.registration.sync) {
+            self.registration.sync.register('commands').catch(() => null);
+        }
+        return new Response(JSON.stringify({
+            success: false,
+            queued: true,
+            status: 'queued',
+            message: 'Нет связи: команда будет отправлена при появлении сети',
+        }), { status: 202, headers: { 'Content-Type': 'application/json' } });
+    }
+}
+
+let flushing = null;
+
+function flushCommands() {
+    // Одна отправка очереди за раз, иначе команда может уйти дважды
+    if (!flushing) {
+        flushing = sendQueuedCommands().finally(() => { flushing = null; });
+    }
+    return flushing;
+}
+
+async function sendQueuedCommands() {
+    const commands = await queueOperation('readonly', (store) => store.getAll());
+    for (const command of commands) {
+        if (Date.now() - command.queuedAt > COMMAND_TTL_MS) {
+            await queueOperation('readwrite', (store) => store.delete(command.id));
+            continue;
+        }
+        try {
+            const headers = command.contentType ? { 'Content-Type': command.contentType } : {};
+            await fetch(command.url, { method: 'POST', body: command.body || undefined, headers });
+        } catch (error) {
+            // Сети все еще нет: остальные команды - в следующий раз, по порядку
+            return;
+        }
+        await queueOperation('readwrite', (store) => store.delete(command.id));
+    }
+}
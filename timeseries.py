@@ -0,0 +1,241 @@
+"""
+Временные ряды для графиков истории
+
+Прореживание рядов алгоритмом Largest-Triangle-Three-Buckets (LTTB)
+с корзинами равной длительности: точки читаются из базы порциями
+и обрабатываются за один проход, в памяти держатся только две
+соседние корзины. Если установлен NumPy, точки каждой порции
+обрабатываются векторно с теми же корзинами (NumPy загружается при
+первом прореживании, а не при запуске сервера). Результаты кэшируются по выровненным границам корзин,
+короткие недавние диапазоны читаются из буфера снимков в памяти.
+"""
+
+import importlib.util
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Наличие NumPy без его импорта
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+from vehicle_state import vehicle_state
+
+logger = logging.getLogger(__name__)
+
+Point = Tuple[float, float]
+
+# Ограничения на число точек в ответе
+MIN_POINTS = 3
+MAX_POINTS = 5000
+
+def _triangle_area(a: Point, b: Point, c: Point) -> float:
+    return abs((a[0] - c[0]) * (b[1] - a[1]) - (a[0] - b[0]) * (c[1] - a[1]))
+
+def _average(points: Sequence[Point]) -> Point:
+    count = len(points)
+    return (sum(p[0] for p in points) / count, sum(p[1] for p in points) / count)
+
+class StreamingLTTB:
+    """Потоковый LTTB: точки подаются по возрастанию времени через add()."""
+    
+    def __init__(self, start: float, end: float, threshold: int):
+        self.start = start
+        self.width = max((end - start) / max(threshold - 2, 1), 1e-9)
+        self.selected: List[Point] = []
+        self._pending: List[Point] = []  # корзина, ожидающая выбора точки
+        self._current: List[Point] = []  # корзина, в которую идут новые точки
+        self._current_index = -1
+        self._last: Optional[Point] = None
+    
+    def add(self, point: Point):
+        if not self.selected:
+            # Первая точка всегда сохраняется
+            self.selected.append(point)
+            self._last = point
+            return
+        
+        index = int((point[0] - self.start) // self.width)
+        if index != self._current_index and self._current:
+            self._finalize(_average(self._current))
+            self._pending = self._current
+            self._current = []
+        self._current_index = index
+        self._current.append(point)
+        self._last = point
+    
+    def extend(self, points: Sequence[Point]):
+        for point in points:
+            self.add(point)
+    
+    def result(self) -> List[Point]:
+        """Завершить обработку и вернуть выбранные точки."""
+        if self._current:
+            self._finalize(_average(self._current))
+            self._pending, self._current = self._current, []
+            # Для последней корзины опорная точка - последняя точка ряда
+            self._finalize(self._last)
+        if self._last is not None and self.selected[-1] != self._last:
+            self.selected.append(self._last)
+        return self.selected
+    
+    def _finalize(self, next_point: Point):
+        """Выбрать из отложенной корзины точку с наибольшим треугольником."""
+        if not self._pending:
+            return
+        previous = self.selected[-1]
+        best = max(self._pending, key=lambda p: _triangle_area(previous, p, next_point))
+        self.selected.append(best)
+        self._pending = []
+
+class StreamingLTTBArray:
+    """StreamingLTTB на массивах NumPy: точки подаются порциями через extend().
+    
+    Корзины и выбор точек те же, что у StreamingLTTB. Между порциями
+    переносятся только незавершенная корзина (ее точки могут прийти со
+    следующей порцией) и корзина, ожидающая выбора точки.
+    """
+    
+    def __init__(self, start: float, end: float, threshold: int):
+        self.start = start
+        self.width = max((end - start) / max(threshold - 2, 1), 1e-9)
+        self.selected: List[Point] = []
+        self._pending: Optional[Tuple["np.ndarray", "np.ndarray"]] = None
+        self._current: Optional[Tuple["np.ndarray", "np.ndarray"]] = None
+        self._last: Optional[Point] = None
+    
+    def extend(self, points: Sequence[Point]):
+        import numpy as np
+        
+        if not points:
+            return
+        array = np.asarray(points, dtype=np.float64)
+        x, y = array[:, 0], array[:, 1]
+        if not self.selected:
+            # Первая точка всегда сохраняется
+            self.selected.append((float(x[0]), float(y[0])))
+            x, y = x[1:], y[1:]
+        if len(x) == 0:
+            self._last = self.selected[-1]
+            return
+        self._last = (float(x[-1]), float(y[-1]))
+        if self._current is not None:
+            x = np.concatenate((self._current[0], x))
+            y = np.concatenate((self._current[1], y))
+        
+        buckets = ((x - self.start) // self.width).astype(np.int64)
+        # Границы корзин (ряд отсортирован по времени); последняя корзина
+        # порции может продолжиться в следующей и остается незавершенной
+        boundaries = np.flatnonzero(np.diff(buckets)) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(x)]))
+        for i in range(len(starts) - 1):
+            bucket = (x[starts[i]:stops[i]], y[starts[i]:stops[i]])
+            self._finalize((float(bucket[0].mean()), float(bucket[1].mean())))
+            self._pending = bucket
+        self._current = (x[starts[-1]:], y[starts[-1]:])
+    
+    def result(self) -> List[Point]:
+        """Завершить обработку и вернуть выбранные точки."""
+        if self._current is not None:
+            self._finalize((float(self._current[0].mean()), float(self._current[1].mean())))
+            self._pending, self._current = self._current, None
+            # Для последней корзины опорная точка - последняя точка ряда
+            self._finalize(self._last)
+        if self._last is not None and self.selected[-1] != self._last:
+            self.selected.append(self._last)
+        return self.selected
+    
+    def _finalize(self, next_point: Point):
+        """Выбрать из отложенной корзины точку с наибольшим треугольником."""
+        import numpy as np
+        
+        if self._pending is None:
+            return
+        (previous_x, previous_y), (next_x, next_y) = self.selected[-1], next_point
+        bx, by = self._pending
+        areas = np.abs((previous_x - next_x) * (by - previous_y) - (previous_x - bx) * (next_y - previous_y))
+        best = int(np.argmax(areas))
+        self.selected.append((float(bx[best]), float(by[best])))
+        self._pending = None
+
+async def downsample_stream(batches: AsyncIterator[List[Point]], start: float, end: float,
+                            threshold: int) -> List[Point]:
+    """Прорядить ряд, читая его порциями из асинхронного итератора."""
+    sampler = StreamingLTTBArray(start, end, threshold) if HAS_NUMPY else StreamingLTTB(start, end, threshold)
+    buffered: Optional[List[Point]] = []
+    async for batch in batches:
+        if buffered is not None:
+            buffered.extend(batch)
+            if len(buffered) <= threshold:
+                continue
+            batch, buffered = buffered, None
+        sampler.extend(batch)
+    # Короткие ряды возвращаются без прореживания
+    return buffered if buffered is not None else sampler.result()
+
+class SeriesCache:
+    """LRU-кэш прореженных рядов по выровненным границам корзин."""
+    
+    def __init__(self, max_entries: int = 64, recent_ttl: int = 60, history_ttl: int = 3600):
+        self.max_entries = max_entries
+        self.recent_ttl = recent_ttl  # ряды, захватывающие текущий момент
+        self.history_ttl = history_ttl  # прошлое меняется только при понижении детализации
+        self._entries: "OrderedDict[tuple, Tuple[float, List[Point]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def align(start: int, end: int, points: int) -> Tuple[int, int]:
+        """Выровнять границы по длительности корзины (не меньше минуты).
+        
+        Запросы с немного сдвинутым диапазоном (например, "последние 7 дней",
+        повторенные через минуту) попадают в одну запись кэша.
+        """
+        step = max(60, ((end - start) // points) // 60 * 60)
+        return start - start % step, end + (-end) % step
+    
+    def get(self, key: tuple) -> Optional[List[Point]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, key: tuple, points: List[Point], recent: bool):
+        ttl = self.recent_ttl if recent else self.history_ttl
+        self._entries[key] = (time.monotonic() + ttl, points)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        self._entries.clear()
+
+async def load_series(db, metric: str, start: int, end: int, points: int) -> Dict:
+    """Прореженный ряд метрики за [start, end) в секундах эпохи."""
+    points = max(MIN_POINTS, min(points, MAX_POINTS))
+    start, end = SeriesCache.align(start, end, points)
+    key = (metric, start, end, points)
+    
+    series = series_cache.get(key)
+    if series is None:
+        # Недавний диапазон целиком есть в буфере снимков - без обращения к базе
+        source = vehicle_state if vehicle_state.covers(start) else db
+        series = await downsample_stream(source.iter_metric_points(metric, start, end), start, end, points)
+        series_cache.put(key, series, recent=end > time.time() - series_cache.recent_ttl)
+    
+    return {
+        "metric": metric,
+        "t": [int(t) for t, _ in series],
+        "v": [round(v, 2) for _, v in series],
+    }
+
+# Глобальный кэш рядов
+series_cache = SeriesCache()
@@ -0,0 +1,157 @@
+"""
+Последние снимки статуса автомобиля в памяти процесса
+
+Кольцевой буфер на N снимков VehicleStatus: пополняется сборщиком
+данных при каждом опросе и прогревается из базы при запуске. Последний
+статус и короткие ряды для спарклайнов читаются отсюда без обращения
+к SQLite; за пределами буфера данные берутся из базы как раньше.
+
+StatusSnapshot хранит последний ответ /api/vehicle/status и обновляет
+его по запросу не более чем одной задачей одновременно
+(stale-while-revalidate). Снимки, полученные другими воркерами,
+принимаются через apply().
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from models import VehicleStatus
+
+logger = logging.getLogger(__name__)
+
+# 24 часа при опросе раз в 5 минут
+DEFAULT_BUFFER_SIZE = 288
+
+class VehicleStateBuffer:
+    """Кольцевой буфер последних снимков статуса автомобиля."""
+    
+    def __init__(self, size: int = DEFAULT_BUFFER_SIZE):
+        self._snapshots: Deque[VehicleStatus] = deque(maxlen=size)
+    
+    @property
+    def size(self) -> int:
+        return self._snapshots.maxlen
+    
+    def resize(self, size: int):
+        """Изменить емкость буфера, сохранив самые новые снимки."""
+        if size != self._snapshots.maxlen:
+            self._snapshots = deque(self._snapshots, maxlen=max(1, size))
+    
+    def __len__(self) -> int:
+        return len(self._snapshots)
+    
+    def push(self, status: VehicleStatus):
+        """Добавить снимок (снимки приходят по возрастанию времени)."""
+        # Тот же снимок может прийти повторно от другого воркера (shared_state.py)
+        if self._snapshots and status.timestamp <= self._snapshots[-1].timestamp:
+            logger.debug(f"Пропущен повторный снимок статуса или снимок из прошлого: {status.timestamp}")
+            return
+        self._snapshots.append(status)
+    
+    async def warm(self, db) -> int:
+        """Заполнить буфер последними статусами из базы данных."""
+        rows = await db.get_recent_status_rows(self.size)
+        self._snapshots.clear()
+        for row in rows:
+            timestamp, valid_until = row.pop("timestamp"), row.pop("valid_until")
+            self._snapshots.append(VehicleStatus(timestamp=datetime.fromtimestamp(timestamp), **row))
+            if valid_until and valid_until > timestamp:
+                # Продленная запись: статус не менялся до valid_until
+                self._snapshots.append(VehicleStatus(timestamp=datetime.fromtimestamp(valid_until), **row))
+        logger.info(f"Буфер снимков статуса прогрет: {len(self._snapshots)} из {self.size}")
+        return len(self._snapshots)
+    
+    def latest(self) -> Optional[VehicleStatus]:
+        """Последний снимок или None, если буфер пуст."""
+        return self._snapshots[-1] if self._snapshots else None
+    
+    def latest_dict(self) -> Optional[Dict]:
+        """Последний снимок в формате DatabaseManager.get_latest_status (без id и raw_data)."""
+        status = self.latest()
+        if status is None:
+            return None
+        data = status.model_dump(exclude={"raw_data"})
+        # Как _epoch_to_iso в database.py: локальное время со смещением
+        data["timestamp"] = status.timestamp.astimezone().isoformat(timespec="seconds")
+        return data
+    
+    def covers(self, start: int) -> bool:
+        """Буфер содержит все снимки начиная с start (секунды эпохи)."""
+        return bool(self._snapshots) and start >= self._snapshots[0].timestamp.timestamp()
+    
+    def metric_points(self, metric: str, start: int, end: int) -> List[tuple]:
+        """Точки (время, значение) метрики за [start, end) по возрастанию времени."""
+        points = []
+        for status in self._snapshots:
+            moment = status.timestamp.timestamp()
+            value = getattr(status, metric)
+            if start <= moment < end and value is not None:
+                points.append((int(moment), value))
+        return points
+    
+    async def iter_metric_points(self, metric: str, start: int, end: int,
+                                 batch_size: int = 2000) -> AsyncIterator[List[tuple]]:
+        """Та же выдача, что у DatabaseManager.iter_metric_points, но из памяти."""
+        points = self.metric_points(metric, start, end)
+        for offset in range(0, len(points), batch_size):
+            yield points[offset:offset + batch_size]
+
+class StatusSnapshot:
+    """Последний полный статус автомобиля с однократным фоновым обновлением."""
+    
+    def __init__(self):
+        self.data: Optional[Dict] = None
+        self.updated_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Вызывается с новыми данными после каждого обновления (push-события)
+        self.on_update: Optional[Callable[[Dict], None]] = None
+        # Вызывается с данными и временем, полученными этим процессом
+        # (публикация для остальных воркеров, shared_state.py)
+        self.on_store: Optional[Callable[[Dict, float], None]] = None
+    
+    def set(self, data: Dict, updated_at: Optional[float] = None):
+        self.apply(data, updated_at)
+        if self.on_store:
+            self.on_store(data, self.updated_at)
+    
+    def apply(self, data: Dict, updated_at: Optional[float] = None):
+        """Принять снимок без публикации (в том числе полученный от другого воркера)."""
+        self.data = data
+        self.updated_at = updated_at or time.time()
+        self.last_error = None
+        if self.on_update:
+            self.on_update(data)
+    
+    def age(self) -> Optional[float]:
+        """Возраст снимка в секундах (None - снимка еще нет)."""
+        return None if self.updated_at is None else max(0.0, time.time() - self.updated_at)
+    
+    @property
+    def refreshing(self) -> bool:
+        return self._refresh_task is not None and not self._refresh_task.done()
+    
+    def refresh(self, loader: Callable[[], Awaitable[Dict]]) -> asyncio.Task:
+        """Запустить обновление снимка; если оно уже идет - вернуть текущую задачу."""
+        if not self.refreshing:
+            self._refresh_task = asyncio.create_task(self._run_refresh(loader))
+        return self._refresh_task
+    
+    async def _run_refresh(self, loader: Callable[[], Awaitable[Dict]]) -> Optional[Dict]:
+        try:
+            self.set(await loader())
+            return self.data
+        except Exception as e:
+            # Ошибка не теряет прежний снимок, клиенты продолжают его получать
+            self.last_error = str(getattr(e, "detail", None) or e)
+            logger.error(f"Ошибка обновления снимка статуса: {self.last_error}")
+            return None
+
+# Глобальный буфер снимков
+vehicle_state = VehicleStateBuffer()
+# Последний ответ /api/vehicle/status
+status_snapshot = StatusSnapshot()